@@ -3,29 +3,73 @@
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, LongTable, TableStyle, Image, PageBreak, Flowable
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
 from datetime import datetime
+from PIL import Image as PILImage
+import numpy as np
+import io
 import os
+import zlib
+from profiling import span
+
+# svglib is optional: without it, SVG charts cannot be embedded as vector graphics
+try:
+    from svglib.svglib import svg2rlg
+except ImportError:
+    svg2rlg = None
+
+# Charts in report order (chart name, section title). The chart name matches
+# PortfolioVisualization's chart keys and, plus the extension, the file name on disk.
+REPORT_CHARTS = [
+    ('portfolio_value', 'Portfolio Value Over Time'),
+    ('drawdown', 'Portfolio Drawdown'),
+    ('allocation', 'Portfolio Allocation'),
+    ('individual_performance', 'Individual Holdings Performance'),
+    ('risk_return', 'Risk-Return Profile'),
+    ('returns_distribution', 'Returns Distribution'),
+    ('rolling_returns', 'Rolling Returns')
+]
 
 class ReportGenerator:
     """Generate PDF reports for portfolio analysis"""
+
+    _shared_styles = None # Style sheet built once per process, shared by all instances
     
-    def __init__(self, output_dir='output/reports'):
+    def __init__(self, output_dir='output/reports', target_dpi=None, jpeg_quality=85, min_psnr=35.0,
+                 holdings_top_n=None, holdings_chunk_rows=35):
         """
         Args:
             output_dir (str): Directory to save reports
+            target_dpi (int): Resample raster charts to their on-page size at this DPI
+                before embedding (default: embed the images as they are)
+            jpeg_quality (int): JPEG quality for charts compressed as JPEG
+            min_psnr (float): Quality bound in dB; a compressed chart below it is
+                re-encoded as lossless PNG
+            holdings_top_n (int): List only the largest N holdings and roll the rest
+                up into an 'Others' row (default: list every holding)
+            holdings_chunk_rows (int): Holdings rows per table chunk (about one page)
         """
         # Get the directory where this file is located
         script_dir = os.path.dirname(os.path.abspath(__file__))
         # Create output path relative to the script directory
         self.output_dir = os.path.join(script_dir, output_dir)
         os.makedirs(self.output_dir, exist_ok=True)
-        
-        # Set up styles
-        self.styles = getSampleStyleSheet()
-        self._setup_custom_styles()
+
+        self.target_dpi = target_dpi
+        self.jpeg_quality = jpeg_quality
+        self.min_psnr = min_psnr
+        self.image_stats = {} # Resampling results per chart
+        self.holdings_top_n = holdings_top_n
+        self.holdings_chunk_rows = holdings_chunk_rows
+        
+        # Set up styles (only the first instance in a process builds them)
+        if ReportGenerator._shared_styles is None:
+            self.styles = getSampleStyleSheet()
+            self._setup_custom_styles()
+            ReportGenerator._shared_styles = self.styles
+        self.styles = ReportGenerator._shared_styles
     
     def _setup_custom_styles(self):
         """Set up custom paragraph styles"""
@@ -114,7 +158,23 @@ class ReportGenerator:
             ['Annualized Return', self._format_percentage(metrics['annualized_return'])],
             ['', ''],
             ['Time Period', f"{metrics['days']} days ({metrics['years']:.2f} years)"],
+            ['Valuation', analyzer.return_basis()],
         ]
+        if analyzer.base_currency is not None:
+            data.append(['Currency', analyzer.base_currency])
+        if metrics.get('time_weighted_return') is not None:
+            data += [
+                ['', ''],
+                ['Time-Weighted Return', self._format_percentage(metrics['time_weighted_return'])],
+                ['Annualized TWR', self._format_percentage(metrics['annualized_twr'])],
+                ['Money-Weighted Return (IRR)', self._format_percentage(metrics['money_weighted_return'])],
+            ]
+        if 'realized_gain' in metrics:
+            data += [
+                ['', ''],
+                [f"Realized Gain ({analyzer.tax_lots.method})", self._format_currency(metrics['realized_gain'])],
+                ['Unrealized Gain', self._format_currency(metrics['unrealized_gain'])],
+            ]
         
         table = Table(data, colWidths=[3*inch, 2*inch])
         table.setStyle(TableStyle([
@@ -173,38 +233,91 @@ class ReportGenerator:
         
         return elements
     
+    def _holdings_rows(self, top_holdings, others, lot_gains=False):
+        """Yield one table row per holding, plus the 'others' roll-up"""
+        for ticker, perf in top_holdings:
+            if lot_gains:
+                yield [
+                    ticker,
+                    f"{perf['shares']:,.2f}",
+                    f"${perf['purchase_price']:.2f}",
+                    f"${perf['current_price']:.2f}",
+                    f"${perf['current_value']:,.2f}",
+                    self._format_currency(perf.get('unrealized_gain', perf['gain_loss'])),
+                    self._format_currency(perf.get('realized_gain', 0.0)),
+                    self._format_percentage(perf['weight'])
+                ]
+            else:
+                yield [
+                    ticker,
+                    f"{perf['shares']:.0f}",
+                    f"${perf['purchase_price']:.2f}",
+                    f"${perf['current_price']:.2f}",
+                    f"${perf['current_value']:.2f}",
+                    self._format_percentage(perf['total_return']),
+                    self._format_percentage(perf['weight'])
+                ]
+
+        if others is not None:
+            if lot_gains:
+                yield [
+                    f"Others ({others['count']:,})",
+                    '',
+                    '',
+                    '',
+                    f"${others['current_value']:,.2f}",
+                    self._format_currency(others.get('unrealized_gain', others['gain_loss'])),
+                    self._format_currency(others.get('realized_gain', 0.0)),
+                    self._format_percentage(others['weight'])
+                ]
+            else:
+                yield [
+                    f"Others ({others['count']:,})",
+                    '',
+                    '',
+                    '',
+                    f"${others['current_value']:.2f}",
+                    self._format_percentage(others['total_return']),
+                    self._format_percentage(others['weight'])
+                ]
+
     def _create_holdings_section(self, analyzer):
-        """Create individual holdings section"""
+        """
+        Create individual holdings section
+
+        Rows are generated lazily and laid out as a series of LongTables of
+        holdings_chunk_rows rows each, every one repeating the header. Each
+        chunk has fixed column widths and row heights, so reportlab never
+        re-measures or re-splits a huge table and the build stays linear in
+        the number of holdings.
+
+        For an analyzer built from a transaction ledger the table shows the
+        average cost of the open lots and each holding's unrealized and
+        realized gains instead of the total return.
+        """
         elements = []
         
         # Section header
         header = Paragraph("Individual Holdings Performance", self.styles['SectionHeader'])
         elements.append(header)
         
-        holdings_perf = analyzer.calculate_each_holding_performance()
+        top_holdings, others = analyzer.get_top_holdings(top_n=self.holdings_top_n)
         
         # Create holdings table
-        data = [['Ticker', 'Shares', 'Purchase Price', 'Current Price', 
-                'Current Value', 'Total Return', 'Weight']]
-        
-        for ticker, perf in sorted(holdings_perf.items(), 
-                                   key=lambda x: x[1]['current_value'], 
-                                   reverse=True):
-            data.append([
-                ticker,
-                f"{perf['shares']:.0f}",
-                f"${perf['purchase_price']:.2f}",
-                f"${perf['current_price']:.2f}",
-                f"${perf['current_value']:.2f}",
-                self._format_percentage(perf['total_return']),
-                self._format_percentage(perf['weight'])
-            ])
-        
-        table = Table(data, colWidths=[0.8*inch, 0.7*inch, 1.1*inch, 1.1*inch, 
-                                       1.2*inch, 1*inch, 0.8*inch])
+        lot_gains = getattr(analyzer, 'tax_lots', None) is not None
+        if lot_gains:
+            header_row = ['Ticker', 'Shares', 'Avg Cost', 'Current Price', 'Current Value',
+                          'Unrealized', 'Realized', 'Weight']
+            col_widths = [0.7*inch, 0.8*inch, 0.8*inch, 0.9*inch,
+                          1.1*inch, 1*inch, 0.9*inch, 0.6*inch]
+        else:
+            header_row = ['Ticker', 'Shares', 'Purchase Price', 'Current Price', 
+                          'Current Value', 'Total Return', 'Weight']
+            col_widths = [0.8*inch, 0.7*inch, 1.1*inch, 1.1*inch, 
+                          1.2*inch, 1*inch, 0.8*inch]
         
         # Style the table
-        table.setStyle(TableStyle([
+        table_style = TableStyle([
             # Header row
             ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2E86AB')),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
@@ -223,44 +336,216 @@ class ReportGenerator:
             
             # Alternating row colors
             ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F0F0F0')]),
-        ]))
-        
-        elements.append(table)
+        ])
+
+        chunk = [header_row]
+        for row in self._holdings_rows(top_holdings, others, lot_gains):
+            chunk.append(row)
+            if len(chunk) > self.holdings_chunk_rows:
+                elements.append(self._holdings_table(chunk, col_widths, table_style))
+                chunk = [header_row]
+        if len(chunk) > 1:
+            elements.append(self._holdings_table(chunk, col_widths, table_style))
+
         elements.append(Spacer(1, 20))
         
         return elements
+
+    def _holdings_table(self, data, col_widths, table_style):
+        """Build one fixed-geometry chunk of the holdings table"""
+        table = LongTable(data, colWidths=col_widths, rowHeights=[18] * len(data), repeatRows=1)
+        table.setStyle(table_style)
+        return table
     
-    def _add_chart(self, elements, chart_path, title, width=6*inch):
-        """Add a chart to the report"""
-        if os.path.exists(chart_path):
-            # Section header
-            header = Paragraph(title, self.styles['SectionHeader'])
-            elements.append(header)
-            
+    def _svg_to_drawing(self, chart, width, max_height=8*inch):
+        """
+        Convert an SVG chart to a reportlab Drawing scaled to the page width
+
+        Args:
+            chart: SVG file path or file-like buffer
+            width (float): Chart width on the page
+            max_height (float): Height limit, so tall charts still fit on one page
+
+        Returns:
+            reportlab.graphics.shapes.Drawing: Vector drawing, or None if unavailable
+        """
+        if svg2rlg is None:
+            print("Warning: svglib is not installed, cannot embed SVG chart")
+            return None
+
+        drawing = svg2rlg(chart)
+        if drawing is None:
+            return None
+
+        # Keep the chart's own aspect ratio
+        scale = min(width / drawing.width, max_height / drawing.height)
+        drawing.width = drawing.width * scale
+        drawing.height = drawing.height * scale
+        drawing.scale(scale, scale)
+        return drawing
+
+    def _compute_psnr(self, reference, candidate):
+        """
+        Peak signal-to-noise ratio between two images of the same size
+
+        Args:
+            reference (PIL.Image.Image): Original image
+            candidate (PIL.Image.Image): Compressed image
+
+        Returns:
+            float: PSNR in dB (inf for identical images)
+        """
+        ref = np.asarray(reference.convert('RGB'), dtype=np.float64)
+        cand = np.asarray(candidate.convert('RGB'), dtype=np.float64)
+        mse = np.mean((ref - cand) ** 2)
+        if mse == 0:
+            return float('inf')
+        return 10 * np.log10(255.0 ** 2 / mse)
+
+    def _resample_chart(self, chart, chart_name, width, height):
+        """
+        Resample a raster chart to its on-page size and compress it
+
+        The image is scaled to exactly width x height at target_dpi, then encoded
+        both as a 256-colour PNG and as a JPEG. The encoding that takes the least
+        space in the PDF while staying within min_psnr wins. reportlab embeds
+        JPEG data as is but stores PNGs as deflated RGB, so the PNG candidate is
+        measured that way. If neither meets the bound the chart is stored as
+        lossless PNG.
+
+        Args:
+            chart: Image file path or file-like buffer
+            chart_name (str): Chart name, used for the stats
+            width (float): Width on the page in points
+            height (float): Height on the page in points
+
+        Returns:
+            io.BytesIO: Compressed image
+        """
+        with PILImage.open(chart) as source:
+            img = source.convert('RGBA')
+
+        # Flatten transparency onto white, JPEG and palette PNG have no alpha
+        background = PILImage.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+
+        size = (max(1, round(width / 72 * self.target_dpi)),
+                max(1, round(height / 72 * self.target_dpi)))
+        resampled = background.resize(size, PILImage.LANCZOS, reducing_gap=3.0)
+
+        def encode(fmt):
+            buffer = io.BytesIO()
+            if fmt == 'jpeg':
+                resampled.save(buffer, format='JPEG', quality=self.jpeg_quality, optimize=True)
+            elif fmt == 'png':
+                resampled.quantize(colors=256).save(buffer, format='PNG', optimize=True)
+            else:
+                resampled.save(buffer, format='PNG', optimize=True)
+            buffer.seek(0)
+            return buffer
+
+        best = None
+        for fmt in ('png', 'jpeg'):
+            buffer = encode(fmt)
+            with PILImage.open(buffer) as decoded:
+                psnr = self._compute_psnr(resampled, decoded)
+                if fmt == 'jpeg':
+                    embedded = buffer.getbuffer().nbytes
+                else:
+                    embedded = len(zlib.compress(decoded.convert('RGB').tobytes()))
+            buffer.seek(0)
+            if psnr >= self.min_psnr and (best is None or embedded < best[3]):
+                best = (fmt, buffer, psnr, embedded)
+
+        if best is None:
+            buffer = encode('lossless png')
+            best = ('lossless png', buffer, float('inf'), len(zlib.compress(resampled.tobytes())))
+
+        fmt, buffer, psnr, embedded = best
+        self.image_stats[chart_name] = {
+            'size': size,
+            'format': fmt,
+            'bytes': embedded,
+            'psnr': psnr
+        }
+        print(f"Resampled {chart_name}: {size[0]}x{size[1]} px, {fmt.upper()}, "
+              f"{embedded / 1024:,.0f} KB, PSNR {psnr:.1f} dB")
+        return buffer
+
+    def _add_chart(self, elements, chart, title, width=6*inch, chart_name=None):
+        """
+        Add a chart to the report
+
+        PNG charts are embedded as images, SVG charts as vector drawings. With
+        target_dpi set, images are resampled and compressed first.
+
+        Args:
+            elements (list): Flowables to append to
+            chart: Chart file path, PNG/SVG bytes or file-like buffer, or a reportlab Flowable
+            title (str): Section title
+            width (float): Chart width on the page
+            chart_name (str): Chart name, used for the resampling stats
+        """
+        if isinstance(chart, str):
+            if not os.path.exists(chart):
+                print(f"Warning: Chart not found: {chart}")
+                return
+            if chart.endswith('.svg'):
+                chart = self._svg_to_drawing(chart, width)
+        else:
+            if hasattr(chart, 'getvalue'):
+                chart = chart.getvalue()
+            if isinstance(chart, (bytes, bytearray)):
+                # Copy into a fresh buffer so the caller's chart can be embedded again later
+                if chart.lstrip()[:5] in (b'<?xml', b'<svg '):
+                    chart = self._svg_to_drawing(io.BytesIO(chart), width)
+                else:
+                    chart = io.BytesIO(chart)
+
+        if chart is None:
+            print(f"Warning: Could not embed chart: {title}")
+            return
+
+        # Section header
+        header = Paragraph(title, self.styles['SectionHeader'])
+        elements.append(header)
+
+        if isinstance(chart, Flowable):
+            elements.append(chart)
+        else:
+            if self.target_dpi is not None:
+                chart = self._resample_chart(chart, chart_name, width, width*0.5)
             # Add image
-            img = Image(chart_path, width=width, height=width*0.5)
+            img = Image(chart, width=width, height=width*0.5)
             elements.append(img)
-            elements.append(Spacer(1, 20))
-        else:
-            print(f"Warning: Chart not found: {chart_path}")
+        elements.append(Spacer(1, 20))
     
     def generate_report(self, analyzer, charts_dir=None,
-                       filename='portfolio_report.pdf'):
+                       filename='portfolio_report.pdf', charts=None):
         """
         Generate complete PDF report
 
         Args:
             analyzer (PortfolioAnalyzer): Portfolio analyzer object
             charts_dir (str): Directory containing chart images (default: output/charts relative to this script)
-            filename (str): Output filename
+            filename (str): Output filename, or a writable file-like object
+            charts (dict): Rendered charts (chart name -> PNG/SVG buffer or bytes, or Flowable),
+                e.g. from PortfolioVisualization.create_all_charts. When given, nothing
+                is read from charts_dir.
+
+        Returns:
+            str: Path of the report (or the file-like object it was written to)
         """
         # If charts_dir not specified, use default relative to this script
-        if charts_dir is None:
+        if charts is None and charts_dir is None:
             script_dir = os.path.dirname(os.path.abspath(__file__))
             charts_dir = os.path.join(script_dir, 'output/charts')
 
         # Create PDF file path
-        filepath = os.path.join(self.output_dir, filename)
+        if hasattr(filename, 'write'):
+            filepath = filename
+        else:
+            filepath = os.path.join(self.output_dir, filename)
         
         # Create document
         doc = SimpleDocTemplate(filepath, pagesize=letter,
@@ -270,17 +555,18 @@ class ReportGenerator:
         # Build content
         elements = []
         
-        # Header
-        elements.extend(self._create_header())
-        
-        # Portfolio Summary
-        elements.extend(self._create_summary_section(analyzer))
-        
-        # Risk Metrics
-        elements.extend(self._create_risk_metrics_section(analyzer))
-        
-        # Holdings
-        elements.extend(self._create_holdings_section(analyzer))
+        with span('report.tables'):
+            # Header
+            elements.extend(self._create_header())
+            
+            # Portfolio Summary
+            elements.extend(self._create_summary_section(analyzer))
+            
+            # Risk Metrics
+            elements.extend(self._create_risk_metrics_section(analyzer))
+            
+            # Holdings
+            elements.extend(self._create_holdings_section(analyzer))
         
         # Page break before charts
         elements.append(PageBreak())
@@ -290,24 +576,29 @@ class ReportGenerator:
         elements.append(chart_title)
         elements.append(Spacer(1, 20))
         
-        charts = [
-            ('portfolio_value.png', 'Portfolio Value Over Time'),
-            ('drawdown.png', 'Portfolio Drawdown'),
-            ('allocation.png', 'Portfolio Allocation'),
-            ('individual_performance.png', 'Individual Holdings Performance'),
-            ('risk_return.png', 'Risk-Return Profile'),
-            ('returns_distribution.png', 'Returns Distribution'),
-            ('rolling_returns.png', 'Rolling Returns')
-        ]
-        
-        for chart_file, chart_title in charts:
-            chart_path = os.path.join(charts_dir, chart_file)
-            if os.path.exists(chart_path):
-                self._add_chart(elements, chart_path, chart_title)
-                if chart_file != charts[-1][0]:  # Not the last chart
-                    elements.append(PageBreak())
+        # Collect the available charts in report order
+        available = []
+        for chart_name, chart_title in REPORT_CHARTS:
+            if charts is not None:
+                chart = charts.get(chart_name)
+            else:
+                chart = None
+                for ext in ('png', 'svg'):
+                    chart_path = os.path.join(charts_dir, f'{chart_name}.{ext}')
+                    if os.path.exists(chart_path):
+                        chart = chart_path
+                        break
+            if chart is not None:
+                available.append((chart_name, chart, chart_title))
+
+        for i, (chart_name, chart, chart_title) in enumerate(available):
+            with span('report.chart', chart=chart_name):
+                self._add_chart(elements, chart, chart_title, chart_name=chart_name)
+            if i < len(available) - 1:  # Not the last chart
+                elements.append(PageBreak())
         # Build PDF
-        doc.build(elements)
+        with span('report.build'):
+            doc.build(elements)
         
         print(f"PDF report generated: {filepath}")
-        return filepath
\ No newline at end of file
+        return filepath
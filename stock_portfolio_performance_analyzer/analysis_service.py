@@ -0,0 +1,405 @@
+import argparse
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import pandas as pd
+
+from batch_report import CHART_PROFILES, _init_worker, _build_report
+from batch_analysis import _json_safe
+
+
+class ServiceError(Exception):
+    """Request error with the HTTP status to answer with"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_portfolio(payload):
+    """
+    Validate a portfolio sent as JSON
+
+    Accepts the dictionary format PortfolioAnalyzer uses, or a list of rows
+    with the CSV columns (ticker, shares, purchase_price, purchase_date).
+
+    Args:
+        payload (dict or list): Portfolio from the request body
+
+    Returns:
+        dict: Portfolio dictionary
+    """
+    if isinstance(payload, list):
+        rows = payload
+    elif isinstance(payload, dict):
+        rows = [dict(holding, ticker = ticker) for ticker, holding in payload.items()
+                if isinstance(holding, dict)]
+        if len(rows) != len(payload):
+            raise ServiceError(400, "each holding must be an object")
+    else:
+        raise ServiceError(400, "'portfolio' must be an object or a list of holdings")
+
+    if not rows:
+        raise ServiceError(400, "portfolio has no holdings")
+
+    portfolio = {}
+    for i, row in enumerate(rows):
+        try:
+            ticker = str(row['ticker']).strip().upper()
+            shares = float(row['shares'])
+            purchase_price = float(row['purchase_price'])
+            purchase_date = pd.Timestamp(row['purchase_date']).strftime('%Y-%m-%d')
+        except (KeyError, TypeError, ValueError) as e:
+            raise ServiceError(400, f"holding {i + 1}: needs ticker, shares, purchase_price "
+                                    f"and purchase_date ({e})")
+        if not ticker or shares <= 0 or purchase_price <= 0:
+            raise ServiceError(400, f"holding {i + 1}: ticker, shares and purchase_price must be set and positive")
+        portfolio[ticker] = {'shares': shares, 'purchase_price': purchase_price,
+                             'purchase_date': purchase_date}
+    return portfolio
+
+
+class AnalysisService:
+    """
+    Long-running analysis service that keeps prices and results warm
+
+    One DataFetcher is shared by every request, so each ticker's history is
+    downloaded once per process instead of once per run. Its info, and with it
+    the current price, is fetched again after max_age like the analyses, and
+    the least recently used histories are dropped beyond max_histories.
+    Analyses run in a thread pool and are cached by portfolio content;
+    concurrent requests for the same portfolio wait on the same computation.
+    PDF reports are built in a process pool whose workers keep their report
+    styles between requests.
+    """
+
+    def __init__(self, benchmark = '^GSPC', max_workers = 4, report_workers = 2,
+                 max_cached = 256, max_age = 900, max_histories = 2048, output_dir = 'output/reports',
+                 chart_profile = 'compact', fetcher = None):
+        """
+        Args:
+            benchmark (str): Default benchmark ticker symbol
+            max_workers (int): Analysis threads
+            report_workers (int): Report processes (started on the first report request)
+            max_cached (int): Analyses kept in memory (least recently used are dropped)
+            max_age (float): Seconds before a cached analysis is recomputed with fresh prices
+            max_histories (int): Price histories kept by the default fetcher
+            output_dir (str): Directory to save reports
+            chart_profile (str): Chart rendering for reports, a key of CHART_PROFILES
+            fetcher (DataFetcher): Shared fetcher (default: a new one whose info expires
+                after max_age, keeping max_histories histories)
+        """
+        from data_fetcher import DataFetcher
+
+        if chart_profile not in CHART_PROFILES:
+            raise ValueError(f"Unsupported chart profile: {chart_profile}")
+
+        self.benchmark = benchmark
+        self.max_cached = max_cached
+        self.max_age = max_age
+        self.report_workers = report_workers
+        self.fetcher = fetcher if fetcher is not None else DataFetcher(info_ttl = max_age,
+                                                                      max_histories = max_histories)
+
+        profile = dict(CHART_PROFILES[chart_profile])
+        self.chart_format = profile.pop('chart_format')
+        self.report_options = dict(profile, output_dir = output_dir)
+
+        self.executor = ThreadPoolExecutor(max_workers = max_workers)
+        self.report_executor = None
+        self.analyses = OrderedDict() # id -> {'future', 'created', 'benchmark', 'report'}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    @staticmethod
+    def portfolio_id(portfolio, benchmark):
+        """Stable id for a portfolio and benchmark, used as the cache key"""
+        text = json.dumps({'portfolio': portfolio, 'benchmark': benchmark}, sort_keys = True)
+        return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+    def _run_analysis(self, portfolio, benchmark):
+        """Fetch, value and measure one portfolio (runs in the thread pool)"""
+        from portfolio_analyzer import PortfolioAnalyzer
+
+        analyzer = PortfolioAnalyzer(portfolio, benchmark = benchmark, fetcher = self.fetcher)
+        analyzer.fetch_all_data()
+        analyzer.calculate_portfolio_value_history()
+        analyzer.calculate_metrics()
+        if not analyzer.metrics:
+            raise ServiceError(422, 'no price history for any holding')
+        return analyzer
+
+    def analyze(self, portfolio, benchmark = None):
+        """
+        Analyze a portfolio, or return the cached analysis of the same portfolio
+
+        Args:
+            portfolio (dict): Portfolio dictionary
+            benchmark (str): Benchmark ticker symbol (default: the service's)
+
+        Returns:
+            tuple: (analysis id, PortfolioAnalyzer, True if served from the cache)
+        """
+        benchmark = benchmark or self.benchmark
+        key = self.portfolio_id(portfolio, benchmark)
+
+        with self._lock:
+            entry = self.analyses.get(key)
+            if entry is not None and time.time() - entry['created'] > self.max_age:
+                entry = None
+            cached = entry is not None
+            if entry is None:
+                entry = {'future': self.executor.submit(self._run_analysis, portfolio, benchmark),
+                         'created': time.time(), 'benchmark': benchmark, 'report': None}
+                self.analyses[key] = entry
+            self.analyses.move_to_end(key)
+            while len(self.analyses) > self.max_cached:
+                self.analyses.popitem(last = False)
+
+        try:
+            return key, entry['future'].result(), cached
+        except Exception:
+            # Do not cache failures; the next request tries again
+            with self._lock:
+                if self.analyses.get(key) is entry:
+                    del self.analyses[key]
+            raise
+
+    def get_analysis(self, key):
+        """
+        Look up a finished analysis by id
+
+        Args:
+            key (str): Analysis id returned by analyze
+
+        Returns:
+            PortfolioAnalyzer: The analysis
+        """
+        with self._lock:
+            entry = self.analyses.get(key)
+            if entry is not None:
+                self.analyses.move_to_end(key)
+        if entry is None:
+            raise ServiceError(404, f"unknown analysis id: {key}")
+        return entry['future'].result()
+
+    def describe(self, key, analyzer, include_holdings = True):
+        """Build the JSON response body for an analysis"""
+        body = {'id': key, 'benchmark': analyzer.benchmark, 'holdings': len(analyzer.portfolio),
+                'metrics': analyzer.metrics}
+        if include_holdings:
+            ranked, _ = analyzer.get_top_holdings()
+            body['holdings_performance'] = [dict(perf, ticker = ticker) for ticker, perf in ranked]
+        return _json_safe(body)
+
+    def render_report(self, key):
+        """
+        Build (or reuse) the PDF report for an analysis
+
+        Args:
+            key (str): Analysis id returned by analyze
+
+        Returns:
+            dict: Report timing record with the PDF path
+        """
+        analyzer = self.get_analysis(key)
+        with self._lock:
+            entry = self.analyses[key]
+            if entry['report'] is None:
+                if self.report_executor is None:
+                    self.report_executor = ProcessPoolExecutor(max_workers = self.report_workers,
+                                                               initializer = _init_worker,
+                                                               initargs = (self.report_options,))
+                entry['report'] = self.report_executor.submit(_build_report, key, analyzer,
+                                                              f"{key}_report.pdf", self.chart_format)
+            future = entry['report']
+
+        record = future.result()
+        if record['error'] is not None:
+            with self._lock:
+                if entry['report'] is future:
+                    entry['report'] = None
+            raise ServiceError(500, f"report failed: {record['error']}")
+        return record
+
+    def status(self):
+        """Service health and cache statistics"""
+        with self._lock:
+            analyses = len(self.analyses)
+        return {
+            'status': 'ok',
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'cached_analyses': analyses,
+            'cached_histories': len(self.fetcher.cache),
+            'cached_infos': len(self.fetcher.info_cache)
+        }
+
+    def close(self):
+        """Shut down the worker pools"""
+        self.executor.shutdown(wait = False, cancel_futures = True)
+        if self.report_executor is not None:
+            self.report_executor.shutdown(wait = True)
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP/JSON front end for AnalysisService
+
+    Routes:
+        GET  /health                 Service status and cache sizes
+        POST /analyze                {"portfolio": {...} or [...], "benchmark": "^GSPC"}
+        GET  /analyses/<id>          Metrics and per-holding performance
+        GET  /analyses/<id>/metrics  Metrics only
+        POST /analyses/<id>/report   Build the PDF report, returns its path
+    """
+
+    server_version = 'PortfolioAnalyzer/1.0'
+    service = None # Set by make_server
+    quiet = False
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length == 0:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ServiceError(400, 'request body is not valid JSON')
+        if not isinstance(body, dict):
+            raise ServiceError(400, 'request body must be a JSON object')
+        return body
+
+    def _handle(self, method):
+        start = time.perf_counter()
+        parts = [p for p in urlparse(self.path).path.split('/') if p]
+        try:
+            if method == 'GET' and parts == ['health']:
+                body = self.service.status()
+
+            elif method == 'POST' and parts == ['analyze']:
+                request = self._read_json()
+                if 'portfolio' not in request:
+                    raise ServiceError(400, "missing 'portfolio'")
+                portfolio = parse_portfolio(request['portfolio'])
+                key, analyzer, cached = self.service.analyze(portfolio, request.get('benchmark'))
+                body = self.service.describe(key, analyzer, include_holdings = request.get('holdings', True))
+                body['cached'] = cached
+
+            elif method == 'GET' and len(parts) == 2 and parts[0] == 'analyses':
+                body = self.service.describe(parts[1], self.service.get_analysis(parts[1]))
+
+            elif method == 'GET' and len(parts) == 3 and parts[0] == 'analyses' and parts[2] == 'metrics':
+                analyzer = self.service.get_analysis(parts[1])
+                body = self.service.describe(parts[1], analyzer, include_holdings = False)
+
+            elif method == 'POST' and len(parts) == 3 and parts[0] == 'analyses' and parts[2] == 'report':
+                body = {'id': parts[1], **self.service.render_report(parts[1])}
+
+            else:
+                raise ServiceError(404, f"no route for {method} {self.path}")
+
+            body['seconds'] = time.perf_counter() - start
+            self._send_json(200, body)
+
+        except ServiceError as e:
+            self._send_json(e.status, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            sys.stderr.write(f"[{datetime.now():%H:%M:%S}] {self.address_string()} {format % args}\n")
+
+
+def make_server(service, host = '127.0.0.1', port = 8765, quiet = False):
+    """
+    Create the HTTP server for a service (one thread per connection)
+
+    Args:
+        service (AnalysisService): Service answering the requests
+        host (str): Interface to bind, local only by default
+        port (int): Port to listen on (0 picks a free port)
+        quiet (bool): Suppress the request log
+
+    Returns:
+        ThreadingHTTPServer: Server; call serve_forever() to run it
+    """
+    handler = type('BoundServiceRequestHandler', (ServiceRequestHandler,),
+                   {'service': service, 'quiet': quiet})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def run_service(argv = None):
+    """
+    Service command: run the local HTTP/JSON analysis service until interrupted
+
+    Args:
+        argv (list): Command line arguments after 'serve' (default: sys.argv[2:])
+
+    Returns:
+        int: Exit code
+    """
+    parser = argparse.ArgumentParser(
+        prog = 'python main.py serve',
+        description = 'Run a local HTTP/JSON portfolio analysis service with warm caches.')
+    parser.add_argument('--host', default = '127.0.0.1',
+                        help = 'interface to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type = int, default = 8765,
+                        help = 'port to listen on (default: 8765)')
+    parser.add_argument('--benchmark', default = '^GSPC',
+                        help = 'default benchmark ticker (default: ^GSPC)')
+    parser.add_argument('--workers', type = int, default = 4,
+                        help = 'analysis threads (default: 4)')
+    parser.add_argument('--report-workers', type = int, default = 2,
+                        help = 'report processes (default: 2)')
+    parser.add_argument('--chart-profile', choices = sorted(CHART_PROFILES), default = 'compact',
+                        help = 'chart rendering for PDF reports (default: compact)')
+    parser.add_argument('--max-age', type = float, default = 900,
+                        help = 'seconds before a cached analysis is refreshed (default: 900)')
+    parser.add_argument('--max-histories', type = int, default = 2048,
+                        help = 'price histories kept in memory (default: 2048)')
+    parser.add_argument('--output-dir', default = 'output/reports',
+                        help = 'report directory, relative to this program (default: output/reports)')
+    parser.add_argument('--quiet', action = 'store_true',
+                        help = 'suppress the request log')
+    args = parser.parse_args(sys.argv[2:] if argv is None else argv)
+
+    service = AnalysisService(benchmark = args.benchmark, max_workers = max(1, args.workers),
+                              report_workers = max(1, args.report_workers), max_age = args.max_age,
+                              max_histories = max(1, args.max_histories),
+                              output_dir = args.output_dir, chart_profile = args.chart_profile)
+    server = make_server(service, args.host, args.port, quiet = args.quiet)
+    host, port = server.server_address[:2]
+    print(f"Portfolio analysis service listening on http://{host}:{port} (Ctrl+C to stop)", file = sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...", file = sys.stderr)
+    finally:
+        server.server_close()
+        service.close()
+    return 0
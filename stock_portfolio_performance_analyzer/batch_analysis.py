@@ -0,0 +1,252 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from batch_report import BatchReportGenerator, CHART_PROFILES
+from profiling import Profiler, default_profile_path, span
+from useful_functions import load_portfolio_from_csv
+
+# Exit codes
+EXIT_OK = 0 # Every portfolio analyzed (and reported)
+EXIT_FAILURES = 1 # At least one portfolio failed
+EXIT_USAGE = 2 # Bad arguments or no input files (same code argparse uses)
+
+
+def find_portfolio_files(inputs):
+    """
+    Expand directories and glob patterns into a sorted list of CSV files
+
+    Args:
+        inputs (list): Directories, glob patterns or file paths
+
+    Returns:
+        list: Portfolio CSV paths, without duplicates
+    """
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.update(glob.glob(os.path.join(item, '*.csv')))
+        elif glob.has_magic(item):
+            paths.update(p for p in glob.glob(item, recursive = True) if os.path.isfile(p))
+        elif os.path.isfile(item):
+            paths.add(item)
+    return sorted(paths)
+
+
+def _report_names(paths):
+    """Name each portfolio after its file, falling back to the full path for clashes"""
+    stems = [os.path.splitext(os.path.basename(p))[0] for p in paths]
+    return [stem if stems.count(stem) == 1 else os.path.splitext(p)[0]
+            for stem, p in zip(stems, paths)]
+
+
+def _json_safe(value):
+    """Convert numpy / pandas scalars in a metrics structure to plain JSON types"""
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, datetime): # Includes pd.Timestamp
+        return value.isoformat()
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    return value
+
+
+def analyze_portfolio_files(paths, benchmark = '^GSPC', max_workers = 8, fetcher = None):
+    """
+    Analyze many portfolio files in a thread pool with one shared price cache
+
+    All files are loaded first, then every distinct ticker is fetched once over
+    the widest date range any portfolio needs. The analyses then run in
+    parallel and are served from the shared DataFetcher's cache.
+
+    Args:
+        paths (list): Portfolio CSV paths
+        benchmark (str): Benchmark ticker symbol
+        max_workers (int): Worker threads
+        fetcher (DataFetcher): Shared fetcher (default: a new one)
+
+    Returns:
+        tuple: (list of per-file result dicts, {name: PortfolioAnalyzer} for successful files)
+    """
+    # Imported here so that `batch --help` and argument errors return quickly
+    from data_fetcher import DataFetcher
+    from portfolio_analyzer import PortfolioAnalyzer
+
+    fetcher = fetcher if fetcher is not None else DataFetcher()
+    names = _report_names(paths)
+    results = [{'file': path, 'name': name, 'status': 'ok', 'error': None,
+                'holdings': 0, 'metrics': None, 'report': None, 'seconds': 0.0}
+               for path, name in zip(paths, names)]
+
+    # Load every portfolio and work out the date range needed per ticker
+    portfolios = {}
+    earliest = {}
+    for result in results:
+        portfolio = load_portfolio_from_csv(result['file'])
+        if not portfolio:
+            result['status'] = 'error'
+            result['error'] = 'could not load portfolio'
+            continue
+        portfolios[result['name']] = portfolio
+        result['holdings'] = len(portfolio)
+        for ticker, holding in portfolio.items():
+            date = str(holding['purchase_date'])
+            earliest[ticker] = min(earliest.get(ticker, date), date)
+
+    if earliest:
+        earliest[benchmark] = min(earliest.values())
+    end_date = datetime.now().strftime("%Y-%m-%d")
+
+    def warm(ticker):
+        with span('warm', ticker = ticker):
+            fetcher.fetch_stock_data(ticker, start_date = earliest[ticker], end_date = end_date)
+            if ticker != benchmark:
+                fetcher.get_stock_info(ticker)
+
+    def analyze(result):
+        start = time.perf_counter()
+        try:
+            with span('analysis', portfolio = result['name']):
+                analyzer = PortfolioAnalyzer(portfolios[result['name']], benchmark = benchmark, fetcher = fetcher)
+                with span('fetch'):
+                    analyzer.fetch_all_data()
+                with span('valuation'):
+                    analyzer.calculate_portfolio_value_history()
+                with span('metrics'):
+                    analyzer.calculate_metrics()
+            if not analyzer.metrics:
+                raise ValueError('no price history for any holding')
+            result['metrics'] = _json_safe(analyzer.metrics)
+            return analyzer
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+            return None
+        finally:
+            result['seconds'] = time.perf_counter() - start
+
+    analyzers = {}
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        # Fetch each distinct ticker once, in parallel
+        list(executor.map(warm, sorted(earliest)))
+
+        pending = [r for r in results if r['status'] == 'ok']
+        for result, analyzer in zip(pending, executor.map(analyze, pending)):
+            if analyzer is not None:
+                analyzers[result['name']] = analyzer
+
+    return results, analyzers
+
+
+def run_batch(argv = None):
+    """
+    Non-interactive batch command: analyze a directory or glob of portfolio CSVs
+
+    Progress and log output go to stderr; the machine-readable JSON summary goes
+    to stdout (or to --summary).
+
+    Args:
+        argv (list): Command line arguments after 'batch' (default: sys.argv[2:])
+
+    Returns:
+        int: Exit code (EXIT_OK, EXIT_FAILURES or EXIT_USAGE)
+    """
+    parser = argparse.ArgumentParser(
+        prog = 'python main.py batch',
+        description = 'Analyze many portfolio CSV files without prompting.')
+    parser.add_argument('inputs', nargs = '+',
+                        help = 'portfolio CSV files, directories or glob patterns')
+    parser.add_argument('--benchmark', default = '^GSPC',
+                        help = 'benchmark ticker (default: ^GSPC)')
+    parser.add_argument('--pdf', action = argparse.BooleanOptionalAction, default = False,
+                        help = 'generate a PDF report per portfolio (default: off)')
+    parser.add_argument('--chart-profile', choices = sorted(CHART_PROFILES), default = 'compact',
+                        help = 'chart rendering for PDF reports (default: compact)')
+    parser.add_argument('--workers', type = int, default = os.cpu_count() or 1,
+                        help = 'worker threads for analysis and processes for reports')
+    parser.add_argument('--output-dir', default = 'output/reports',
+                        help = 'report directory, relative to this program (default: output/reports)')
+    parser.add_argument('--summary', default = None,
+                        help = 'write the JSON summary to this file instead of stdout')
+    parser.add_argument('--quiet', action = 'store_true',
+                        help = 'suppress progress output')
+    parser.add_argument('--profile', nargs = '?', const = 'spans', choices = ['spans', 'full'], default = None,
+                        help = 'time each stage and network call (full: also cProfile and tracemalloc); '
+                               'written as JSON to output/profiles')
+    args = parser.parse_args(sys.argv[2:] if argv is None else argv)
+
+    paths = find_portfolio_files(args.inputs)
+    if not paths:
+        print(f"No portfolio CSV files found in: {' '.join(args.inputs)}", file = sys.stderr)
+        return EXIT_USAGE
+
+    start = time.perf_counter()
+    profiler = None
+    if args.profile:
+        profiler = Profiler(cprofile = args.profile == 'full', memory = args.profile == 'full').start()
+    log = open(os.devnull, 'w') if args.quiet else sys.stderr
+    try:
+        with contextlib.redirect_stdout(log):
+            results, analyzers = analyze_portfolio_files(paths, benchmark = args.benchmark,
+                                                         max_workers = max(1, args.workers))
+            report_summary = None
+            if args.pdf and analyzers:
+                batch = BatchReportGenerator(output_dir = args.output_dir, max_workers = max(1, args.workers),
+                                             **CHART_PROFILES[args.chart_profile])
+                with span('reports'):
+                    report_summary = batch.generate_reports(analyzers)
+                by_name = {r['name']: r for r in report_summary['per_report']}
+                for result in results:
+                    record = by_name.get(result['name'])
+                    if record is None:
+                        continue
+                    if record['error'] is not None:
+                        result['status'] = 'error'
+                        result['error'] = f"report failed: {record['error']}"
+                    else:
+                        result['report'] = record['path']
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        if args.quiet:
+            log.close()
+
+    profile_path = None
+    if profiler is not None:
+        profile_path = profiler.write_json(default_profile_path('batch'))
+        print(f"Profile saved to: {profile_path}", file = sys.stderr)
+
+    failed = sum(1 for r in results if r['status'] != 'ok')
+    summary = {
+        'generated': datetime.now().isoformat(timespec = 'seconds'),
+        'benchmark': args.benchmark,
+        'files': len(results),
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'seconds': time.perf_counter() - start,
+        'reports': None if report_summary is None else
+                   {k: v for k, v in report_summary.items() if k != 'per_report'},
+        'profile': profile_path,
+        'portfolios': results
+    }
+
+    text = json.dumps(_json_safe(summary), indent = 2)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    return EXIT_FAILURES if failed else EXIT_OK
@@ -0,0 +1,225 @@
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# Chart settings for batch runs: BatchReportGenerator keyword arguments per profile
+CHART_PROFILES = {
+    'full': {'chart_format': 'png'},                      # 800-dpi PNGs, as in single reports
+    'compact': {'chart_format': 'png', 'target_dpi': 150}, # PNGs resampled for the page
+    'vector': {'chart_format': 'svg'},                    # Vector charts, smallest and fastest
+    'none': {'chart_format': None}                        # Tables only, no charts
+}
+
+# Per-process report generator, created once by the pool initializer so every
+# report in a worker reuses the same precomputed style sheet
+_worker_report_gen = None
+
+
+def _init_report_generator(report_options):
+    """
+    Build this process's ReportGenerator (and its styles) once
+
+    Args:
+        report_options (dict): Keyword arguments for ReportGenerator
+    """
+    global _worker_report_gen
+    from PDF_generate_ import ReportGenerator
+    _worker_report_gen = ReportGenerator(**report_options)
+
+
+def _init_worker(report_options):
+    """
+    Process pool initializer: select a non-interactive matplotlib backend and
+    build the worker's ReportGenerator once
+
+    Only for worker processes; the serial path keeps the caller's backend.
+
+    Args:
+        report_options (dict): Keyword arguments for ReportGenerator
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    _init_report_generator(report_options)
+
+
+def _build_report(name, analyzer, filename, chart_format):
+    """
+    Render one portfolio's charts in memory and build its PDF
+
+    Args:
+        name (str): Report name
+        analyzer (PortfolioAnalyzer): Analyzed portfolio
+        filename (str): Output file name (relative to the report directory)
+        chart_format (str): 'png', 'svg' or None for no charts
+
+    Returns:
+        dict: Timing record for the report
+    """
+    from visualize_ import PortfolioVisualization
+
+    record = {'name': name, 'path': None, 'error': None,
+              'chart_seconds': 0.0, 'pdf_seconds': 0.0, 'total_seconds': 0.0}
+    start = time.perf_counter()
+    try:
+        if chart_format is not None:
+            visualizer = PortfolioVisualization(output_directory = None, batch_mode = True,
+                                                keep_in_memory = True, chart_format = chart_format)
+            charts = visualizer.create_all_charts(analyzer)
+        else:
+            charts = {}
+        charts_done = time.perf_counter()
+        record['chart_seconds'] = charts_done - start
+
+        record['path'] = _worker_report_gen.generate_report(analyzer, charts = charts, filename = filename)
+        record['pdf_seconds'] = time.perf_counter() - charts_done
+    except Exception as e:
+        record['error'] = str(e)
+    record['total_seconds'] = time.perf_counter() - start
+    return record
+
+
+class BatchReportGenerator:
+    """
+    Generate PDF reports for many analyzed portfolios in a process pool
+
+    Every worker builds one ReportGenerator (and its style sheet) up front and
+    reuses it for all its reports. Charts are rendered in memory inside the
+    worker, so nothing is shared on disk except the finished PDFs, each of
+    which gets a unique file name.
+    """
+
+    def __init__(self, output_dir = 'output/reports', max_workers = None, chart_format = 'png',
+                 **report_options):
+        """
+        Args:
+            output_dir (str): Directory to save reports
+            max_workers (int): Worker processes (default: CPU count; 1 runs in-process)
+            chart_format (str): 'png' for raster charts, 'svg' for vector charts, None for no charts
+            **report_options: Passed to ReportGenerator (target_dpi, holdings_top_n, ...)
+        """
+        self.output_dir = output_dir
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chart_format = chart_format
+        self.report_options = dict(report_options, output_dir = output_dir)
+
+        self.results = [] # Timing record per report
+
+    def _unique_filenames(self, names):
+        """
+        Turn report names into unique, filesystem-safe PDF file names
+
+        Args:
+            names (list): Report names
+
+        Returns:
+            list: File names, in the same order
+        """
+        filenames = []
+        used = set()
+        for name in names:
+            base = re.sub(r'[^A-Za-z0-9._-]+', '_', str(name)).strip('._') or 'portfolio'
+            stem = base
+            count = 1
+            while stem in used:
+                count = count + 1
+                stem = f"{base}_{count}"
+            used.add(stem)
+            filenames.append(f"{stem}_report.pdf")
+        return filenames
+
+    def generate_reports(self, analyzers, progress = None):
+        """
+        Build a PDF report for every analyzed portfolio
+
+        Args:
+            analyzers (dict or list): {name: PortfolioAnalyzer} or a list of analyzers
+            progress (callable): Called as progress(done, total, record) after each report
+                (default: print a progress line)
+
+        Returns:
+            dict: Timing summary (see summarize)
+        """
+        if isinstance(analyzers, dict):
+            jobs = list(analyzers.items())
+        else:
+            jobs = [(f"portfolio_{i + 1:05d}", analyzer) for i, analyzer in enumerate(analyzers)]
+
+        filenames = self._unique_filenames([name for name, _ in jobs])
+        total = len(jobs)
+        self.results = []
+        start = time.perf_counter()
+
+        def report_progress(record):
+            self.results.append(record)
+            done = len(self.results)
+            if progress is not None:
+                progress(done, total, record)
+            else:
+                status = 'failed: ' + record['error'] if record['error'] else f"{record['total_seconds']:.2f}s"
+                print(f"[{done}/{total}] {record['name']} {status}")
+
+        if self.max_workers == 1:
+            # In-process: charts are closed as soon as they are saved, so the caller's backend is left alone
+            _init_report_generator(self.report_options)
+            for (name, analyzer), filename in zip(jobs, filenames):
+                report_progress(_build_report(name, analyzer, filename, self.chart_format))
+        else:
+            with ProcessPoolExecutor(max_workers = self.max_workers,
+                                     initializer = _init_worker,
+                                     initargs = (self.report_options,)) as executor:
+                futures = [executor.submit(_build_report, name, analyzer, filename, self.chart_format)
+                           for (name, analyzer), filename in zip(jobs, filenames)]
+                for future in as_completed(futures):
+                    report_progress(future.result())
+
+        summary = self.summarize(time.perf_counter() - start)
+        self.print_summary(summary)
+        return summary
+
+    def summarize(self, wall_seconds):
+        """
+        Summarize the per-report timings of the last batch
+
+        Args:
+            wall_seconds (float): Elapsed time for the whole batch
+
+        Returns:
+            dict: Counts, wall time, throughput, timing percentiles and per-report records
+        """
+        succeeded = [r for r in self.results if r['error'] is None]
+        totals = np.array([r['total_seconds'] for r in succeeded]) if succeeded else np.array([0.0])
+
+        return {
+            'reports': len(self.results),
+            'succeeded': len(succeeded),
+            'failed': len(self.results) - len(succeeded),
+            'workers': self.max_workers,
+            'wall_seconds': wall_seconds,
+            'reports_per_minute': len(succeeded) / wall_seconds * 60 if wall_seconds > 0 else 0.0,
+            'mean_seconds': float(totals.mean()),
+            'p50_seconds': float(np.percentile(totals, 50)),
+            'p95_seconds': float(np.percentile(totals, 95)),
+            'max_seconds': float(totals.max()),
+            'chart_seconds': sum(r['chart_seconds'] for r in succeeded),
+            'pdf_seconds': sum(r['pdf_seconds'] for r in succeeded),
+            'per_report': sorted(self.results, key = lambda r: r['name'])
+        }
+
+    def print_summary(self, summary):
+        """Print the batch timing summary"""
+        print(f"\n{'BATCH REPORT SUMMARY':-^50}")
+        print(f"Reports:              {summary['succeeded']:>10,} ok, {summary['failed']:,} failed")
+        print(f"Workers:              {summary['workers']:>10}")
+        print(f"Wall Time:            {summary['wall_seconds']:>10.2f} s")
+        print(f"Throughput:           {summary['reports_per_minute']:>10.1f} reports/min")
+        print(f"Per Report (mean):    {summary['mean_seconds']:>10.2f} s")
+        print(f"Per Report (p95):     {summary['p95_seconds']:>10.2f} s")
+        print(f"Per Report (max):     {summary['max_seconds']:>10.2f} s")
+        print(f"Charts / PDF (CPU):   {summary['chart_seconds']:>10.2f} s / {summary['pdf_seconds']:.2f} s")
+
+        for record in summary['per_report']:
+            if record['error'] is not None:
+                print(f"  ✗ {record['name']}: {record['error']}")
@@ -0,0 +1,350 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from market_data import SyntheticMarket
+
+# Default benchmark matrix
+HOLDINGS_SIZES = [10, 100, 1000, 10000]
+HISTORY_YEARS = [1, 5]
+QUICK_HOLDINGS_SIZES = [10, 100]
+QUICK_HISTORY_YEARS = [1]
+
+STAGES = ['value_history', 'metrics', 'charts', 'pdf']
+RENDER_STAGES = ['charts', 'pdf']
+
+# Synthetic history ends on a fixed date so results do not drift with the calendar
+HISTORY_END = '2024-12-31'
+
+
+def synthetic_analyzer(n_holdings, years, seed = 0):
+    """
+    Build a PortfolioAnalyzer loaded with synthetic data, without any network access
+
+    Each holding is bought on a random day in the first half of its history.
+
+    Args:
+        n_holdings (int): Number of holdings
+        years (int): Years of price history
+        seed (int): Random seed
+
+    Returns:
+        PortfolioAnalyzer: Analyzer ready for calculate_portfolio_value_history
+    """
+    from portfolio_analyzer import PortfolioAnalyzer
+
+    market = SyntheticMarket(n_tickers = n_holdings, years = years, end = HISTORY_END, seed = seed)
+    rng = np.random.default_rng(seed + 1)
+
+    portfolio = {}
+    histories = {}
+    for ticker in market.tickers:
+        history = market.history(ticker)
+        if history.empty:
+            continue
+        start = int(rng.integers(0, len(history) // 2 + 1))
+        portfolio[ticker] = {
+            'shares': float(rng.integers(1, 100)),
+            'purchase_price': float(history['Close'].iloc[start]),
+            'purchase_date': history.index[start].strftime('%Y-%m-%d')
+        }
+        histories[ticker] = history.iloc[start:]
+
+    analyzer = PortfolioAnalyzer(portfolio)
+    for ticker, history in histories.items():
+        info = market.info(ticker)
+        analyzer.holdings_data[ticker] = history
+        analyzer.current_prices[ticker] = info['currentPrice']
+        analyzer.stock_info[ticker] = {'name': info['longName'], 'sector': info['sector'],
+                                       'industry': info['industry'], 'currency': info['currency']}
+    analyzer.benchmark_data = market.history(market.benchmark)
+    return analyzer
+
+
+def _measure(func, repeat, memory):
+    """
+    Time a callable with its output suppressed, then optionally measure its peak memory
+
+    Args:
+        func (callable): Stage to run
+        repeat (int): Timed runs
+        memory (bool): Run once more under tracemalloc for the peak allocation
+
+    Returns:
+        tuple: (last result, list of run times in seconds, peak bytes or None)
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, times, peak
+
+
+def run_case(n_holdings, years, stages = STAGES, repeat = 3, render_repeat = 1, memory = True,
+             render_max_holdings = 1000, chart_format = 'png', seed = 0):
+    """
+    Benchmark every stage for one portfolio size and history length
+
+    Args:
+        n_holdings (int): Number of holdings
+        years (int): Years of price history
+        stages (list): Stages to run, in STAGES order
+        repeat (int): Timed runs per stage (the best is reported)
+        render_repeat (int): Timed runs for the chart and PDF stages, which take seconds each
+        memory (bool): Also record each stage's peak traced memory
+        render_max_holdings (int): Skip chart and PDF stages above this size
+        chart_format (str): 'png' or 'svg' charts for the render stages
+        seed (int): Random seed for the synthetic data
+
+    Returns:
+        list: One result dict per stage
+    """
+    from visualize_ import PortfolioVisualization
+    from PDF_generate_ import ReportGenerator
+
+    analyzer = synthetic_analyzer(n_holdings, years, seed)
+    days = len(analyzer.benchmark_data)
+    charts = {}
+
+    # Metrics are memoized on the analyzer, so every timed run starts from an
+    # empty metric cache; the chart and PDF stages include the metrics they ask for
+    def calculate_metrics():
+        analyzer.invalidate()
+        return analyzer.calculate_metrics()
+
+    def render_charts():
+        analyzer.invalidate()
+        visualizer = PortfolioVisualization(output_directory = None, batch_mode = True,
+                                            keep_in_memory = True, chart_format = chart_format)
+        return visualizer.create_all_charts(analyzer)
+
+    def build_pdf():
+        analyzer.invalidate()
+        buffer = io.BytesIO()
+        ReportGenerator().generate_report(analyzer, charts = charts, filename = buffer)
+        return buffer.getbuffer().nbytes
+
+    stage_funcs = {
+        'value_history': analyzer.calculate_portfolio_value_history,
+        'metrics': calculate_metrics,
+        'charts': render_charts,
+        'pdf': build_pdf
+    }
+
+    results = []
+    for stage in [s for s in STAGES if s in stages]:
+        record = {'holdings': n_holdings, 'years': years, 'days': days, 'stage': stage,
+                  'status': 'ok', 'seconds': None, 'mean_seconds': None,
+                  'holdings_per_second': None, 'peak_memory_mb': None}
+        if stage in RENDER_STAGES and n_holdings > render_max_holdings:
+            record['status'] = 'skipped'
+            results.append(record)
+            continue
+
+        # Later stages need the earlier ones' results even when they are not benchmarked
+        if stage in ('metrics', 'charts', 'pdf') and analyzer.portfolio_history is None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                analyzer.calculate_portfolio_value_history()
+        if stage == 'pdf' and not charts:
+            with contextlib.redirect_stdout(io.StringIO()):
+                charts.update(render_charts())
+
+        runs = render_repeat if stage in RENDER_STAGES else repeat
+        result, times, peak = _measure(stage_funcs[stage], runs, memory)
+        if stage == 'charts':
+            charts.update(result)
+        if stage == 'pdf':
+            record['pdf_bytes'] = result
+
+        record['seconds'] = min(times)
+        record['mean_seconds'] = float(np.mean(times))
+        record['holdings_per_second'] = n_holdings / min(times) if min(times) > 0 else None
+        record['peak_memory_mb'] = None if peak is None else peak / 1024**2
+        results.append(record)
+    return results
+
+
+def environment():
+    """Versions and machine details recorded with every benchmark run"""
+    import matplotlib
+    import reportlab
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True,
+                                cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'matplotlib': matplotlib.__version__,
+        'reportlab': reportlab.Version
+    }
+
+
+def compare_results(results, baseline, threshold = 1.25, min_delta = 0.005):
+    """
+    Compare stage timings with an earlier benchmark run
+
+    Args:
+        results (list): Stage results of this run
+        baseline (dict): Earlier benchmark JSON (as written by run_benchmarks)
+        threshold (float): Ratio above which a stage counts as a regression
+        min_delta (float): Seconds a stage must also slow down by, so timer noise on
+            millisecond stages is not reported
+
+    Returns:
+        list: Regression messages
+    """
+    earlier = {(r['holdings'], r['years'], r['stage']): r for r in baseline['results']}
+    regressions = []
+    print(f"\n{'COMPARISON WITH ' + (baseline.get('environment', {}).get('commit') or 'baseline'):-^72}")
+    print(f"{'Holdings':>9} {'Years':>5} {'Stage':<14} {'Now (s)':>10} {'Before (s)':>11} {'Ratio':>7}")
+    for record in results:
+        before = earlier.get((record['holdings'], record['years'], record['stage']))
+        if record['seconds'] is None or before is None or not before.get('seconds'):
+            continue
+        ratio = record['seconds'] / before['seconds']
+        slower = ratio > threshold and record['seconds'] - before['seconds'] > min_delta
+        flag = '  slower' if slower else ''
+        print(f"{record['holdings']:>9,} {record['years']:>5} {record['stage']:<14} "
+              f"{record['seconds']:>10.4f} {before['seconds']:>11.4f} {ratio:>6.2f}x{flag}")
+        if slower:
+            regressions.append(f"{record['stage']} ({record['holdings']:,} holdings, {record['years']}y): "
+                               f"{before['seconds']:.4f} s -> {record['seconds']:.4f} s")
+    return regressions
+
+
+def print_results(results):
+    """Print the benchmark results as a table"""
+    print(f"\n{'BENCHMARK RESULTS':-^72}")
+    print(f"{'Holdings':>9} {'Years':>5} {'Stage':<14} {'Best (s)':>10} {'Mean (s)':>10} "
+          f"{'Holdings/s':>12} {'Peak MB':>8}")
+    for r in results:
+        if r['status'] != 'ok':
+            print(f"{r['holdings']:>9,} {r['years']:>5} {r['stage']:<14} {r['status']:>10}")
+            continue
+        peak = f"{r['peak_memory_mb']:>8.1f}" if r['peak_memory_mb'] is not None else f"{'-':>8}"
+        print(f"{r['holdings']:>9,} {r['years']:>5} {r['stage']:<14} {r['seconds']:>10.4f} "
+              f"{r['mean_seconds']:>10.4f} {r['holdings_per_second']:>12,.1f} {peak}")
+
+
+def run_benchmarks(argv = None):
+    """
+    Benchmark command: run the suite and write the results as JSON
+
+    Args:
+        argv (list): Command line arguments (default: sys.argv[1:])
+
+    Returns:
+        int: 0, or 1 when --compare finds a regression
+    """
+    parser = argparse.ArgumentParser(
+        prog = 'python benchmarks.py',
+        description = 'Offline benchmarks on deterministic synthetic portfolios.')
+    parser.add_argument('--holdings', type = int, nargs = '+', default = None,
+                        help = f"portfolio sizes (default: {' '.join(map(str, HOLDINGS_SIZES))})")
+    parser.add_argument('--years', type = int, nargs = '+', default = None,
+                        help = f"history lengths in years (default: {' '.join(map(str, HISTORY_YEARS))})")
+    parser.add_argument('--stages', nargs = '+', choices = STAGES, default = STAGES,
+                        help = 'stages to benchmark (default: all)')
+    parser.add_argument('--quick', action = 'store_true',
+                        help = 'small matrix for a fast check')
+    parser.add_argument('--repeat', type = int, default = 3,
+                        help = 'timed runs per stage, the best is reported (default: 3)')
+    parser.add_argument('--render-repeat', type = int, default = 1,
+                        help = 'timed runs for the chart and PDF stages (default: 1)')
+    parser.add_argument('--no-memory', action = 'store_true',
+                        help = 'skip the tracemalloc peak memory pass')
+    parser.add_argument('--render-max-holdings', type = int, default = 1000,
+                        help = 'skip chart and PDF stages above this many holdings (default: 1000)')
+    parser.add_argument('--chart-format', choices = ['png', 'svg'], default = None,
+                        help = 'chart format for the render stages (default: png, svg with --quick)')
+    parser.add_argument('--seed', type = int, default = 0,
+                        help = 'random seed for the synthetic data (default: 0)')
+    parser.add_argument('--output', default = None,
+                        help = 'results file (default: output/benchmarks/benchmark_<time>.json)')
+    parser.add_argument('--compare', default = None,
+                        help = 'earlier results file to compare with')
+    parser.add_argument('--threshold', type = float, default = 1.25,
+                        help = 'slowdown ratio reported as a regression by --compare (default: 1.25)')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    import matplotlib
+    matplotlib.use('Agg')
+
+    holdings_sizes = args.holdings or (QUICK_HOLDINGS_SIZES if args.quick else HOLDINGS_SIZES)
+    history_years = args.years or (QUICK_HISTORY_YEARS if args.quick else HISTORY_YEARS)
+    chart_format = args.chart_format or ('svg' if args.quick else 'png')
+
+    results = []
+    start = time.perf_counter()
+    for years in history_years:
+        for n_holdings in holdings_sizes:
+            print(f"Benchmarking {n_holdings:,} holdings x {years} year(s)...", file = sys.stderr)
+            results.extend(run_case(n_holdings, years, stages = args.stages, repeat = max(1, args.repeat),
+                                    render_repeat = max(1, args.render_repeat),
+                                    memory = not args.no_memory,
+                                    render_max_holdings = args.render_max_holdings,
+                                    chart_format = chart_format, seed = args.seed))
+
+    print_results(results)
+
+    output = {
+        'created': datetime.now().isoformat(timespec = 'seconds'),
+        'environment': environment(),
+        'settings': {'repeat': args.repeat, 'render_repeat': args.render_repeat,
+                     'memory': not args.no_memory, 'seed': args.seed,
+                     'chart_format': chart_format, 'history_end': HISTORY_END},
+        'seconds': time.perf_counter() - start,
+        'results': results
+    }
+    path = args.output
+    if path is None:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        path = os.path.join(script_dir, 'output', 'benchmarks',
+                            f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+    with open(path, 'w') as f:
+        json.dump(output, f, indent = 2)
+    print(f"\nResults saved to: {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"✗ {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_benchmarks())
@@ -1,17 +1,140 @@
 import yfinance as yf
 import pandas as pd
 from datetime import datetime, timedelta
+import threading
 import time
+from collections import OrderedDict
+from profiling import span
+from metrics_calculator import INTRADAY_MINUTES
+
+# Quote currencies Yahoo reports in minor units: currency -> (major currency, minor units per major unit)
+MINOR_CURRENCIES = {'GBp': ('GBP', 100), 'GBX': ('GBP', 100), 'ILA': ('ILS', 100), 'ZAc': ('ZAR', 100)}
+
+def to_session_dates(df, interval = '1d'):
+    """
+    Re-index a history on naive session dates
+
+    Yahoo stamps each daily bar at midnight in its exchange's time zone, so
+    US, Hong Kong and European histories come back on indexes that do not
+    align. Their local dates do: dropping the time zone once, at ingest, gives
+    every history the same canonical 'Date' index, and nothing downstream has
+    to localize or convert dates again. Intraday bars keep their local
+    exchange time of day.
+
+    Args:
+        df (pd.DataFrame): History on a DatetimeIndex (tz-aware or naive)
+        interval (str): Bar interval of the history
+
+    Returns:
+        pd.DataFrame: The same rows on a naive 'Date' index (midnight-normalized
+            for daily and longer bars)
+    """
+    if df.empty or not isinstance(df.index, pd.DatetimeIndex):
+        return df
+    index = df.index.tz_localize(None) if df.index.tz is not None else df.index
+    if interval not in INTRADAY_MINUTES:
+        index = index.normalize()
+    return df.set_axis(index.rename('Date'), axis = 0)
+
 
 class DataFetcher:
     """
     Fetch stock market data from Yahoo Finance
+
+    One instance can be shared by several threads: each ticker is fetched by
+    one thread at a time, and a cached history also serves any request for a
+    date range inside it. Histories are cached on naive session dates (see
+    to_session_dates), whatever their exchange's time zone.
+
+    By default everything is cached for the life of the fetcher, which suits
+    one run. Long-lived owners (see analysis_service) set info_ttl, so current
+    prices are fetched again once stale, and max_histories, which drops the
+    least recently used histories.
     """
 
-    def __init__(self):
-        self.cache = {} 
+    def __init__(self, info_ttl = None, max_histories = None):
+        """
+        Args:
+            info_ttl (float): Seconds before a ticker's info (and so its current
+                price) is fetched again (default: never)
+            max_histories (int): Histories kept in the cache, least recently used
+                dropped first (default: no limit)
+        """
+        self.info_ttl = info_ttl
+        self.max_histories = max_histories
+        self.cache = OrderedDict() # cache_key -> history, least recently used first
+        self.info_cache = {} # yf.Ticker.info per ticker
+        self._info_times = {} # ticker -> time.monotonic() of its info fetch
+        self._ranges = {} # (ticker, auto_adjust, interval) -> [(start_date, end_date, cache_key)]
+        self._lock = threading.Lock()
+        self._ticker_locks = {}
+
+    def __getstate__(self):
+        # Locks cannot be pickled; the cached data can (e.g. for worker processes)
+        state = self.__dict__.copy()
+        del state['_lock']
+        del state['_ticker_locks']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.cache = OrderedDict(self.cache)
+        # Monotonic times mean nothing in another process: unpickled info counts as fresh
+        self._info_times = dict.fromkeys(self.info_cache, time.monotonic())
+        self._lock = threading.Lock()
+        self._ticker_locks = {}
 
-    def fetch_stock_data(self, ticker, start_date = None, end_date = None):
+    def _ticker_lock(self, ticker):
+        """Get the lock that serializes fetches for one ticker"""
+        with self._lock:
+            if ticker not in self._ticker_locks:
+                self._ticker_locks[ticker] = threading.Lock()
+            return self._ticker_locks[ticker]
+
+    def _ticker(self, ticker):
+        """Data source object for a ticker (subclasses may serve other sources)"""
+        return yf.Ticker(ticker)
+
+    def _find_covering(self, ticker, start_date, end_date, auto_adjust = True, interval = '1d'):
+        """
+        Slice a cached history that covers the requested date range
+
+        Args:
+            ticker (str): Stock ticker symbol
+            start_date (str): Start date in "YYYY-MM-DD" format
+            end_date (str): End date in "YYYY-MM-DD" format (exclusive, like yfinance)
+            auto_adjust (bool): Which kind of history to look for (see fetch_stock_data)
+            interval (str): Bar interval to look for
+
+        Returns:
+            pd.DataFrame: The requested slice, or None if nothing cached covers it
+        """
+        with self._lock:
+            df = None
+            for cached_start, cached_end, cache_key in self._ranges.get((ticker, auto_adjust, interval), []):
+                if cached_start <= start_date and end_date <= cached_end:
+                    df = self.cache[cache_key]
+                    self.cache.move_to_end(cache_key)
+                    break
+        if df is not None:
+            mask = (df.index >= pd.Timestamp(start_date)) & (df.index < pd.Timestamp(end_date))
+            return df[mask]
+        return None
+
+    def _cache_history(self, cache_key, range_key, start_date, end_date, df):
+        """Add a history to the cache, dropping the least recently used beyond max_histories"""
+        with self._lock:
+            self.cache[cache_key] = df
+            self._ranges.setdefault(range_key, []).append((start_date, end_date, cache_key))
+            while self.max_histories is not None and len(self.cache) > self.max_histories:
+                dropped, _ = self.cache.popitem(last = False)
+                for key, ranges in list(self._ranges.items()):
+                    ranges[:] = [r for r in ranges if r[2] != dropped]
+                    if not ranges:
+                        del self._ranges[key]
+
+    def fetch_stock_data(self, ticker, start_date = None, end_date = None, auto_adjust = True, interval = '1d',
+                         cache = True):
         """
         Fetch historical stock data for a single ticker symbol.
 
@@ -19,39 +142,133 @@ class DataFetcher:
             ticker (str): Stock ticker symbol.
             start_date (str): Start date in "YYYY-MM-DD" format. 
             end_date (str): End date in "YYYY-MM-DD" format.
+            auto_adjust (bool): Yahoo's default prices, back-adjusted for dividends and
+                splits; False gives closes adjusted for splits only (the traded prices
+                up to later splits), as total-return valuation needs. Both kinds are
+                cached separately.
+            interval (str): Bar interval, e.g. '1d' or '1m' (Yahoo serves 1-minute
+                bars for the last 30 days only, at most 7 days per request)
+            cache (bool): Keep the result in the cache; streaming callers that read
+                large intraday ranges piece by piece turn this off to bound memory
 
         Returns:
             pd.DataFrame: DataFrame containing historical price data.
         """
 
         try: 
-            cache_key = f"{ticker}_{start_date}_{end_date}"
-            if cache_key in self.cache:
-                print(f"Using cached data for {ticker}")
-                return self.cache[cache_key]
-            print(f"→ Fetching data for {ticker} from Yahoo Finance...") 
-
-            # Assign ticker object
-            stock = yf.Ticker(ticker)
-
             # Set default start and end dates if not provided
             if start_date is None:
                 start_date = (datetime.now() - timedelta(days = 365)).strftime("%Y-%m-%d")
             if end_date is None:
                 end_date = datetime.now().strftime("%Y-%m-%d")
 
-            # Fetch historical data
-            df = stock.history(start = start_date, end = end_date)
-            if df.empty: 
-                print(f"No data found for {ticker}. Please check the ticker symbol.")
-                return pd.DataFrame()
-            self.cache[cache_key] = df
+            with self._ticker_lock(ticker):
+                cache_key = (f"{ticker}_{start_date}_{end_date}" + ("" if auto_adjust else "_unadjusted")
+                             + ("" if interval == '1d' else f"_{interval}"))
+                with self._lock:
+                    df = self.cache.get(cache_key)
+                    if df is not None:
+                        self.cache.move_to_end(cache_key)
+                if df is not None:
+                    print(f"Using cached data for {ticker}")
+                    return df
+
+                cached = self._find_covering(ticker, start_date, end_date, auto_adjust, interval)
+                if cached is not None:
+                    print(f"Using cached data for {ticker}")
+                    return cached
+                print(f"→ Fetching data for {ticker} from Yahoo Finance...") 
+
+                # Assign ticker object
+                stock = self._ticker(ticker)
+
+                # Fetch historical data
+                with span('network', call = 'history', ticker = ticker):
+                    df = stock.history(start = start_date, end = end_date, auto_adjust = auto_adjust,
+                                       interval = interval)
+                if df.empty: 
+                    print(f"No data found for {ticker}. Please check the ticker symbol.")
+                    return pd.DataFrame()
+                df = to_session_dates(df, interval)
+                if cache:
+                    self._cache_history(cache_key, (ticker, auto_adjust, interval), start_date, end_date, df)
 
             return df
         
         except Exception as e:
             print(f"Error fetching data for {ticker}: {str(e)}")
             return pd.DataFrame()
+
+    def prefetch(self, tickers, start_date = None, end_date = None, auto_adjust = True):
+        """
+        Warm the cache for many tickers over one date range
+
+        Later requests for any range inside [start_date, end_date) are served
+        from the cache without another download.
+
+        Args:
+            tickers (iterable): Stock ticker symbols
+            start_date (str): Start date in "YYYY-MM-DD" format
+            end_date (str): End date in "YYYY-MM-DD" format
+            auto_adjust (bool): See fetch_stock_data
+
+        Returns:
+            dict: Ticker -> historical data (empty DataFrame if unavailable)
+        """
+        return {ticker: self.fetch_stock_data(ticker, start_date, end_date, auto_adjust) for ticker in tickers}
+
+    def fetch_fx_rates(self, currencies, base_currency, start_date = None, end_date = None):
+        """
+        Fetch the daily rates that convert each currency into a base currency
+
+        Each currency pair (e.g. 'EURUSD=X') is fetched and cached like a
+        ticker, so a pair is downloaded once however many holdings use it.
+
+        Args:
+            currencies (iterable): Quote currencies, as in get_stock_info's 'currency'
+            base_currency (str): Currency to convert into, e.g. 'USD'
+            start_date (str): Start date in "YYYY-MM-DD" format
+            end_date (str): End date in "YYYY-MM-DD" format
+
+        Returns:
+            dict: Currency -> base units per unit, a pd.Series of daily closes or a
+                float when constant (the base currency and its minor units);
+                currencies without a rate are left out
+        """
+        rates = {}
+        for currency in currencies:
+            major, minor_units = MINOR_CURRENCIES.get(currency, (currency, 1))
+            if major == base_currency:
+                rates[currency] = 1.0 / minor_units
+                continue
+            if not isinstance(major, str) or len(major) != 3:
+                print(f"No FX rate for currency {currency!r}; its holdings are left unconverted")
+                continue
+
+            df = self.fetch_stock_data(f"{major}{base_currency}=X", start_date, end_date)
+            if df.empty:
+                print(f"No FX rate for {major}/{base_currency}; its holdings are left unconverted")
+                continue
+            rates[currency] = df['Close'] / minor_units
+        return rates
+
+    def _get_info(self, ticker):
+        """
+        Get yf.Ticker.info for a ticker, cached (for info_ttl seconds, if set)
+
+        Args:
+            ticker (str): Stock ticker symbol
+        Returns:
+            dict: Raw Yahoo Finance info
+        """
+        with self._ticker_lock(ticker):
+            fetched = self._info_times.get(ticker)
+            stale = self.info_ttl is not None and fetched is not None and time.monotonic() - fetched > self.info_ttl
+            if ticker not in self.info_cache or stale:
+                with span('network', call = 'info', ticker = ticker):
+                    self.info_cache[ticker] = self._ticker(ticker).info
+                self._info_times[ticker] = time.monotonic()
+            return self.info_cache[ticker]
         
     def get_current_price(self, ticker):
         """
@@ -63,8 +280,7 @@ class DataFetcher:
         """
 
         try:
-            stock = yf.Ticker(ticker)
-            stock_info = stock.info
+            stock_info = self._get_info(ticker)
 
             
             price_fields = ['currentPrice', 'regularMarketPrice', 'previousClose']
@@ -74,7 +290,8 @@ class DataFetcher:
                 if field in stock_info and stock_info[field] is not None:
                     return float(stock_info[field])
                 
-            hist = stock.history(period = "1d")
+            with span('network', call = 'quote', ticker = ticker):
+                hist = self._ticker(ticker).history(period = "1d")
             if not hist.empty:
                 return float(hist['Close'].iloc[-1])
                 
@@ -95,8 +312,7 @@ class DataFetcher:
         """
 
         try: 
-            stock = yf.Ticker(ticker)
-            basic_info = stock.info
+            basic_info = self._get_info(ticker)
 
             return {
                 'name': basic_info.get('longName', ticker),
@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from metrics_calculator import (INTRADAY_MINUTES, SESSION_MINUTES, MetricsCalculator, StreamingReturnStats,
+                                periods_per_year)
+from portfolio_analyzer import PortfolioAnalyzer
+from portfolio_engine import parse_purchase_dates, purchase_positions, value_positions
+from trading_calendar import TradingCalendar
+
+
+class IntradayAnalyzer(PortfolioAnalyzer):
+    """
+    Portfolio analysis on intraday bars, in bounded memory
+
+    The analysis period is walked in windows of `chunk_days` sessions. For
+    each window every ticker's bars are fetched (and not cached), aligned as
+    of each bar on the window's calendar, with a ticker's last price carried
+    over from the previous window, and valued with the same sparse product as
+    daily valuation. Each window's values then feed a StreamingReturnStats,
+    so only one window of bars is held at a time: a year of 1-minute bars for
+    hundreds of tickers needs a few megabytes instead of a few gigabytes. The
+    portfolio's own value, one number per bar, is kept for the charts.
+
+    Volatility, Sharpe and Sortino ratios are annualized from the bar
+    interval (see metrics_calculator.periods_per_year). Holdings details
+    (current prices, company info, the per-holding table) come from the
+    usual daily data.
+
+    Usage:
+        analyzer = IntradayAnalyzer(portfolio, interval = '1m', start_date = '2024-12-02')
+        analyzer.run_analysis()
+    """
+
+    # Risk metrics come from the streamed statistics; years count the exact time between the first and last bar
+    METRIC_GRAPH = PortfolioAnalyzer.METRIC_GRAPH.extend({
+        'stream': ('stats',),
+        'years': ('portfolio_history',),
+        'volatility': ('stream',),
+        'sharpe_ratio': ('stream',),
+        'sortino_ratio': ('stream',),
+        'drawdown': ('stream',),
+        'win_rate': ('stream',),
+        'beta': ('stream',),
+        'benchmark_return': ('stream', 'years'),
+    })
+
+    def __init__(self, portfolio, interval = '1m', start_date = None, end_date = None, chunk_days = 5,
+                 session_minutes = SESSION_MINUTES, benchmark = "^GSPC", fetcher = None, max_workers = 8):
+        """
+        Args:
+            portfolio (dict): Portfolio dictionary
+            interval (str): Intraday bar interval, e.g. '1m', '5m' or '1h'
+            start_date (str): First session in "YYYY-MM-DD" format (default: a week ago)
+            end_date (str): End of the period, exclusive (default: today)
+            chunk_days (int): Sessions per window; Yahoo serves at most 7 days of
+                1-minute bars per request
+            session_minutes (int): Length of a trading session, for annualization
+            benchmark (str): Benchmark ticker symbol (default: S&P 500)
+            fetcher (DataFetcher): Data fetcher to use (default: a new one)
+            max_workers (int): Threads fetching each window's tickers
+        """
+        if interval not in INTRADAY_MINUTES:
+            raise ValueError(f"Unknown intraday interval {interval!r}; use one of {', '.join(INTRADAY_MINUTES)}")
+        super().__init__(portfolio, benchmark = benchmark, fetcher = fetcher)
+        self.interval = interval
+        self.end_date = end_date if end_date is not None else datetime.now().strftime("%Y-%m-%d")
+        self.start_date = start_date if start_date is not None else (
+            pd.Timestamp(self.end_date) - timedelta(days = 7)).strftime("%Y-%m-%d")
+        self.chunk_days = chunk_days
+        self.max_workers = max_workers
+        self.calculator = MetricsCalculator(periods_per_year(interval, session_minutes))
+
+        self.stats = None # StreamingReturnStats of the bar-by-bar value
+
+    def windows(self):
+        """
+        Split the period into windows of chunk_days weekdays
+
+        Returns:
+            list: (start, end) "YYYY-MM-DD" pairs, end exclusive
+        """
+        days = pd.bdate_range(self.start_date, pd.Timestamp(self.end_date) - timedelta(days = 1))
+        return [(days[i].strftime("%Y-%m-%d"),
+                 (days[min(i + self.chunk_days, len(days)) - 1] + timedelta(days = 1)).strftime("%Y-%m-%d"))
+                for i in range(0, len(days), self.chunk_days)]
+
+    def _fetch_window(self, tickers, start, end):
+        """Bars of every ticker in one window, fetched in parallel and left out of the cache"""
+        def fetch(ticker):
+            return ticker, self.fetcher.fetch_stock_data(ticker, start_date = start, end_date = end,
+                                                         interval = self.interval, cache = False)
+
+        with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+            return dict(executor.map(fetch, tickers))
+
+    def calculate_portfolio_value_history(self):
+        """
+        Value the portfolio on every bar, one window at a time
+
+        Each window's values go into a StreamingReturnStats (self.stats once
+        the walk is done) as soon as they are computed; the window's bars are
+        dropped before the next one is fetched.
+        """
+        if self.ledger is not None:
+            holdings = self.ledger.position_changes()
+        else:
+            holdings = pd.DataFrame([(ticker, holding["shares"], holding["purchase_date"])
+                                     for ticker, holding in self.portfolio.items()],
+                                    columns = ['ticker', 'shares', 'purchase_date'])
+        holdings = parse_purchase_dates(holdings)
+        tickers = list(pd.unique(holdings['ticker']))
+        ticker_idx = pd.Index(tickers).get_indexer(holdings['ticker'])
+        account_idx = np.zeros(len(holdings), dtype = int)
+        shares = holdings['shares'].to_numpy(dtype = float)
+
+        stats = StreamingReturnStats(self.calculator.periods_per_year, self.calculator.risk_free_rate)
+        last_prices = pd.Series(np.nan, index = tickers)
+        last_market = np.nan
+        history = []
+        windows = self.windows()
+        for number, (start, end) in enumerate(windows, 1):
+            bars = self._fetch_window(tickers + [self.benchmark], start, end)
+            market_bars = bars.pop(self.benchmark)
+            calendar = TradingCalendar.from_histories(bars)
+            if len(calendar) == 0:
+                continue
+
+            # A ticker without a bar yet in this window is still worth its last price
+            prices = calendar.price_matrix(bars).reindex(columns = tickers).fillna(last_prices)
+            last_prices = prices.iloc[-1]
+            start_pos = purchase_positions(calendar.dates, holdings['purchase_date'])
+            values = value_positions(prices, account_idx, ticker_idx, shares, start_pos, 1)[:, 0]
+            # Bars before the first purchase are not part of the portfolio's history
+            values[:start_pos.min()] = np.nan
+
+            market = None
+            if not market_bars.empty:
+                market = calendar.align(market_bars['Close'])
+                market[np.isnan(market)] = last_market
+                last_market = market[-1]
+
+            stats.update(calendar.dates, values, market)
+            history.append(pd.Series(values, index = calendar.dates))
+            print(f" Window {number}/{len(windows)} ({start} to {end}): {len(calendar):,} bars")
+
+        self.stats = stats
+        self.portfolio_history = pd.concat(history).dropna() if history else pd.Series(dtype = float)
+        print(f"Portfolio history value calculated ({len(self.portfolio_history):,} {self.interval} bars)")
+
+    def _metric_stream(self):
+        return self.stats.result()
+
+    def _metric_years(self):
+        elapsed = self.portfolio_history.index[-1] - self.portfolio_history.index[0]
+        return elapsed.total_seconds() / (365.25 * 24 * 3600)
+
+    def _metric_annualized_return(self):
+        if self.metric('years') <= 0:
+            return None
+        return super()._metric_annualized_return()
+
+    def _metric_volatility(self):
+        return self.metric('stream')['volatility']
+
+    def _metric_sharpe_ratio(self):
+        return self.metric('stream')['sharpe_ratio']
+
+    def _metric_sortino_ratio(self):
+        return self.metric('stream')['sortino_ratio']
+
+    def _metric_drawdown(self):
+        stream = self.metric('stream')
+        return stream['max_drawdown'], stream['max_dd_peak_date'], stream['max_dd_trough_date']
+
+    def _metric_win_rate(self):
+        return self.metric('stream')['win_rate']
+
+    def _metric_beta(self):
+        return self.metric('stream')['beta']
+
+    def _metric_benchmark_return(self):
+        benchmark_total_return = self.metric('stream')['benchmark_total_return']
+        if benchmark_total_return is None or self.metric('years') <= 0:
+            return None
+        return self.calculator.calculate_annualized_return(benchmark_total_return, self.metric('years'))
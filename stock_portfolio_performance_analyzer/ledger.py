@@ -0,0 +1,278 @@
+import numpy as np
+import pandas as pd
+
+from portfolio_loader import (PortfolioValidationError, TRANSACTION_COLUMNS, TRADE_ACTIONS, CASH_ACTIONS,
+                              _error_frame, load_transactions)
+
+ACTIONS = list(TRADE_ACTIONS + CASH_ACTIONS)
+
+# Shares below this are rounding noise, not a short position
+SHARES_EPSILON = 1e-9
+
+
+def _daily_matrix(calendar, dates, keys, amounts, n_keys):
+    """
+    Spread per-event amounts onto a calendar as a dates x keys matrix
+
+    Each event lands on the first calendar date on or after its own date, so
+    events before the calendar fall on its first date; events after the last
+    calendar date are dropped.
+
+    Args:
+        calendar (pd.DatetimeIndex): Dates of the output rows
+        dates (pd.DatetimeIndex): Event dates
+        keys (np.ndarray): Column of each event
+        amounts (np.ndarray): Amount of each event
+        n_keys (int): Number of columns
+
+    Returns:
+        np.ndarray: Summed amounts, dates x keys
+    """
+    if calendar.tz is not None and dates.tz is None:
+        dates = dates.tz_localize(calendar.tz)
+    pos = calendar.searchsorted(dates, side = 'left')
+    keep = pos < len(calendar)
+    cells = pos[keep] * n_keys + keys[keep]
+    flat = np.bincount(cells, weights = amounts[keep], minlength = len(calendar) * n_keys)
+    return flat.reshape(len(calendar), n_keys)
+
+
+class TransactionLedger:
+    """
+    Event-sourced account history: buys, sells, dividends and cash flows
+
+    Positions and cash are never stored per day. They are derived from the
+    sorted transactions on demand: every transaction becomes a signed change
+    (shares for trades, cash for everything), changes are scattered onto the
+    requested calendar with one searchsorted + bincount, and a cumulative sum
+    down the dates turns them into daily balances. The cost is linear in the
+    number of transactions plus the size of the output matrix, with no loop
+    over days or transactions.
+
+    Cash sign convention (from the account's point of view):
+        BUY         -(shares * price + fees)
+        SELL        +(shares * price - fees)
+        DIVIDEND    +amount
+        DEPOSIT     +amount   (external flow in)
+        WITHDRAWAL  -amount   (external flow out)
+        FEE         -amount
+    Fees on a dividend or cash row are taken off its amount as well.
+
+    Usage:
+        ledger = TransactionLedger.from_file('transactions.csv')
+        holdings = ledger.daily_positions(prices.index)
+        engine = MultiPortfolioEngine.from_ledger(ledger)
+    """
+
+    def __init__(self, transactions, allow_short = False):
+        """
+        Args:
+            transactions (pd.DataFrame): account, date, ticker, action, shares, price,
+                amount, fees and (optionally) lot columns (see portfolio_loader.load_transactions)
+            allow_short (bool): Accept sells that take a holding below zero
+
+        Raises:
+            PortfolioValidationError: If a sell exceeds the shares held at that point
+        """
+        transactions = transactions.reindex(columns = TRANSACTION_COLUMNS)
+        transactions['lot'] = transactions['lot'].fillna('')
+        numbers = ['shares', 'price', 'amount', 'fees']
+        transactions[numbers] = transactions[numbers].fillna(0.0)
+        transactions['date'] = pd.to_datetime(transactions['date'])
+        # Stable sort keeps same-day transactions in file order (a buy before a same-day sell)
+        order = np.argsort(transactions['date'].to_numpy(), kind = 'stable')
+        self.transactions = transactions.iloc[order]
+
+        # Integer action codes: comparing millions of strings per action would dominate
+        action = pd.Categorical(self.transactions['action'], categories = ACTIONS).codes
+        shares = self.transactions['shares'].to_numpy(dtype = float)
+        price = self.transactions['price'].to_numpy(dtype = float)
+        amount = self.transactions['amount'].to_numpy(dtype = float)
+        fees = self.transactions['fees'].to_numpy(dtype = float)
+
+        is_buy = action == ACTIONS.index('BUY')
+        is_sell = action == ACTIONS.index('SELL')
+        is_income = (action == ACTIONS.index('DIVIDEND')) | (action == ACTIONS.index('DEPOSIT'))
+        is_expense = (action == ACTIONS.index('WITHDRAWAL')) | (action == ACTIONS.index('FEE'))
+        self.is_trade = is_buy | is_sell
+        self.signed_shares = np.where(is_buy, shares, np.where(is_sell, -shares, 0.0))
+        self.cash = np.select(
+            [is_buy, is_sell, is_income, is_expense],
+            [-(shares * price + fees), shares * price - fees, amount - fees, -(amount + fees)],
+            default = 0.0)
+        self.external = np.where(action == ACTIONS.index('DEPOSIT'), amount,
+                                 np.where(action == ACTIONS.index('WITHDRAWAL'), -amount, 0.0))
+
+        self.account_idx, accounts = pd.factorize(self.transactions['account'])
+        self.account_ids = list(accounts)
+
+        # (account, ticker) holdings from integer codes, cheaper than factorizing tuples
+        ticker_idx, tickers = pd.factorize(self.transactions['ticker'].to_numpy()[self.is_trade])
+        pairs = self.account_idx[self.is_trade].astype(np.int64) * len(tickers) + ticker_idx
+        unique_pairs, self.holding_codes = np.unique(pairs, return_inverse = True)
+        self.holdings = pd.MultiIndex.from_arrays([accounts[unique_pairs // len(tickers)],
+                                                   tickers[unique_pairs % len(tickers)]],
+                                                  names = ['account', 'ticker'])
+
+        if not allow_short:
+            self._check_short()
+
+    @classmethod
+    def from_file(cls, path, chunksize = 100_000, default_account = None, allow_short = False):
+        """
+        Load a ledger file with portfolio_loader.load_transactions
+
+        Args:
+            path (str): .csv (optionally compressed) or .parquet transaction file
+            chunksize (int): Rows per chunk while validating
+            default_account (str): Account for rows without one (default: the file name)
+            allow_short (bool): Accept sells that take a holding below zero
+
+        Returns:
+            TransactionLedger: The ledger
+        """
+        return cls(load_transactions(path, chunksize = chunksize, default_account = default_account),
+                   allow_short = allow_short)
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def for_account(self, account):
+        """
+        Ledger of a single account
+
+        Args:
+            account (str): Account id
+
+        Returns:
+            TransactionLedger: The account's transactions (already validated)
+        """
+        if account not in self.account_ids:
+            raise KeyError(f"No transactions for account {account!r}")
+        return TransactionLedger(self.transactions[self.transactions['account'] == account], allow_short = True)
+
+    def _check_short(self):
+        """Raise PortfolioValidationError listing every sell that oversells its holding"""
+        trade_shares = self.signed_shares[self.is_trade]
+        running = pd.Series(trade_shares).groupby(self.holding_codes).cumsum().to_numpy()
+        short = running < -SHARES_EPSILON
+        if short.any():
+            trades = self.transactions[self.is_trade]
+            errors = _error_frame(trades.index[short], 'shares', trades['shares'].to_numpy()[short],
+                                  'sells more shares than held')
+            raise PortfolioValidationError(errors.sort_values('row', kind = 'stable'), 'ledger')
+
+    def position_changes(self):
+        """
+        Every trade as a signed position for the valuation engine
+
+        Valuation is linear in shares, so a sell is a negative position starting
+        on its trade date and the engine's running holdings match the ledger's.
+
+        Returns:
+            pd.DataFrame: account, ticker, shares (negative for sells), purchase_price
+                and purchase_date (the parsed trade date), one row per trade
+        """
+        trades = self.transactions[self.is_trade]
+        return pd.DataFrame({
+            'account': trades['account'].to_numpy(),
+            'ticker': trades['ticker'].to_numpy(),
+            'shares': self.signed_shares[self.is_trade],
+            'purchase_price': trades['price'].to_numpy(dtype = float),
+            'purchase_date': trades['date'].to_numpy()
+        })
+
+    def daily_positions(self, calendar, by_account = False):
+        """
+        Shares held at the close of every calendar date
+
+        Args:
+            calendar (pd.DatetimeIndex): Dates to report (e.g. the price matrix index)
+            by_account (bool): One column per (account, ticker) instead of per ticker
+
+        Returns:
+            pd.DataFrame: Shares, dates x tickers (or x (account, ticker))
+        """
+        trades = self.transactions[self.is_trade]
+        dates = pd.DatetimeIndex(trades['date'])
+        if by_account:
+            keys, columns = self.holding_codes, self.holdings
+        else:
+            keys, columns = pd.factorize(trades['ticker'])
+        # Trades before the calendar starts land on its first date, so they are held from there
+        changes = _daily_matrix(calendar, dates, keys, self.signed_shares[self.is_trade], len(columns))
+        shares = np.cumsum(changes, axis = 0)
+        shares[np.abs(shares) < SHARES_EPSILON] = 0.0
+        return pd.DataFrame(shares, index = calendar, columns = columns)
+
+    def daily_cash_flows(self, calendar):
+        """
+        External cash flows (deposits positive, withdrawals negative) per date
+
+        Flows dated before the calendar starts are left out; they are part of
+        the opening balance, not a flow inside the period.
+
+        Args:
+            calendar (pd.DatetimeIndex): Dates to report
+
+        Returns:
+            pd.DataFrame: Net external flows, dates x accounts
+        """
+        dates = pd.DatetimeIndex(self.transactions['date'])
+        inside = dates >= self._naive(calendar)[0] if len(calendar) else np.zeros(len(dates), dtype = bool)
+        flows = _daily_matrix(calendar, dates[inside], self.account_idx[inside], self.external[inside],
+                              len(self.account_ids))
+        return pd.DataFrame(flows, index = calendar, columns = self.account_ids)
+
+    def cash_balance(self, calendar):
+        """
+        Cash held at the close of every calendar date
+
+        Args:
+            calendar (pd.DatetimeIndex): Dates to report
+
+        Returns:
+            pd.DataFrame: Cash, dates x accounts
+        """
+        dates = pd.DatetimeIndex(self.transactions['date'])
+        changes = _daily_matrix(calendar, dates, self.account_idx, self.cash, len(self.account_ids))
+        return pd.DataFrame(np.cumsum(changes, axis = 0), index = calendar, columns = self.account_ids)
+
+    def current_holdings(self):
+        """
+        Net shares of every holding after the last transaction
+
+        Returns:
+            pd.DataFrame: account, ticker, shares (closed holdings left out)
+        """
+        shares = np.bincount(self.holding_codes, weights = self.signed_shares[self.is_trade],
+                             minlength = len(self.holdings))
+        holdings = self.holdings.to_frame(index = False)
+        holdings['shares'] = shares
+        return holdings[np.abs(shares) >= SHARES_EPSILON].reset_index(drop = True)
+
+    def warn_cash_actions(self):
+        """
+        Warn about rows that move only cash (dividends, deposits, withdrawals, fees)
+
+        Valuation from a ledger (PortfolioAnalyzer.from_ledger and
+        MultiPortfolioEngine.from_ledger) follows the trades only: the value is
+        the holdings, and each trade's cost is the external flow behind the
+        time- and money-weighted returns. Cash rows change neither, so those
+        returns leave out dividends received in cash, fees and the cash
+        balance, and deposits and withdrawals are not flows.
+
+        Returns:
+            pd.Series: Number of cash rows per action (empty when there are none)
+        """
+        counts = self.transactions.loc[~self.is_trade, 'action'].value_counts()
+        if len(counts):
+            print(f"⚠️  Ledger has {counts.sum():,} cash rows ("
+                  + ', '.join(f"{count:,} {action}" for action, count in counts.items())
+                  + ") that are not valued: returns cover the holdings only, with each trade as a cash flow")
+        return counts
+
+    @staticmethod
+    def _naive(calendar):
+        """Calendar without its time zone, to compare with the ledger's naive dates"""
+        return calendar.tz_localize(None) if calendar.tz is not None else calendar
@@ -1,7 +1,3 @@
-import pandas as pd
-from portfolio_analyzer import PortfolioAnalyzer
-from visualize_ import PortfolioVisualization
-from PDF_generate_ import ReportGenerator
 import os
 import sys
 from datetime import datetime
@@ -15,9 +11,21 @@ def main():
     - Command line with CSV file
     - Interactive mode
     - Quick demo
+    - Non-interactive batch run
+    - Local analysis service
     - Help
     """
     
+    # Batch mode writes machine-readable output, so it skips the banner
+    if len(sys.argv) > 1 and sys.argv[1].lower() == 'batch':
+        from batch_analysis import run_batch
+        return run_batch(sys.argv[2:])
+    
+    # Service mode runs until interrupted and logs to stderr
+    if len(sys.argv) > 1 and sys.argv[1].lower() == 'serve':
+        from analysis_service import run_service
+        return run_service(sys.argv[2:])
+    
     # Print welcome banner
     print("\n" + "="*70)
     print(" "*15 + "STOCK PORTFOLIO PERFORMANCE ANALYZER")
@@ -37,9 +45,20 @@ def main():
             quick_demo()
             return
         
-        # CSV file path
+        # CSV file path, optionally followed by --profile or --profile=full and --snapshot[=name]
         else:
             csv_path = sys.argv[1]
+            profile = None
+            snapshot = None
+            for option in sys.argv[2:]:
+                if option == '--profile':
+                    profile = 'spans'
+                elif option.startswith('--profile='):
+                    profile = option.split('=', 1)[1]
+                elif option == '--snapshot':
+                    snapshot = os.path.splitext(os.path.basename(csv_path))[0]
+                elif option.startswith('--snapshot='):
+                    snapshot = option.split('=', 1)[1]
             print(f"\n📁 Loading portfolio from: {csv_path}")
             
             portfolio = load_portfolio_from_csv(csv_path)
@@ -49,7 +68,7 @@ def main():
                 gen_pdf = input("\n👉 Generate PDF report? (y/n, default: y): ").strip().lower()
                 generate_pdf = gen_pdf != 'n'
                 
-                run_full_analysis(portfolio, generate_pdf=generate_pdf)
+                run_full_analysis(portfolio, generate_pdf=generate_pdf, profile=profile, snapshot=snapshot)
             else:
                 print("\n❌ Could not load portfolio. ")
                 return
@@ -67,7 +86,7 @@ def main():
 
 if __name__ == "__main__":
     try:
-        main()
+        sys.exit(main())
     except KeyboardInterrupt:
         print("\n\n⚠️  Interrupted by user. Exiting...")
         sys.exit(0)
@@ -0,0 +1,404 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_fetcher import DataFetcher
+from metrics_calculator import INTRADAY_MINUTES, SESSION_MINUTES
+
+SECTORS = ['Technology', 'Healthcare', 'Financial Services', 'Consumer Cyclical', 'Industrials',
+           'Communication Services', 'Consumer Defensive', 'Energy', 'Utilities', 'Real Estate',
+           'Basic Materials']
+SPLIT_RATIOS = [2.0, 2.0, 3.0, 4.0, 1.5, 0.5] # 0.5 is a 1-for-2 reverse split
+TAIL_DF = 4 # Student-t degrees of freedom for fat-tailed returns
+DIVIDEND_PERIOD = 63 # Trading days between quarterly ex-dividend dates
+FX_TIMEZONE = 'Europe/London' # Yahoo stamps currency pairs at London midnight
+SESSION_OPEN = pd.Timedelta(hours = 9, minutes = 30) # Local time of the first intraday bar
+
+
+def _t_innovations(rng, size, df = TAIL_DF):
+    """Student-t draws scaled to unit variance"""
+    return rng.standard_t(df, size = size) * np.sqrt((df - 2) / df)
+
+
+class SyntheticMarket:
+    """
+    Seeded synthetic market data shaped like yf.Ticker.history output
+
+    Daily returns follow a market factor, a sector factor and idiosyncratic
+    noise, all with fat (Student-t) tails, so tickers are correlated within
+    and across sectors. The calendar skips weekends and US federal holidays;
+    some tickers list late or delist early, and trading halts leave gaps.
+    Dividend payers go ex-dividend quarterly (the close drops by the
+    dividend) and some tickers split once. Tickers can be quoted in several
+    currencies, with daily currency pairs ('EURUSD=X') served like tickers.
+
+    The whole price panel is generated up front with vectorized NumPy
+    (10 years x 5,000 tickers takes a few seconds); per-ticker frames, with
+    their Open/High/Low/Volume columns, are built on request. Intraday bars
+    are built on request too, per session, as a Brownian bridge from the
+    previous close to the day's close. The same seed always produces the
+    same data.
+
+    Usage:
+        market = SyntheticMarket(n_tickers = 5000, years = 10, seed = 42)
+        df = market.history(market.tickers[0], start = '2020-01-01')
+        fetcher = SyntheticDataFetcher(market)  # drop-in for DataFetcher
+    """
+
+    def __init__(self, n_tickers = 500, years = 10, end = '2024-12-31', seed = 0,
+                 tz = 'America/New_York', benchmark = '^GSPC', dividend_fraction = 0.4,
+                 split_fraction = 0.1, late_listing_fraction = 0.1, delisting_fraction = 0.02,
+                 halt_probability = 0.0005, currencies = ('USD',)):
+        """
+        Args:
+            n_tickers (int): Number of tickers (named SYN00000, SYN00001, ...)
+            years (int): Years of history ending on `end`
+            end (str): Last calendar date of the history
+            seed (int): Random seed
+            tz (str): Exchange time zone of the index
+            benchmark (str): Symbol of the market index built from the market factor
+            dividend_fraction (float): Share of tickers paying quarterly dividends
+            split_fraction (float): Share of tickers with one stock split
+            late_listing_fraction (float): Share of tickers listing after the start
+            delisting_fraction (float): Share of tickers delisting before the end
+            halt_probability (float): Chance of a ticker missing any given trading day
+            currencies (tuple): Currencies tickers are quoted in, assigned at random
+                (the benchmark stays in the first one)
+        """
+        self.seed = seed
+        self.benchmark = benchmark
+        self.tickers = [f"SYN{i:05d}" for i in range(n_tickers)]
+        self._index = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+        # Trading calendar: business days without US federal holidays
+        from pandas.tseries.holiday import USFederalHolidayCalendar
+        end = pd.Timestamp(end)
+        start = end - pd.DateOffset(years = years) + pd.Timedelta(days = 1)
+        holidays = USFederalHolidayCalendar().holidays(start, end)
+        dates = pd.bdate_range(start, end)
+        self.calendar = dates[~dates.isin(holidays)].tz_localize(tz)
+        self.calendar.name = 'Date'
+        n_days = len(self.calendar)
+
+        rng = np.random.default_rng(seed)
+
+        # Static ticker attributes
+        self.sectors = rng.integers(0, len(SECTORS), n_tickers)
+        market_beta = rng.uniform(0.6, 1.4, n_tickers)
+        self._market_beta = market_beta
+        sector_beta = rng.uniform(0.3, 0.9, n_tickers)
+        idio_vol = rng.uniform(0.008, 0.025, n_tickers)
+        drift = rng.normal(0.0003, 0.0002, n_tickers)
+        initial_price = np.exp(rng.normal(np.log(60), 0.8, n_tickers))
+
+        # Factor model log returns, built in place to keep one days x tickers array
+        market_factor = 0.0003 + 0.01 * _t_innovations(rng, n_days)
+        sector_factor = 0.007 * _t_innovations(rng, (n_days, len(SECTORS)))
+        returns = _t_innovations(rng, (n_days, n_tickers))
+        returns *= idio_vol
+        returns += sector_factor[:, self.sectors] * sector_beta
+        returns += market_factor[:, None] * market_beta
+        returns += drift
+
+        # Quarterly dividends: the price drops by the dividend yield on each ex-date
+        payers = np.flatnonzero(rng.random(n_tickers) < dividend_fraction)
+        quarterly_yield = rng.uniform(0.0025, 0.0125, len(payers))
+        phase = rng.integers(1, DIVIDEND_PERIOD, len(payers))
+        ex_rows = phase[None, :] + DIVIDEND_PERIOD * np.arange(n_days // DIVIDEND_PERIOD + 1)[:, None]
+        ex_cols = np.broadcast_to(np.arange(len(payers)), ex_rows.shape)
+        inside = ex_rows < n_days
+        ex_rows, ex_cols = ex_rows[inside], ex_cols[inside]
+        returns[ex_rows, payers[ex_cols]] += np.log1p(-quarterly_yield[ex_cols])
+
+        # Split-adjusted closes (Yahoo reports every price adjusted for splits)
+        np.cumsum(returns, axis = 0, out = returns)
+        np.exp(returns, out = returns)
+        returns *= initial_price
+        self.close = returns
+
+        # Dividends per share, from the previous close
+        self._dividend_rows = ex_rows
+        self._dividend_cols = payers[ex_cols]
+        self._dividend_amounts = self.close[ex_rows - 1, payers[ex_cols]] * quarterly_yield[ex_cols]
+
+        # One split for some tickers, somewhere in the middle of the history
+        splitters = np.flatnonzero(rng.random(n_tickers) < split_fraction)
+        self._split_rows = rng.integers(n_days // 10, n_days - n_days // 10, len(splitters))
+        self._split_cols = splitters
+        self._split_ratios = rng.choice(SPLIT_RATIOS, len(splitters))
+
+        # Listing windows and trading halts
+        first = np.where(rng.random(n_tickers) < late_listing_fraction,
+                         rng.integers(0, int(n_days * 0.7) + 1, n_tickers), 0)
+        last = np.where(rng.random(n_tickers) < delisting_fraction,
+                        rng.integers(int(n_days * 0.7), n_days, n_tickers), n_days - 1)
+        last = np.maximum(last, first)
+        rows = np.arange(n_days)[:, None]
+        self.valid = (rows >= first) & (rows <= last) & (rng.random((n_days, n_tickers)) >= halt_probability)
+
+        # Price index for the benchmark, from the market factor alone
+        self._benchmark_close = 3000.0 * np.exp(np.cumsum(market_factor))
+
+        # Quote currencies and their value in the first currency, from a separate stream
+        # so adding currencies leaves the prices above unchanged
+        fx_rng = np.random.default_rng([seed, n_tickers + 1])
+        self.currencies = list(currencies)
+        self.ticker_currency = fx_rng.integers(0, len(self.currencies), n_tickers)
+        fx_returns = 0.005 * _t_innovations(fx_rng, (n_days, len(self.currencies)))
+        fx_returns[:, 0] = 0.0
+        self._fx = np.exp(np.cumsum(fx_returns, axis = 0) + fx_rng.normal(0.0, 1.0, len(self.currencies)))
+        self._fx /= self._fx[:, :1]
+
+    def _column(self, ticker):
+        """Closes, validity, dividends and splits of one ticker (or the benchmark)"""
+        n_days = len(self.calendar)
+        dividends = np.zeros(n_days)
+        splits = np.zeros(n_days)
+        if ticker == self.benchmark:
+            return self._benchmark_close, np.ones(n_days, dtype = bool), dividends, splits, -1
+
+        i = self._index[ticker]
+        paid = self._dividend_cols == i
+        dividends[self._dividend_rows[paid]] = self._dividend_amounts[paid]
+        split = self._split_cols == i
+        splits[self._split_rows[split]] = self._split_ratios[split]
+        return self.close[:, i], self.valid[:, i], dividends, splits, i
+
+    def history(self, ticker, start = None, end = None, auto_adjust = True, interval = '1d'):
+        """
+        Daily history of one ticker, like yf.Ticker(ticker).history
+
+        Args:
+            ticker (str): Ticker symbol (one of self.tickers, or the benchmark)
+            start (str): First date, inclusive (default: start of the history)
+            end (str): Last date, exclusive (default: end of the history)
+            auto_adjust (bool): Adjust Open/High/Low/Close for dividends as Yahoo does;
+                otherwise Close is only split-adjusted and an 'Adj Close' column is added
+            interval (str): '1d', or an intraday interval such as '1m' or '5m'
+
+        Returns:
+            pd.DataFrame: Open, High, Low, Close, Volume, Dividends, Stock Splits on a
+                tz-aware 'Date' index (empty for an unknown ticker)
+        """
+        if ticker.endswith('=X'):
+            return self._fx_history(ticker, start, end)
+        if ticker != self.benchmark and ticker not in self._index:
+            return pd.DataFrame()
+        if interval in INTRADAY_MINUTES:
+            return self._intraday_history(ticker, start, end, INTRADAY_MINUTES[interval])
+
+        close, valid, dividends, splits, i = self._column(ticker)
+
+        # Open/High/Low/Volume from a per-ticker stream, so they do not depend on the date range
+        rng = np.random.default_rng([self.seed, i + 1])
+        n_days = len(close)
+        previous = np.concatenate(([close[0]], close[:-1]))
+        open_ = previous * np.exp(rng.normal(0.0, 0.004, n_days))
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0.0, 0.006, n_days)))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0.0, 0.006, n_days)))
+        volume = np.round(np.exp(rng.normal(13.0, 0.6, n_days))).astype(np.int64)
+
+        # Back-adjustment for dividends: prices before each ex-date scale by (1 - dividend / previous close)
+        ratio = np.where(dividends > 0, 1 - dividends / previous, 1.0)
+        factor = np.append(np.cumprod(ratio[::-1])[::-1][1:], 1.0)
+
+        rows = valid.copy()
+        if start is not None:
+            rows &= self.calendar >= pd.Timestamp(start, tz = self.calendar.tz)
+        if end is not None:
+            rows &= self.calendar < pd.Timestamp(end, tz = self.calendar.tz)
+
+        scale = factor[rows] if auto_adjust else 1.0
+        df = pd.DataFrame({'Open': open_[rows] * scale, 'High': high[rows] * scale,
+                           'Low': low[rows] * scale, 'Close': close[rows] * scale},
+                          index = self.calendar[rows])
+        if not auto_adjust:
+            df['Adj Close'] = close[rows] * factor[rows]
+        df['Volume'] = volume[rows]
+        df['Dividends'] = dividends[rows]
+        df['Stock Splits'] = splits[rows]
+        return df
+
+    def _intraday_history(self, ticker, start, end, minutes):
+        """
+        Intraday bars of one ticker (split-adjusted, not adjusted for dividends)
+
+        Each session is a Brownian bridge in log price from the previous close
+        to the day's close. Its shocks are the market's, drawn from a
+        (seed, day) stream and scaled by the ticker's market beta, plus the
+        ticker's own from a (seed, ticker, day) stream, so any date range
+        gives the same bars. Bars are stamped at their start time.
+        """
+        close, valid, _, _, i = self._column(ticker)
+        days = np.flatnonzero(valid)
+        local_days = self.calendar.tz_localize(None)
+        if start is not None:
+            days = days[local_days[days] >= pd.Timestamp(start).normalize()]
+        if end is not None:
+            days = days[local_days[days] < pd.Timestamp(end)]
+        if len(days) == 0:
+            return pd.DataFrame()
+
+        n_bars = int(np.ceil(SESSION_MINUTES / minutes))
+        steps = np.arange(1, n_bars + 1) / n_bars
+        previous = close[np.maximum(days - 1, 0)]
+        paths = np.empty((len(days), n_bars))
+        beta = 1.0 if i < 0 else self._market_beta[i]
+        for row, day in enumerate(days):
+            # Common market moves (the benchmark's own stream) plus the ticker's own
+            shocks = beta * np.random.default_rng([self.seed, 0, int(day)]).normal(0.0, 0.01 / np.sqrt(n_bars), n_bars)
+            if i >= 0:
+                shocks += np.random.default_rng([self.seed, i + 1, int(day)]).normal(0.0, 0.01 / np.sqrt(n_bars), n_bars)
+            walk = np.cumsum(shocks)
+            paths[row] = walk - steps * walk[-1]
+        paths += np.log(previous)[:, None] + steps * np.log(close[days] / previous)[:, None]
+        bars = np.exp(paths).ravel()
+
+        offsets = SESSION_OPEN + pd.to_timedelta(np.arange(n_bars) * minutes, unit = 'min')
+        index = (local_days[days].values[:, None] + offsets.values[None, :]).ravel()
+        index = pd.DatetimeIndex(index, name = 'Date').tz_localize(self.calendar.tz)
+        opens = np.concatenate(([previous[0]], bars[:-1]))
+        return pd.DataFrame({'Open': opens, 'High': np.maximum(opens, bars), 'Low': np.minimum(opens, bars),
+                             'Close': bars, 'Volume': 0, 'Dividends': 0.0, 'Stock Splits': 0.0}, index = index)
+
+    def _fx_history(self, pair, start, end):
+        """Daily closes of a currency pair such as 'EURUSD=X' (units of the second per unit of the first)"""
+        quote, base = pair[:3], pair[3:6]
+        if quote not in self.currencies or base not in self.currencies:
+            return pd.DataFrame()
+        close = self._fx[:, self.currencies.index(quote)] / self._fx[:, self.currencies.index(base)]
+        index = pd.DatetimeIndex(self.calendar.tz_localize(None), name = 'Date').tz_localize(FX_TIMEZONE)
+        rows = np.ones(len(index), dtype = bool)
+        if start is not None:
+            rows &= index >= pd.Timestamp(start, tz = FX_TIMEZONE)
+        if end is not None:
+            rows &= index < pd.Timestamp(end, tz = FX_TIMEZONE)
+        return pd.DataFrame({'Open': close[rows], 'High': close[rows], 'Low': close[rows], 'Close': close[rows],
+                             'Volume': 0, 'Dividends': 0.0, 'Stock Splits': 0.0}, index = index[rows])
+
+    def info(self, ticker):
+        """
+        Ticker information like yf.Ticker(ticker).info
+
+        Args:
+            ticker (str): Ticker symbol
+
+        Returns:
+            dict: longName, sector, industry, currency and the last price
+        """
+        if ticker == self.benchmark:
+            return {'longName': 'Synthetic Market Index', 'currency': self.currencies[0],
+                    'regularMarketPrice': float(self._benchmark_close[-1])}
+        if ticker not in self._index:
+            return {}
+        i = self._index[ticker]
+        last = np.flatnonzero(self.valid[:, i])
+        sector = SECTORS[self.sectors[i]]
+        return {
+            'longName': f"Synthetic {ticker} Inc.",
+            'sector': sector,
+            'industry': f"Synthetic {sector}",
+            'currency': self.currencies[self.ticker_currency[i]],
+            'currentPrice': float(self.close[last[-1], i]) if len(last) else None
+        }
+
+    def to_frame(self, tickers = None, auto_adjust = True):
+        """
+        Long-format history of many tickers, one row per ticker and date
+
+        Args:
+            tickers (list): Tickers to include (default: all)
+            auto_adjust (bool): See history
+
+        Returns:
+            pd.DataFrame: History columns plus 'Ticker', on the 'Date' index
+        """
+        tickers = self.tickers if tickers is None else tickers
+        frames = [self.history(ticker, auto_adjust = auto_adjust).assign(Ticker = ticker) for ticker in tickers]
+        return pd.concat(frames)
+
+    def write(self, path, tickers = None, auto_adjust = True):
+        """
+        Write the long-format history to a file
+
+        Args:
+            path (str): .csv, .csv.gz or .parquet file (Parquet needs pyarrow or fastparquet)
+            tickers (list): Tickers to include (default: all)
+            auto_adjust (bool): See history
+
+        Returns:
+            str: The path written
+        """
+        df = self.to_frame(tickers, auto_adjust)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        if path.endswith('.parquet'):
+            df.to_parquet(path)
+        else:
+            df.to_csv(path)
+        return path
+
+
+class SyntheticTicker:
+    """Stand-in for yf.Ticker backed by a SyntheticMarket"""
+
+    def __init__(self, market, ticker):
+        self.market = market
+        self.ticker = ticker
+
+    def history(self, start = None, end = None, period = None, auto_adjust = True, interval = '1d', **kwargs):
+        """Same call shape as yf.Ticker.history; period only supports the last row ('1d')"""
+        df = self.market.history(self.ticker, start = start, end = end, auto_adjust = auto_adjust,
+                                 interval = interval)
+        if period is not None:
+            return df.iloc[-1:]
+        return df
+
+    @property
+    def info(self):
+        return self.market.info(self.ticker)
+
+
+class SyntheticDataFetcher(DataFetcher):
+    """
+    DataFetcher that serves a SyntheticMarket instead of Yahoo Finance
+
+    Caching, locking and every public method behave as in DataFetcher, so it
+    can be passed anywhere a fetcher is accepted, e.g.
+    PortfolioAnalyzer(portfolio, fetcher = SyntheticDataFetcher(market)).
+    """
+
+    def __init__(self, market = None, **market_options):
+        """
+        Args:
+            market (SyntheticMarket): Market to serve (default: a new one)
+            **market_options: SyntheticMarket arguments when no market is given
+        """
+        super().__init__()
+        self.market = market if market is not None else SyntheticMarket(**market_options)
+
+    def _ticker(self, ticker):
+        return SyntheticTicker(self.market, ticker)
+
+
+if __name__ == "__main__":
+    # Generation speed and a quick look at the data
+    import time
+
+    start = time.perf_counter()
+    market = SyntheticMarket(n_tickers = 5000, years = 10, seed = 42)
+    print(f"Generated {len(market.tickers):,} tickers x {len(market.calendar):,} days "
+          f"in {time.perf_counter() - start:.2f} s")
+
+    ticker = market.tickers[0]
+    df = market.history(ticker)
+    print(df.tail())
+    print(market.info(ticker))
+
+    returns = np.diff(np.log(market.close[:, :200]), axis = 0)
+    correlation = np.corrcoef(returns.T)
+    print(f"Mean pairwise correlation: {correlation[np.triu_indices(200, 1)].mean():.2f}")
+    excess_kurtosis = ((returns - returns.mean(0))**4).mean(0) / returns.var(0)**2 - 3
+    print(f"Mean excess kurtosis:      {excess_kurtosis.mean():.2f}")
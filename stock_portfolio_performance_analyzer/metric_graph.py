@@ -0,0 +1,83 @@
+class MetricGraph:
+    """
+    Metrics declared with their dependencies, for lazy, memoized evaluation
+
+    Each metric names what it is computed from: other metrics, or inputs (any
+    name that is not itself a metric, e.g. an analyzer attribute such as
+    'portfolio_history'). The graph only records that structure; the owner
+    computes a metric on first request, keeps it in a cache, and when an
+    input changes drops exactly the cached metrics that depend on it,
+    directly or through other metrics. Asking for one metric therefore
+    computes it and its own dependencies, and nothing else.
+
+    Usage:
+        graph = MetricGraph({
+            'returns': ('history',),
+            'volatility': ('returns',),
+            'max_drawdown': ('history',),
+        })
+        graph.inputs                   # {'history'}
+        graph.affected(['history'])    # {'returns', 'volatility', 'max_drawdown'}
+    """
+
+    def __init__(self, nodes):
+        """
+        Args:
+            nodes (dict): Metric name -> names it depends on (metrics or inputs)
+
+        Raises:
+            ValueError: If the dependencies form a cycle
+        """
+        self.nodes = {name: tuple(depends_on) for name, depends_on in nodes.items()}
+        self.inputs = {dep for depends_on in self.nodes.values() for dep in depends_on} - set(self.nodes)
+
+        # Reverse edges, then every name's transitive dependents, found once here
+        direct = {}
+        for name, depends_on in self.nodes.items():
+            for dep in depends_on:
+                direct.setdefault(dep, set()).add(name)
+        self.dependents = {}
+        for name in list(self.nodes) + sorted(self.inputs):
+            found, stack = set(), list(direct.get(name, ()))
+            while stack:
+                dependent = stack.pop()
+                if dependent == name:
+                    raise ValueError(f"Metric {name!r} depends on itself")
+                if dependent not in found:
+                    found.add(dependent)
+                    stack.extend(direct.get(dependent, ()))
+            self.dependents[name] = found
+
+    def extend(self, nodes):
+        """
+        A graph with more metrics, or some metrics redeclared (e.g. in a subclass)
+
+        Args:
+            nodes (dict): Metric name -> names it depends on
+
+        Returns:
+            MetricGraph: The combined graph
+        """
+        return MetricGraph({**self.nodes, **nodes})
+
+    def affected(self, names):
+        """
+        Metrics to recompute when some inputs or metrics change
+
+        Args:
+            names (iterable): Changed input or metric names
+
+        Returns:
+            set: The changed metrics themselves and every metric depending on them
+
+        Raises:
+            KeyError: If a name is neither a metric nor an input
+        """
+        affected = set()
+        for name in names:
+            if name not in self.dependents:
+                raise KeyError(f"Unknown metric or input {name!r}")
+            affected |= self.dependents[name]
+            if name in self.nodes:
+                affected.add(name)
+        return affected
@@ -1,13 +1,159 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from scipy import stats
+
+# Bracketing grid for the XIRR solver, in log growth ln(1 + rate): about -95% to +1,900% a year
+XIRR_GRID = np.linspace(-3.0, 3.0, 25)
+
+TRADING_DAYS = 252 # Trading days per year
+SESSION_MINUTES = 390 # Minutes in a regular US session (9:30 to 16:00)
+# Intraday bar intervals (yfinance names) -> bar length in minutes
+INTRADAY_MINUTES = {'1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30, '60m': 60, '90m': 90, '1h': 60}
+# Bar intervals longer than a day -> bars per year
+LONG_BARS_PER_YEAR = {'5d': TRADING_DAYS / 5, '1wk': 52, '1mo': 12, '3mo': 4}
+
+
+def periods_per_year(interval = '1d', session_minutes = SESSION_MINUTES, trading_days = TRADING_DAYS):
+    """
+    Return periods in a year for a bar interval, to annualize per-bar statistics
+
+    Intraday bars count trading_days x bars per session, with a partial last
+    bar counted as one (Yahoo's 90m bars give 5 per US session).
+
+    Args:
+        interval (str): Bar interval, e.g. '1m', '5m', '1h' or '1d'
+        session_minutes (int): Length of a trading session in minutes
+        trading_days (int): Trading days per year
+
+    Returns:
+        float: Bars per year (252 for daily bars, 98,280 for 1-minute bars)
+    """
+    if interval in INTRADAY_MINUTES:
+        return trading_days * int(np.ceil(session_minutes / INTRADAY_MINUTES[interval]))
+    if interval == '1d':
+        return trading_days
+    if interval in LONG_BARS_PER_YEAR:
+        return LONG_BARS_PER_YEAR[interval]
+    raise ValueError(f"Unknown bar interval {interval!r}; use one of "
+                     f"{', '.join(list(INTRADAY_MINUTES) + ['1d'] + list(LONG_BARS_PER_YEAR))}")
+
+
+def time_weighted_returns(values, cash_flows):
+    """
+    Time-weighted return of many value series at once
+
+    Each day is one sub-period. A day's external flow is counted at the start
+    of the day, so money invested at a purchase price earns exactly the move
+    to that day's close: r_t = V_t / (V_{t-1} + F_t) - 1. The sub-period
+    returns are chain-linked, so deposits and withdrawals do not count as gains.
+
+    Args:
+        values (np.ndarray): Values, dates x series (NaN before a series starts)
+        cash_flows (np.ndarray): External flows into each series, dates x series
+            (purchases positive, sales and withdrawals negative)
+
+    Returns:
+        np.ndarray: Total time-weighted return of each series
+    """
+    V = np.asarray(values, dtype = float)
+    F = np.nan_to_num(np.asarray(cash_flows, dtype = float))
+    previous = np.vstack([np.zeros((1, V.shape[1])), np.nan_to_num(V[:-1])])
+    base = previous + F
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        # A fully liquidated or not yet started day has no return
+        R = np.where((base > 0) & ~np.isnan(V), V / base - 1, 0.0)
+    growth = np.exp(np.log1p(R).sum(axis = 0))
+    started = (~np.isnan(V)).any(axis = 0)
+    return np.where(started, growth - 1, np.nan)
+
+
+def xirr(cash_flows, dates, tol = 1e-10, max_iter = 100):
+    """
+    Money-weighted return (XIRR) of many cash flow streams at once
+
+    Solves sum_t cf_t * (1 + r)^(-years_t) = 0 for every stream together. The
+    root is bracketed on a grid of log growth rates (the sign change closest
+    to zero growth wins), then refined with Newton steps that fall back to
+    bisection whenever a step leaves the bracket, so every stream with a
+    sign change converges. A stream stops, keeping its estimate, once its
+    Newton or bisection step is below tol. Only the nonzero flows are evaluated, so the cost
+    grows with the number of flows, not dates x streams.
+
+    Args:
+        cash_flows (np.ndarray): Flows, dates x streams, from the investor's side
+            (investments negative, withdrawals and the final value positive)
+        dates (pd.DatetimeIndex): Date of each row
+        tol (float): Convergence tolerance on the log growth rate
+        max_iter (int): Newton / bisection iterations
+
+    Returns:
+        np.ndarray: Annualized money-weighted return of each stream
+            (NaN when the flows never change sign)
+    """
+    CF = np.nan_to_num(np.asarray(cash_flows, dtype = float))
+    n_streams = CF.shape[1]
+    # Streams have few flows, so only the nonzero entries are evaluated
+    rows, columns = np.nonzero(CF)
+    amounts = CF[rows, columns]
+    years = np.asarray((dates - dates[0]).days, dtype = float)[rows] / 365.0
+    scale = np.bincount(columns, weights = np.abs(amounts), minlength = n_streams)
+
+    def npv(x, streams):
+        """NPV and its derivative in x for the streams in the boolean mask"""
+        entries = streams[columns]
+        t, cf, col = years[entries], amounts[entries], columns[entries]
+        discounted = cf * np.exp(-x[col] * t)
+        return (np.bincount(col, weights = discounted, minlength = n_streams)[streams],
+                np.bincount(col, weights = -t * discounted, minlength = n_streams)[streams])
+
+    # Bracket: the grid interval with a sign change closest to zero growth
+    every = np.ones(n_streams, dtype = bool)
+    grid_npv = np.array([npv(np.full(n_streams, x), every)[0] for x in XIRR_GRID])
+    change = np.sign(grid_npv[:-1]) * np.sign(grid_npv[1:]) < 0
+    distance = np.where(change, np.abs(XIRR_GRID[:-1] + XIRR_GRID[1:])[:, None], np.inf)
+    interval = distance.argmin(axis = 0)
+    found = np.isfinite(distance[interval, np.arange(n_streams)]) & (scale > 0)
+
+    lo = XIRR_GRID[interval].astype(float)
+    hi = XIRR_GRID[interval + 1].astype(float)
+    f_lo = grid_npv[interval, np.arange(n_streams)]
+    x = (lo + hi) / 2
+    active = found.copy()
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        f, df = npv(x, active)
+        # Keep the half of the bracket that still has the sign change
+        left = np.sign(f) == np.sign(f_lo[active])
+        lo[active] = np.where(left, x[active], lo[active])
+        f_lo[active] = np.where(left, f, f_lo[active])
+        hi[active] = np.where(left, hi[active], x[active])
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            step = x[active] - f / df
+        inside = np.isfinite(step) & (step > lo[active]) & (step < hi[active])
+        # A stream whose Newton step is below tol is at its root and keeps x;
+        # only streams whose step leaves the bracket are bisected
+        converged = (f == 0) | (np.abs(f) < tol * np.abs(df))
+        new_x = np.where(converged, x[active], np.where(inside, step, (lo[active] + hi[active]) / 2))
+        done = converged | (np.abs(new_x - x[active]) < tol)
+        x[active] = new_x
+        active[np.flatnonzero(active)[done]] = False
+
+    return np.where(found, np.expm1(x), np.nan)
+
 
 class MetricsCalculator: 
     """ Calculate portfolio performance metrics """
 
-    def __init__(self):
+    def __init__(self, periods_per_year = TRADING_DAYS):
+        """
+        Args:
+            periods_per_year (float): Return periods in a year, for annualization
+                (see periods_per_year for intraday bars)
+        """
         self.risk_free_rate = 0.03 # Example risk-free rate (3%)
+        self.periods_per_year = periods_per_year
 
     def calculate_returns(self, prices): 
         """
@@ -48,30 +194,34 @@ class MetricsCalculator:
         """
         return (1 + total_return) ** (1 / years) - 1
     
-    def calculate_volatility(self, returns, trading_days = 252, annualize = True):
+    def calculate_volatility(self, returns, trading_days = None, annualize = True):
         """
         Calculate volatility (standard deviation of returns)
 
         Args:
-            returns (pd.Series): Daily returns
+            returns (pd.Series): Periodic (daily or per-bar) returns
+            trading_days (float): Return periods per year (default: the calculator's)
             annualize (bool): Whether to annualize the volatility
 
         Returns:
             float: Volatility
         """
+        if trading_days is None:
+            trading_days = self.periods_per_year
         vol = returns.std()
 
         if annualize == True:
-            vol = vol * np.sqrt(trading_days) # Assuming 252 trading days in a year
+            vol = vol * np.sqrt(trading_days)
         return vol
     
-    def calculate_sharpe_ratio(self, returns, trading_days = 252, risk_free_rate = None):
+    def calculate_sharpe_ratio(self, returns, trading_days = None, risk_free_rate = None):
         """
         Calculate Sharpe Ratio
         Sharpe Ratio = (Rp - Rf) / sigma(p)
 
         Args:
-            returns (pd.Series): Daily returns (in percentage)
+            returns (pd.Series): Periodic (daily or per-bar) returns
+            trading_days (float): Return periods per year (default: the calculator's)
             risk_free_rate (float): Annualized Risk-free Rate
 
         Returns:
@@ -79,6 +229,8 @@ class MetricsCalculator:
         """
         if risk_free_rate is None:
             risk_free_rate = self.risk_free_rate
+        if trading_days is None:
+            trading_days = self.periods_per_year
         
         daily_Rf = risk_free_rate / trading_days
         excess_returns = returns - daily_Rf
@@ -91,14 +243,15 @@ class MetricsCalculator:
 
         return sharpe_ratio
     
-    def calculate_sortino_ratio(self, returns, trading_days = 252, risk_free_rate = None):
+    def calculate_sortino_ratio(self, returns, trading_days = None, risk_free_rate = None):
         """
         Calculate Sortino Ratio
         Sortino Ratio = (Rp - Rf) / sigma(downside)
 
 
         Args:
-            returns (pd.Series): Daily returns (in percentage)
+            returns (pd.Series): Periodic (daily or per-bar) returns
+            trading_days (float): Return periods per year (default: the calculator's)
             risk_free_rate (float): Annualized Risk-free Rate
 
         Returns:
@@ -106,6 +259,8 @@ class MetricsCalculator:
         """
         if risk_free_rate is None:
             risk_free_rate = self.risk_free_rate
+        if trading_days is None:
+            trading_days = self.periods_per_year
 
         daily_Rf = risk_free_rate / trading_days
         excess_returns = returns - daily_Rf
@@ -122,6 +277,38 @@ class MetricsCalculator:
 
         return sortino_ratio
     
+    def calculate_time_weighted_return(self, values, cash_flows):
+        """
+        Calculate the time-weighted return (TWR)
+        TWR = prod(1 + r_t) - 1, r_t = V_t / (V_{t-1} + F_t) - 1
+
+        Args:
+            values (pd.Series): Portfolio value history
+            cash_flows (pd.Series): External flows on the same dates (money in positive)
+
+        Returns:
+            float: Time-weighted return
+        """
+        flows = cash_flows.reindex(values.index, fill_value = 0.0)
+        return float(time_weighted_returns(values.to_numpy()[:, None], flows.to_numpy()[:, None])[0])
+
+    def calculate_money_weighted_return(self, values, cash_flows):
+        """
+        Calculate the money-weighted return (XIRR)
+        The annual rate r with sum(cf_t * (1 + r)^(-t)) = 0, where the flows are
+        the money invested (negative) and the final value (positive)
+
+        Args:
+            values (pd.Series): Portfolio value history
+            cash_flows (pd.Series): External flows on the same dates (money in positive)
+
+        Returns:
+            float: Annualized money-weighted return (NaN if it is undefined)
+        """
+        flows = -cash_flows.reindex(values.index, fill_value = 0.0).to_numpy()
+        flows[-1] += values.iloc[-1]
+        return float(xirr(flows[:, None], values.index)[0])
+
     def calculate_max_drawdown(self, prices):
         """
         Calculate Maximum Drawdown (in the worst scenario)
@@ -234,6 +421,175 @@ class MetricsCalculator:
         profit_to_loss_ratio = total_return / loss
         return profit_to_loss_ratio
     
+class StreamingReturnStats:
+    """
+    Return statistics of a value series fed in consecutive chunks
+
+    Only running sums are kept: counts, means and (co-)moments of the returns,
+    merged chunk by chunk with Chan's parallel update, plus the running peak
+    and the worst drawdown so far. Memory stays constant however long the
+    series is, and result() gives the metrics MetricsCalculator computes from
+    a whole series (volatility, Sharpe, Sortino, drawdown, win rate, beta).
+
+    Usage:
+        stats = StreamingReturnStats(periods_per_year('1m'))
+        for dates, values, market in chunks:
+            stats.update(dates, values, market)
+        metrics = stats.result()
+    """
+
+    def __init__(self, periods_per_year = TRADING_DAYS, risk_free_rate = 0.03):
+        """
+        Args:
+            periods_per_year (float): Return periods in a year, for annualization
+            risk_free_rate (float): Annualized risk-free rate
+        """
+        self.periods_per_year = periods_per_year
+        self.risk_free_rate = risk_free_rate
+
+        self.returns = (0, 0.0, 0.0) # (count, mean, sum of squared deviations)
+        self.downside = (0, 0.0, 0.0) # Same, negative returns only
+        self.paired = (0, 0.0, 0.0, 0.0, 0.0) # (count, mean p, mean m, m2 of m, co-moment) with the market
+        self.wins = 0
+
+        self.first_date = None
+        self.first_value = None
+        self.last_date = None
+        self.last_value = None
+        self.first_market = None
+        self.last_market = None
+
+        self.peak = -np.inf
+        self.peak_date = None
+        self.max_drawdown = 0.0
+        self.max_dd_peak_date = None
+        self.max_dd_trough_date = None
+
+    @staticmethod
+    def _merge(moments, x):
+        """Merge a batch into running (count, mean, sum of squared deviations)"""
+        n, mean, m2 = moments
+        k = len(x)
+        if k == 0:
+            return moments
+        batch_mean = x.mean()
+        delta = batch_mean - mean
+        total = n + k
+        return (total, mean + delta * k / total, m2 + ((x - batch_mean) ** 2).sum() + delta ** 2 * n * k / total)
+
+    def _merge_paired(self, p, m):
+        """Merge a batch of (portfolio, market) return pairs into the running co-moments"""
+        n, mean_p, mean_m, m2_m, c = self.paired
+        k = len(p)
+        if k == 0:
+            return
+        batch_p, batch_m = p.mean(), m.mean()
+        total = n + k
+        weight = n * k / total
+        self.paired = (total,
+                       mean_p + (batch_p - mean_p) * k / total,
+                       mean_m + (batch_m - mean_m) * k / total,
+                       m2_m + ((m - batch_m) ** 2).sum() + (batch_m - mean_m) ** 2 * weight,
+                       c + ((p - batch_p) * (m - batch_m)).sum() + (batch_p - mean_p) * (batch_m - mean_m) * weight)
+
+    def update(self, dates, values, market_values = None):
+        """
+        Add the next chunk of the series
+
+        Args:
+            dates (pd.DatetimeIndex): Dates of the chunk, after every earlier chunk
+            values (np.ndarray): Portfolio values (NaN where it has not started)
+            market_values (np.ndarray): Benchmark values on the same dates (optional)
+        """
+        values = np.asarray(values, dtype = float)
+        keep = ~np.isnan(values)
+        dates, values = dates[keep], values[keep]
+        if len(values) == 0:
+            return
+        market = None
+        if market_values is not None:
+            market = np.asarray(market_values, dtype = float)[keep]
+
+        # Returns across the chunk boundary use the last values of the previous chunk
+        first_chunk = self.last_value is None
+        if first_chunk:
+            self.first_date, self.first_value = dates[0], values[0]
+
+        def returns_of(series, carried):
+            previous = series[:-1] if first_chunk else np.concatenate(([carried], series[:-1]))
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                return series[1 if first_chunk else 0:] / previous - 1
+
+        returns = returns_of(values, self.last_value)
+        self.returns = self._merge(self.returns, returns)
+        self.downside = self._merge(self.downside, returns[returns < 0])
+        self.wins += int((returns > 0).sum())
+
+        if market is not None:
+            if self.first_market is None and not np.isnan(market).all():
+                self.first_market = market[~np.isnan(market)][0]
+            market_returns = returns_of(market, np.nan if self.last_market is None else self.last_market)
+            paired = ~np.isnan(market_returns) & ~np.isnan(returns)
+            self._merge_paired(returns[paired], market_returns[paired])
+            if not np.isnan(market[-1]):
+                self.last_market = market[-1]
+
+        # Drawdown against the running peak, which carries over from earlier chunks
+        previous_peak = np.maximum.accumulate(np.concatenate(([self.peak], values)))[:-1]
+        new_peak = values > previous_peak
+        peak_at = np.maximum.accumulate(np.where(new_peak, np.arange(len(values)), -1))
+        peaks = np.maximum(previous_peak, values)
+        drawdown = values / peaks - 1
+        worst = int(np.argmin(drawdown))
+        if drawdown[worst] < self.max_drawdown:
+            self.max_drawdown = drawdown[worst]
+            self.max_dd_trough_date = dates[worst]
+            self.max_dd_peak_date = dates[peak_at[worst]] if peak_at[worst] >= 0 else self.peak_date
+        if new_peak.any():
+            last_peak = np.flatnonzero(new_peak)[-1]
+            self.peak, self.peak_date = values[last_peak], dates[last_peak]
+
+        self.last_date, self.last_value = dates[-1], values[-1]
+
+    def result(self):
+        """
+        Metrics of everything added so far
+
+        Returns:
+            dict: initial_value, final_value, volatility, sharpe_ratio, sortino_ratio,
+                max_drawdown, max_dd_peak_date, max_dd_trough_date, win_rate, beta and
+                benchmark_total_return (None without market values), annualized
+                with periods_per_year
+        """
+        n, mean, m2 = self.returns
+        std = np.sqrt(m2 / (n - 1)) if n > 1 else np.nan
+        excess = mean - self.risk_free_rate / self.periods_per_year
+        down_n, _, down_m2 = self.downside
+        downside_std = np.sqrt(down_m2 / (down_n - 1)) if down_n > 1 else np.nan
+
+        beta = None
+        benchmark_total_return = None
+        pairs, _, _, m2_m, c = self.paired
+        if pairs > 1:
+            beta = c / m2_m if m2_m > 0 else 0.0
+        if self.first_market is not None and self.last_market is not None:
+            benchmark_total_return = self.last_market / self.first_market - 1
+
+        return {
+            'initial_value': self.first_value,
+            'final_value': self.last_value,
+            'volatility': std * np.sqrt(self.periods_per_year),
+            'sharpe_ratio': 0.0 if std == 0 else excess / std * np.sqrt(self.periods_per_year),
+            'sortino_ratio': 0.0 if downside_std == 0 else excess / downside_std * np.sqrt(self.periods_per_year),
+            'max_drawdown': self.max_drawdown,
+            'max_dd_peak_date': self.max_dd_peak_date,
+            'max_dd_trough_date': self.max_dd_trough_date,
+            'win_rate': self.wins / n if n else 0.0,
+            'beta': beta,
+            'benchmark_total_return': benchmark_total_return
+        }
+
+
 if __name__ == "__main__":
     # Create sample data
     dates = pd.date_range('2023-01-01', '2024-01-01', freq='D')
@@ -248,4 +604,35 @@ if __name__ == "__main__":
     print(f"Volatility: {calc.calculate_volatility(returns):.2%}")
     print(f"Sharpe Ratio: {calc.calculate_sharpe_ratio(returns):.2f}")
     print(f"Max Drawdown: {calc.calculate_max_drawdown(prices)[0]:.2%}")
-    print(f"Win Rate: {calc.calculate_win_ratio(returns):.2%}")
\ No newline at end of file
+    print(f"Win Rate: {calc.calculate_win_ratio(returns):.2%}")
+    # XIRR regression check: every stream must match brentq on the same bracket,
+    # including one whose root sits exactly on a bracket midpoint
+    from scipy.optimize import brentq
+
+    rng = np.random.default_rng(0)
+    flow_dates = pd.bdate_range('2020-01-01', '2024-12-31')
+    n_streams = 3000
+    flows = np.zeros((len(flow_dates), n_streams))
+    for j in range(n_streams):
+        rows = rng.choice(len(flow_dates) - 1, rng.integers(1, 8), replace = False)
+        flows[rows, j] = -rng.uniform(100, 5000, len(rows))
+        flows[-1, j] = -flows[:, j].sum() * np.exp(rng.normal(0.2, 0.8))
+    exact = np.zeros((len(flow_dates), 1))
+    exact[[0, -1], 0] = -1.0, np.exp(0.125 * (flow_dates[-1] - flow_dates[0]).days / 365.0)
+    flows = np.hstack([flows, exact])
+
+    solved = xirr(flows, flow_dates)
+    years = np.asarray((flow_dates - flow_dates[0]).days, dtype = float) / 365.0
+    worst = 0.0
+    for j in range(flows.shape[1]):
+        npv = lambda x: (flows[:, j] * np.exp(-x * years)).sum()
+        grid = np.array([npv(x) for x in XIRR_GRID])
+        changes = np.flatnonzero(np.sign(grid[:-1]) * np.sign(grid[1:]) < 0)
+        if len(changes) == 0:
+            assert np.isnan(solved[j]), "XIRR found a root outside the grid"
+            continue
+        i = changes[np.abs(XIRR_GRID[changes] + XIRR_GRID[changes + 1]).argmin()]
+        expected = np.expm1(brentq(npv, XIRR_GRID[i], XIRR_GRID[i + 1], xtol = 1e-14))
+        worst = max(worst, abs(solved[j] - expected))
+    print(f"XIRR vs brentq, {flows.shape[1]:,} streams: max difference {worst:.1e}")
+    assert worst < 1e-8, "XIRR disagrees with brentq"
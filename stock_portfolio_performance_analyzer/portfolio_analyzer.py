@@ -2,7 +2,12 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from data_fetcher import DataFetcher
+from metric_graph import MetricGraph
 from metrics_calculator import MetricsCalculator
+from portfolio_engine import (DIVIDEND_MODES, RETURN_MODES, account_cash_flows, build_event_matrix, build_fx_matrix,
+                              build_price_matrix, factors_at, parse_purchase_dates, position_offsets,
+                              purchase_positions, total_return_positions, value_positions)
+from profiling import span
 
 class PortfolioAnalyzer:
     """
@@ -21,47 +26,269 @@ class PortfolioAnalyzer:
             'purchase_date': '2023-01-01'
         }
     }
+
+    Metrics are computed lazily: analyzer.metric('sharpe_ratio') computes
+    the returns and the Sharpe ratio, and nothing else, and keeps both until
+    an input they depend on (an attribute such as portfolio_history) is
+    assigned again. analyzer.metrics is the full report.
     """
 
-    def __init__(self, portfolio, benchmark = "^GSPC"):
+    # Metric -> metrics and analyzer attributes it is computed from (see metric_graph.MetricGraph);
+    # each metric is computed by the method _metric_<name>
+    METRIC_GRAPH = MetricGraph({
+        'returns': ('portfolio_history',),
+        'initial_value': ('portfolio_history',),
+        'final_value': ('portfolio_history',),
+        'days': ('portfolio_history',),
+        'years': ('days',),
+        'total_return': ('initial_value', 'final_value'),
+        'annualized_return': ('total_return', 'years'),
+        'time_weighted_return': ('portfolio_history', 'cash_flows', 'calculator'),
+        'annualized_twr': ('time_weighted_return', 'years'),
+        'money_weighted_return': ('portfolio_history', 'cash_flows', 'calculator'),
+        'volatility': ('returns', 'calculator'),
+        'sharpe_ratio': ('returns', 'calculator'),
+        'sortino_ratio': ('returns', 'calculator'),
+        'drawdown': ('portfolio_history',),
+        'max_drawdown': ('drawdown',),
+        'max_dd_peak_date': ('drawdown',),
+        'max_dd_trough_date': ('drawdown',),
+        'win_rate': ('returns',),
+        'benchmark_returns': ('benchmark_data',),
+        'beta': ('returns', 'benchmark_returns'),
+        'benchmark_return': ('benchmark_data', 'years'),
+        'alpha': ('annualized_return', 'beta', 'benchmark_return', 'calculator'),
+        'lot_gains': ('tax_lots', 'current_prices', 'fx'),
+        'realized_gain': ('lot_gains',),
+        'unrealized_gain': ('lot_gains',),
+        'holdings_performance': ('portfolio', 'holdings_data', 'current_prices', 'fx', 'lot_gains', 'final_value'),
+    })
+
+    # Metrics of the performance report, in order
+    REPORT_METRICS = ('initial_value', 'final_value', 'total_return', 'annualized_return', 'time_weighted_return',
+                      'annualized_twr', 'money_weighted_return', 'volatility', 'sharpe_ratio', 'sortino_ratio',
+                      'max_drawdown', 'max_dd_peak_date', 'max_dd_trough_date', 'win_rate', 'beta', 'alpha',
+                      'benchmark_return', 'days', 'years')
+    LOT_METRICS = ('realized_gain', 'unrealized_gain')
+
+    def __init__(self, portfolio, benchmark = "^GSPC", fetcher = None, return_mode = 'price',
+                 dividend_mode = 'reinvest', base_currency = None):
         """
         Args:
             portfolio (dict): Portfolio dictionary
             benchmark (str): Benchmark ticker symbol (default: S&P 500)
+            fetcher (DataFetcher): Data fetcher to use, e.g. one shared between
+                analyzers so they share its price cache (default: a new one)
+            return_mode (str): 'price' values holdings at Yahoo's adjusted closes;
+                'total' values them at split-adjusted closes plus the dividends paid
+                since purchase (see portfolio_engine.total_return_positions)
+            dividend_mode (str): In total-return mode, 'reinvest' dividends at the
+                ex-date close or 'accrue' them as cash
+            base_currency (str): Currency to value the portfolio in, e.g. 'USD'; each
+                holding is converted from its quote currency at the daily FX rate
+                (default: add up prices in their own currencies)
         """
+        if return_mode not in RETURN_MODES:
+            raise ValueError(f"Unknown return mode {return_mode!r}; use one of {', '.join(RETURN_MODES)}")
+        if dividend_mode not in DIVIDEND_MODES:
+            raise ValueError(f"Unknown dividend mode {dividend_mode!r}; use one of {', '.join(DIVIDEND_MODES)}")
+        self._metric_cache = {} # Metric name -> value, until one of its inputs changes
         self.portfolio = portfolio
+        self.return_mode = return_mode
+        self.dividend_mode = dividend_mode
+        self.base_currency = base_currency
         self.benchmark = benchmark
-        self.fetcher = DataFetcher()
+        self.fetcher = fetcher if fetcher is not None else DataFetcher()
         self.calculator = MetricsCalculator()
 
         self.holdings_data = {} # Historical data for each holding
         self.current_prices = {} # Current prices for each holding
         self.stock_info = {} # Stock information
+        self.fx_rates = {} # Quote currency -> rates into the base currency
+        self.fx = None # Conversion factors on the valuation calendar, dates x tickers
 
         self.portfolio_history = None # Portfolio historical value
+        self.cash_flows = None # Money put into the portfolio on each date of its history
         self.benchmark_data = None # Benchmark historical data
 
-        self.metrics = {} # Calculated metrics
+        self.ledger = None # TransactionLedger the portfolio was built from (see from_ledger)
+        self.tax_lots = None # TaxLots of that ledger
+
+    @classmethod
+    def from_ledger(cls, ledger, account = None, lot_method = 'FIFO', benchmark = "^GSPC", fetcher = None,
+                    return_mode = 'price', dividend_mode = 'reinvest', base_currency = None):
+        """
+        Create an analyzer from a transaction ledger
+
+        The portfolio is the open lots after the last transaction: shares held,
+        their average cost and the oldest open lot's date. The value history
+        follows every trade, and each holding reports its realized and
+        unrealized gains under the chosen lot matching rule. Cash-only rows
+        (dividends, deposits, withdrawals, fees) are not valued; a warning
+        lists them (see TransactionLedger.warn_cash_actions).
+
+        Args:
+            ledger (TransactionLedger): Transactions (see ledger.TransactionLedger)
+            account (str): Account to analyze (default: every account as one portfolio)
+            lot_method (str): Lot matching rule: FIFO, LIFO, HIFO or SPECIFIC
+            benchmark (str): Benchmark ticker symbol (default: S&P 500)
+            fetcher (DataFetcher): Data fetcher to use (default: a new one)
+            return_mode (str): 'price' or 'total'
+            dividend_mode (str): 'reinvest' or 'accrue' dividends in total-return mode
+            base_currency (str): Currency to value the portfolio in (optional)
+
+        Returns:
+            PortfolioAnalyzer: The analyzer
+        """
+        from tax_lots import TaxLots
+
+        if account is not None:
+            ledger = ledger.for_account(account)
+        ledger.warn_cash_actions()
+        tax_lots = TaxLots(ledger, method = lot_method)
+
+        open_lots = tax_lots.open_lots.groupby('ticker', sort = False).agg(
+            shares = ('shares', 'sum'), cost = ('cost', 'sum'), first_date = ('buy_date', 'min'))
+        portfolio = {
+            ticker: {
+                'shares': row['shares'],
+                'purchase_price': row['cost'] / row['shares'],
+                'purchase_date': row['first_date'].strftime('%Y-%m-%d')
+            }
+            for ticker, row in open_lots.iterrows()
+        }
+
+        analyzer = cls(portfolio, benchmark = benchmark, fetcher = fetcher, return_mode = return_mode,
+                       dividend_mode = dividend_mode, base_currency = base_currency)
+        analyzer.ledger = ledger
+        analyzer.tax_lots = tax_lots
+        return analyzer
+
+    def return_basis(self):
+        """
+        Short description of how holdings are valued, for reports and charts
+
+        Returns:
+            str: 'Price return' or 'Total return (dividends reinvested/accrued)'
+        """
+        if self.return_mode == 'price':
+            return 'Price return'
+        return f"Total return (dividends {'reinvested' if self.dividend_mode == 'reinvest' else 'accrued'})"
+
+    def __getstate__(self):
+        # The fetcher (and its price cache) may be shared with other analyzers,
+        # so it is not pickled along with the analysis results
+        state = self.__dict__.copy()
+        state['fetcher'] = None
+        return state
+
+    def __setstate__(self, state):
+        # Analyzers pickled before return modes and base currencies existed were valued
+        # on price, in the holdings' own currencies
+        state = {'return_mode': 'price', 'dividend_mode': 'reinvest', 'base_currency': None,
+                 'fx_rates': {}, 'fx': None, '_metric_cache': {}, **state}
+        # Before metrics were lazy they were stored as one dict
+        state['_metric_cache'] = {**state.pop('metrics', {}), **state['_metric_cache']}
+        self.__dict__.update(state)
+        if self.fetcher is None:
+            self.fetcher = DataFetcher()
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        # Assigning an input drops the cached metrics computed from it
+        if name in self.METRIC_GRAPH.inputs and '_metric_cache' in self.__dict__:
+            self.invalidate(name)
+
+    def invalidate(self, *names):
+        """
+        Drop the cached metrics that depend on some inputs or metrics
+
+        Assigning an input attribute does this by itself; call it after
+        changing one in place (e.g. adding to holdings_data or current_prices).
+
+        Args:
+            *names (str): Changed inputs or metrics (none: drop every cached metric)
+        """
+        if not names:
+            self._metric_cache.clear()
+            return
+        for name in self.METRIC_GRAPH.affected(names):
+            self._metric_cache.pop(name, None)
+
+    def metric(self, name):
+        """
+        One metric, computed with its dependencies on first request and then cached
+
+        Args:
+            name (str): Metric name (see METRIC_GRAPH)
+
+        Returns:
+            The metric's value
+        """
+        if name not in self.METRIC_GRAPH.nodes:
+            raise KeyError(f"Unknown metric {name!r}")
+        cache = self._metric_cache
+        if name not in cache:
+            cache[name] = getattr(self, f'_metric_{name}')()
+        return cache[name]
+
+    @property
+    def metrics(self):
+        """
+        Calculated metrics of the performance report
+
+        Returns:
+            dict: Metric name -> value (empty without a portfolio history)
+        """
+        if self.portfolio_history is None or self.portfolio_history.empty:
+            return {}
+        names = self.REPORT_METRICS + (self.LOT_METRICS if self.tax_lots is not None else ())
+        return {name: self.metric(name) for name in names}
+
+    @metrics.setter
+    def metrics(self, values):
+        # Precomputed metrics are served as they are until their inputs change
+        self._metric_cache.update(values)
+
+    def start_dates(self):
+        """
+        First date each ticker's history is needed from
+
+        That is its purchase date or, for a ledger, its first trade (tickers
+        sold off since included).
+
+        Returns:
+            dict: Ticker -> "YYYY-MM-DD"
+        """
+        if self.ledger is not None:
+            trades = self.ledger.position_changes()
+            first_trades = trades.groupby('ticker', sort = False)['purchase_date'].min()
+            return first_trades.dt.strftime('%Y-%m-%d').to_dict()
+        return {ticker: holding["purchase_date"] for ticker, holding in self.portfolio.items()}
+
+    def _fetch_history(self, ticker, start_date, end_date, auto_adjust = True):
+        """Daily history of one ticker or the benchmark (subclasses may reuse stored data)"""
+        return self.fetcher.fetch_stock_data(ticker, start_date = start_date, end_date = end_date,
+                                             auto_adjust = auto_adjust)
 
     def fetch_all_data(self):
         """ Fetch all data for portfolio and benchmark """
         print("Fetching data...")
+        start_dates = self.start_dates()
 
         # Find the first purchase date
-        earliest_date = min([holding["purchase_date"] for holding in self.portfolio.values()])
+        earliest_date = min(start_dates.values())
         current_date = datetime.now().strftime("%Y-%m-%d")
         print(f"\nDate range: {earliest_date} to {current_date}")
+        # Total return is built from the dividends and splits, on closes not yet adjusted for dividends
+        auto_adjust = self.return_mode == 'price'
 
         # Fetch data for each holding in the portfolio
-        for ticker, holding in self.portfolio.items():
+        for ticker, start_date in start_dates.items():
             print(f"\n Reading {ticker}...")
             
             # Fetch historical data
-            df = self.fetcher.fetch_stock_data(
-                ticker, 
-                start_date = holding["purchase_date"], 
-                end_date = current_date
-                )
+            df = self._fetch_history(ticker, start_date, current_date, auto_adjust = auto_adjust)
 
             if not df.empty: 
                 self.holdings_data[ticker] = df
@@ -79,149 +306,229 @@ class PortfolioAnalyzer:
             else:
                 print(f" No data for {ticker}")
 
+        # Rates for every quote currency, each pair fetched once
+        if self.base_currency is not None:
+            currencies = {info['currency'] for info in self.stock_info.values()}
+            self.fx_rates = self.fetcher.fetch_fx_rates(currencies, self.base_currency, earliest_date, current_date)
+
         # Fetch benchmark data
         print(f"\n Reading benchmark {self.benchmark}...")
-        self.benchmark_data = self.fetcher.fetch_stock_data(
-            self.benchmark, 
-            start_date = earliest_date,
-            end_date = current_date
-        )
+        self.benchmark_data = self._fetch_history(self.benchmark, earliest_date, current_date)
 
         # Check the benchmark data
         if not self.benchmark_data.empty:
             print(f" Fetched {len(self.benchmark_data)} days for benchmark")
         else:
             print(f" No data for benchmark {self.benchmark}")
+        self.invalidate('holdings_data', 'current_prices')
         print("\nData fetching complete.")
 
     def calculate_portfolio_value_history(self):
-        """ Calculate the historical value of the portfolio """
-
-        # Build a date range
-        all_dates = set()
-        for df in self.holdings_data.values():
-            all_dates.update(df.index)
-
-        all_dates = sorted(all_dates)
-
-        portfolio_values = pd.Series(index = all_dates, dtype = float)
-
-        # Calculate portfolio value in each date
-        for date in all_dates:
-            total_value = 0.0
-
-            for ticker, holding in self.portfolio.items():
-                if ticker not in self.holdings_data:
-                    continue
-
-                df = self.holdings_data[ticker]
-
-                purchase_date = pd.to_datetime(holding["purchase_date"]).tz_localize(date.tz)
-                # To avoid using data before purchase date
-                if date < purchase_date:
-                    continue
-                # Retrieve price on the date or the closest previous date
-                if date in df.index:
-                    price = df.loc[date, "Close"]
-                else: 
-                    available_prices = df.loc[:date, 'Close']
-                    if not available_prices.empty:
-                        price = available_prices.iloc[-1]
-                    else:
-                        continue
-
-                # Add the value of the holding to total value
-                value = holding["shares"] * price
-                total_value = total_value + value
-
-            portfolio_values[date] = total_value
+        """
+        Calculate the historical value of the portfolio
+
+        Prices are aligned on the union of the holdings' trading dates (carrying
+        the last available price forward), and each holding counts from its
+        purchase date on. The portfolio is valued as a one-account case of the
+        multi-portfolio engine; a ledger's trades are valued as signed positions,
+        so sells reduce the holdings from their trade date on.
+
+        In total-return mode the price matrix also carries the dividends paid
+        (reinvested or accrued) and each holding's shares follow later splits.
+        With a base currency, prices are converted by one element-wise multiply
+        with the aligned FX matrix, and purchase prices at their date's rate.
+        """
+        if self.ledger is not None:
+            holdings = self.ledger.position_changes()
+        else:
+            holdings = pd.DataFrame([(ticker, holding["shares"], holding["purchase_price"], holding["purchase_date"])
+                                     for ticker, holding in self.portfolio.items()],
+                                    columns = ['ticker', 'shares', 'purchase_price', 'purchase_date'])
+        holdings = parse_purchase_dates(holdings)
+        holdings = holdings[holdings['ticker'].isin(list(self.holdings_data))]
+        prices = build_price_matrix({ticker: self.holdings_data[ticker] for ticker in pd.unique(holdings['ticker'])})
+        if prices.empty:
+            self.portfolio_history = pd.Series(dtype = float)
+            print("Portfolio history value calculated (0 days)")
+            return
+
+        fx = 1.0
+        self.fx = None
+        if self.base_currency is not None:
+            currencies = {ticker: self.stock_info[ticker]['currency'] for ticker in prices.columns}
+            fx = build_fx_matrix(self.fx_rates, currencies, prices)
+            self.fx = pd.DataFrame(fx, index = prices.index, columns = prices.columns)
+            prices = prices * fx
+            holdings = holdings.assign(purchase_price = self._to_base(holdings['ticker'], holdings['purchase_date'],
+                                                                      holdings['purchase_price']))
+
+        units = holdings['shares']
+        if self.return_mode == 'total':
+            histories = {ticker: self.holdings_data[ticker] for ticker in prices.columns}
+            prices, holdings = total_return_positions(
+                prices, build_event_matrix(histories, 'Dividends', prices) * fx,
+                build_event_matrix(histories, 'Stock Splits', prices), holdings, self.dividend_mode)
+            units = holdings['units']
+
+        start_pos = purchase_positions(prices.index, holdings['purchase_date'])
+        account_idx = np.zeros(len(holdings), dtype = int)
+        values = value_positions(
+            prices,
+            account_idx = account_idx,
+            ticker_idx = prices.columns.get_indexer(holdings['ticker']),
+            shares = units.to_numpy(dtype = float),
+            start_pos = start_pos,
+            n_accounts = 1
+        )
+        if self.return_mode == 'total':
+            values -= position_offsets(len(prices.index), account_idx, start_pos, holdings['offset'].to_numpy(), 1)
+
+        portfolio_values = pd.Series(values[:, 0], index = prices.index, dtype = float)
         # Filter out NaN values
         self.portfolio_history = portfolio_values.dropna()
+        # Purchases (and a ledger's sales) are external flows for the time- and money-weighted returns
+        flows = account_cash_flows(prices.index, holdings.assign(account = 0), [0], prices)[0]
+        self.cash_flows = flows.reindex(self.portfolio_history.index, fill_value = 0.0)
         print(f"Portfolio history value calculated ({len(self.portfolio_history)} days)")
 
     def calculate_metrics(self):
         """
         Calculate all profolio performance metrics
+
+        Each metric is cached (see metric), so reports and charts that ask for
+        them again afterwards reuse these values.
+
+        Returns:
+            dict: The report's metrics (see metrics)
         """
 
         if self.portfolio_history is None or self.portfolio_history.empty:
             print("No portfolio history available.")
             return
-        
-        portfolio_returns = self.calculator.calculate_returns(self.portfolio_history)
-
-        initial_value = self.portfolio_history.iloc[0]
-        final_value = self.portfolio_history.iloc[-1]
-
-        # Get the number of days and years
-        days = (self.portfolio_history.index[-1] - self.portfolio_history.index[0]).days
-        years = days / 365.25
-
-        # Calculate total and annualized return
-        total_return = self.calculator.calculate_total_return(initial_value, final_value)
-        annualized_return = self.calculator.calculate_annualized_return(total_return, years)
-
-        # Calculate volatility, Sharpe ratio, Sortino ratio
-        volatility = self.calculator.calculate_volatility(portfolio_returns)
-        sharpe_ratio = self.calculator.calculate_sharpe_ratio(portfolio_returns)
-        sortino_ratio = self.calculator.calculate_sortino_ratio(portfolio_returns)
-
-        # Drawdown calculations and downside risk
-        max_drawdown, peak_date, bottom_date = self.calculator.calculate_max_drawdown(self.portfolio_history)
-
-        # Win ratio calculation
-        win_ratio = self.calculator.calculate_win_ratio(portfolio_returns)
-
-        if self.benchmark_data is not None and not self.benchmark_data.empty:
-            benchmark_returns = self.calculator.calculate_returns(self.benchmark_data['Close'])
-            beta = self.calculator.calculate_beta(portfolio_returns, benchmark_returns)
-
-            # Benchmark return and annualized return
-            benchmark_total_return = self.calculator.calculate_total_return(
-                self.benchmark_data['Close'].iloc[0],
-                self.benchmark_data['Close'].iloc[-1]
-            )
-            benchmark_annualized_return = self.calculator.calculate_annualized_return(
-                benchmark_total_return,
-                years
-            )
-            # Alpha of the portfolio
-            alpha = self.calculator.calculate_alpha(
-                annualized_return,
-                beta,
-                benchmark_annualized_return
-            )
-        else: 
-            alpha = None
-            beta = None
-            benchmark_annualized_return = None
-        
-        # Store all metrics
-        self.metrics = {
-            'initial_value': initial_value,
-            'final_value': final_value,
-            'total_return': total_return,
-            'annualized_return': annualized_return,
-            'volatility': volatility,
-            'sharpe_ratio': sharpe_ratio,
-            'sortino_ratio': sortino_ratio,
-            'max_drawdown': max_drawdown,
-            'max_dd_peak_date': peak_date,
-            'max_dd_trough_date': bottom_date,
-            'win_rate': win_ratio,
-            'beta': beta,
-            'alpha': alpha,
-            'benchmark_return': benchmark_annualized_return,
-            'days': days,
-            'years': years
-        }
+        # Every metric of the report, each computed once and cached
+        metrics = self.metrics
         print("Metrics calculation complete.")
+        return metrics
+
+    def _metric_returns(self):
+        return self.calculator.calculate_returns(self.portfolio_history)
+
+    def _metric_initial_value(self):
+        return self.portfolio_history.iloc[0] if len(self.portfolio_history) else None
+
+    def _metric_final_value(self):
+        return self.portfolio_history.iloc[-1] if len(self.portfolio_history) else None
+
+    def _metric_days(self):
+        return (self.portfolio_history.index[-1] - self.portfolio_history.index[0]).days
+
+    def _metric_years(self):
+        return self.metric('days') / 365.25
+
+    def _metric_total_return(self):
+        return self.calculator.calculate_total_return(self.metric('initial_value'), self.metric('final_value'))
+
+    def _metric_annualized_return(self):
+        return self.calculator.calculate_annualized_return(self.metric('total_return'), self.metric('years'))
+
+    # Returns net of purchases and sales made after the start
+    def _metric_time_weighted_return(self):
+        if self.cash_flows is None:
+            return None
+        return self.calculator.calculate_time_weighted_return(self.portfolio_history, self.cash_flows)
+
+    def _metric_annualized_twr(self):
+        time_weighted_return = self.metric('time_weighted_return')
+        if time_weighted_return is None:
+            return None
+        return self.calculator.calculate_annualized_return(time_weighted_return, self.metric('years'))
+
+    def _metric_money_weighted_return(self):
+        if self.cash_flows is None:
+            return None
+        return self.calculator.calculate_money_weighted_return(self.portfolio_history, self.cash_flows)
+
+    def _metric_volatility(self):
+        return self.calculator.calculate_volatility(self.metric('returns'))
+
+    def _metric_sharpe_ratio(self):
+        return self.calculator.calculate_sharpe_ratio(self.metric('returns'))
+
+    def _metric_sortino_ratio(self):
+        return self.calculator.calculate_sortino_ratio(self.metric('returns'))
+
+    # Drawdown calculations and downside risk: (max drawdown, peak date, trough date)
+    def _metric_drawdown(self):
+        return self.calculator.calculate_max_drawdown(self.portfolio_history)
+
+    def _metric_max_drawdown(self):
+        return self.metric('drawdown')[0]
+
+    def _metric_max_dd_peak_date(self):
+        return self.metric('drawdown')[1]
+
+    def _metric_max_dd_trough_date(self):
+        return self.metric('drawdown')[2]
+
+    def _metric_win_rate(self):
+        return self.calculator.calculate_win_ratio(self.metric('returns'))
+
+    def _metric_benchmark_returns(self):
+        if self.benchmark_data is None or self.benchmark_data.empty:
+            return None
+        return self.calculator.calculate_returns(self.benchmark_data['Close'])
+
+    def _metric_beta(self):
+        benchmark_returns = self.metric('benchmark_returns')
+        if benchmark_returns is None:
+            return None
+        return self.calculator.calculate_beta(self.metric('returns'), benchmark_returns)
+
+    # Annualized benchmark return over the portfolio's period
+    def _metric_benchmark_return(self):
+        if self.benchmark_data is None or self.benchmark_data.empty:
+            return None
+        benchmark_total_return = self.calculator.calculate_total_return(
+            self.benchmark_data['Close'].iloc[0],
+            self.benchmark_data['Close'].iloc[-1]
+        )
+        return self.calculator.calculate_annualized_return(benchmark_total_return, self.metric('years'))
+
+    def _metric_alpha(self):
+        beta = self.metric('beta')
+        benchmark_return = self.metric('benchmark_return')
+        if beta is None or benchmark_return is None:
+            return None
+        return self.calculator.calculate_alpha(self.metric('annualized_return'), beta, benchmark_return)
+
+    def _metric_lot_gains(self):
+        return self._lot_gains() if self.tax_lots is not None else None
+
+    def _metric_realized_gain(self):
+        lot_gains = self.metric('lot_gains')
+        return lot_gains['realized_gain'].sum() if lot_gains is not None else None
+
+    def _metric_unrealized_gain(self):
+        lot_gains = self.metric('lot_gains')
+        return lot_gains['unrealized_gain'].sum() if lot_gains is not None else None
 
     def calculate_each_holding_performance(self):
-        """Calculate performance metrics for each holding"""
+        """
+        Performance metrics for each holding (cached, see metric)
 
+        Returns:
+            dict: Ticker -> performance (shares, prices, invested, current value,
+                gain/loss, returns, days held, portfolio weight and lot gains)
+        """
+        return self.metric('holdings_performance')
+
+    def _metric_holdings_performance(self):
         holdings_performance = { }
 
+        # Realized and unrealized gains per ticker from the tax lots (ledger portfolios only)
+        lot_gains = self.metric('lot_gains')
+        final_value = self.metric('final_value') if self.portfolio_history is not None else None
+
         for ticker, holding in self.portfolio.items():
             if ticker not in self.holdings_data or ticker not in self.current_prices:
                 continue
@@ -230,8 +537,11 @@ class PortfolioAnalyzer:
             shares = holding["shares"]
             purchase_price = holding["purchase_price"]
             purchase_date = holding["purchase_date"]
-            # Get current price
+            # Get current price (both in the base currency when there is one)
             current_price = self.current_prices[ticker]
+            if self.fx is not None:
+                purchase_price = self._to_base([ticker], [purchase_date], [purchase_price])[0]
+                current_price = self._to_base([ticker], [datetime.now()], [current_price])[0]
 
             # Calculate returns
             purchase_value = shares * purchase_price
@@ -260,56 +570,157 @@ class PortfolioAnalyzer:
                 'total_return': total_return,
                 'annualized_return': annualized_return,
                 'days_held': holding_days,
-                'weight': current_value / self.metrics['final_value'] if 'final_value' in self.metrics else 0
+                'weight': current_value / final_value if final_value else 0
             }
+            if lot_gains is not None and ticker in lot_gains.index:
+                holdings_performance[ticker]['realized_gain'] = lot_gains.at[ticker, 'realized_gain']
+                holdings_performance[ticker]['unrealized_gain'] = lot_gains.at[ticker, 'unrealized_gain']
         return holdings_performance
     
-    def print_performance_summary(self): 
-        """ *** Print a summary of portfolio performance metrics *** """
-        if not self.metrics:
+    def _to_base(self, tickers, dates, amounts):
+        """
+        Convert quote-currency amounts to the base currency at each date's rate
+
+        Args:
+            tickers (array-like): Ticker of each amount
+            dates (array-like): Date of each amount (past the history: the latest rate)
+            amounts (array-like): Amounts in the tickers' quote currencies
+
+        Returns:
+            np.ndarray: The amounts in the base currency (unchanged without one)
+        """
+        amounts = np.asarray(amounts, dtype = float)
+        if self.fx is None or self.fx.empty:
+            return amounts
+        return amounts * factors_at(self.fx.to_numpy(), self.fx.index, self.fx.columns, tickers, dates)
+
+    def _lot_gains(self):
+        """
+        Realized and unrealized tax-lot gains per ticker
+
+        With a base currency, costs are converted at their buy dates' rates,
+        proceeds at their sell dates' rates and open lots at the latest rate,
+        so gains include the currency's move.
+
+        Returns:
+            pd.DataFrame: realized_gain and unrealized_gain, indexed by ticker
+        """
+        if self.fx is None:
+            return self.tax_lots.holdings(self.current_prices).groupby('ticker')[
+                ['realized_gain', 'unrealized_gain']].sum()
+
+        realized = self.tax_lots.realized
+        lots = self.tax_lots.unrealized(self.current_prices)
+        realized_gain = (self._to_base(realized['ticker'], realized['sell_date'], realized['proceeds'])
+                         - self._to_base(realized['ticker'], realized['buy_date'], realized['cost']))
+        unrealized_gain = (self._to_base(lots['ticker'], [datetime.now()] * len(lots), lots['value'])
+                           - self._to_base(lots['ticker'], lots['buy_date'], lots['cost']))
+        gains = pd.concat([
+            pd.DataFrame({'ticker': realized['ticker'].to_numpy(), 'realized_gain': realized_gain,
+                          'unrealized_gain': 0.0}),
+            pd.DataFrame({'ticker': lots['ticker'].to_numpy(), 'realized_gain': 0.0,
+                          'unrealized_gain': unrealized_gain})])
+        return gains.groupby('ticker').sum(min_count = 1).fillna({'realized_gain': 0.0})
+
+    def get_top_holdings(self, holdings_perf = None, top_n = None):
+        """
+        Sort holdings by current value and roll up everything past the top N
+
+        Args:
+            holdings_perf (dict): Output of calculate_each_holding_performance (computed if None)
+            top_n (int): Number of holdings to keep (default: all)
+
+        Returns:
+            tuple: (list of (ticker, performance) largest first,
+                    'others' roll-up dict or None when nothing was rolled up)
+        """
+        if holdings_perf is None:
+            holdings_perf = self.calculate_each_holding_performance()
+
+        ranked = sorted(holdings_perf.items(), 
+                        key = lambda x: x[1]['current_value'], 
+                        reverse = True)
+
+        if top_n is None or len(ranked) <= top_n:
+            return ranked, None
+
+        rest = ranked[top_n:]
+        invested = sum(perf['invested'] for _, perf in rest)
+        current_value = sum(perf['current_value'] for _, perf in rest)
+        others = {
+            'count': len(rest),
+            'invested': invested,
+            'current_value': current_value,
+            'gain_loss': current_value - invested,
+            'total_return': current_value / invested - 1 if invested else 0.0,
+            'weight': sum(perf['weight'] for _, perf in rest)
+        }
+        if self.tax_lots is not None:
+            others['realized_gain'] = sum(perf.get('realized_gain', 0.0) for _, perf in rest)
+            others['unrealized_gain'] = sum(perf.get('unrealized_gain', 0.0) for _, perf in rest)
+        return ranked[:top_n], others
+
+    def print_performance_summary(self, top_n = 25): 
+        """
+        *** Print a summary of portfolio performance metrics ***
+
+        Args:
+            top_n (int): Largest holdings to list individually, the rest are rolled
+                up into one line (None: list every holding)
+        """
+        metrics = self.metrics
+        if not metrics:
             print("No metrics calculated.")
             return
 
         # Portfolio overview
         print(f"\n{'PORTFOLIO OVERVIEW':-^50}")
-        print(f"Initial Value:        ${self.metrics['initial_value']:>15,.4f}")
-        print(f"Current Value:        ${self.metrics['final_value']:>15,.4f}")
-        print(f"Gain/Loss:            ${self.metrics['final_value'] - self.metrics['initial_value']:>15,.4f}")
-        print(f"Time Period:          {self.metrics['days']:>15} days ({self.metrics['years']:.4f} years)")
+        print(f"Initial Value:        ${metrics['initial_value']:>15,.4f}")
+        print(f"Current Value:        ${metrics['final_value']:>15,.4f}")
+        print(f"Gain/Loss:            ${metrics['final_value'] - metrics['initial_value']:>15,.4f}")
+        print(f"Time Period:          {metrics['days']:>15} days ({metrics['years']:.4f} years)")
+        print(f"Valuation:            {self.return_basis():>15}")
+        if self.base_currency is not None:
+            print(f"Currency:             {self.base_currency:>15}")
+        if 'realized_gain' in metrics:
+            print(f"Realized Gain:        ${metrics['realized_gain']:>15,.4f} ({self.tax_lots.method})")
+            print(f"Unrealized Gain:      ${metrics['unrealized_gain']:>15,.4f}")
 
         # Returns
         print(f"\n{'RETURNS':-^50}")
-        print(f"Total Return:         {self.metrics['total_return']:>15.4%}")
-        print(f"Annualized Return:    {self.metrics['annualized_return']:>15.4%}")
-
-        if self.metrics['benchmark_return'] is not None:
-            print(f"Benchmark Return:     {self.metrics['benchmark_return']:>15.4%}")
-            excess_return = self.metrics['annualized_return'] - self.metrics['benchmark_return']
+        print(f"Total Return:         {metrics['total_return']:>15.4%}")
+        print(f"Annualized Return:    {metrics['annualized_return']:>15.4%}")
+        if metrics.get('time_weighted_return') is not None:
+            print(f"Time-Weighted Return: {metrics['time_weighted_return']:>15.4%}")
+            print(f"  Annualized:         {metrics['annualized_twr']:>15.4%}")
+            print(f"Money-Weighted (IRR): {metrics['money_weighted_return']:>15.4%}")
+
+        if metrics['benchmark_return'] is not None:
+            print(f"Benchmark Return:     {metrics['benchmark_return']:>15.4%}")
+            excess_return = metrics['annualized_return'] - metrics['benchmark_return']
             print(f"Excess Return:        {excess_return:>15.4%}")
 
         # Risk metrics
         print(f"\n{'RISK METRICS':-^50}")
-        print(f"Volatility:           {self.metrics['volatility']:>15.4%}")
-        print(f"Sharpe Ratio:         {self.metrics['sharpe_ratio']:>15.4f}")
-        print(f"Sortino Ratio:        {self.metrics['sortino_ratio']:>15.4f}")
-        print(f"Max Drawdown:         {self.metrics['max_drawdown']:>15.4%}")
-        print(f"  Peak Date:          {self.metrics['max_dd_peak_date'].strftime('%Y-%m-%d'):>15}")
-        print(f"  Trough Date:        {self.metrics['max_dd_trough_date'].strftime('%Y-%m-%d'):>15}")
-        print(f"Win Rate:             {self.metrics['win_rate']:>15.4%}")
-
-        if self.metrics['beta'] is not None:
+        print(f"Volatility:           {metrics['volatility']:>15.4%}")
+        print(f"Sharpe Ratio:         {metrics['sharpe_ratio']:>15.4f}")
+        print(f"Sortino Ratio:        {metrics['sortino_ratio']:>15.4f}")
+        print(f"Max Drawdown:         {metrics['max_drawdown']:>15.4%}")
+        print(f"  Peak Date:          {metrics['max_dd_peak_date'].strftime('%Y-%m-%d'):>15}")
+        print(f"  Trough Date:        {metrics['max_dd_trough_date'].strftime('%Y-%m-%d'):>15}")
+        print(f"Win Rate:             {metrics['win_rate']:>15.4%}")
+
+        if metrics['beta'] is not None:
             print(f"\n{'MARKET SENSITIVITY':-^50}")
-            print(f"Beta:                 {self.metrics['beta']:>15.4f}")
-            if self.metrics['alpha'] is not None:
-                print(f"Alpha:                {self.metrics['alpha']:>15.4%}")
+            print(f"Beta:                 {metrics['beta']:>15.4f}")
+            if metrics['alpha'] is not None:
+                print(f"Alpha:                {metrics['alpha']:>15.4%}")
         
         # Individual holdings
         print(f"\n{'INDIVIDUAL HOLDINGS':-^50}")
-        holdings_perf = self.calculate_each_holding_performance()
+        top_holdings, others = self.get_top_holdings(top_n = top_n)
         
-        for ticker, perf in sorted(holdings_perf.items(), 
-                                   key=lambda x: x[1]['current_value'], 
-                                   reverse=True):
+        for ticker, perf in top_holdings:
             print(f"\n{ticker} - {self.stock_info.get(ticker, {}).get('name', ticker)}")
             print(f"  Shares:             {perf['shares']:>15,.0f}")
             print(f"  Purchase Price:     ${perf['purchase_price']:>15,.4f}")
@@ -317,12 +728,25 @@ class PortfolioAnalyzer:
             print(f"  Invested:           ${perf['invested']:>15,.4f}")
             print(f"  Current Value:      ${perf['current_value']:>15,.4f}")
             print(f"  Gain/Loss:          ${perf['gain_loss']:>15,.4f}")
+            if 'realized_gain' in perf:
+                print(f"  Realized Gain:      ${perf['realized_gain']:>15,.4f}")
             print(f"  Total Return:       {perf['total_return']:>15.4%}")
             print(f"  Portfolio Weight:   {perf['weight']:>15.4%}")
 
+        if others is not None:
+            print(f"\nOthers ({others['count']:,} holdings)")
+            print(f"  Invested:           ${others['invested']:>15,.4f}")
+            print(f"  Current Value:      ${others['current_value']:>15,.4f}")
+            print(f"  Gain/Loss:          ${others['gain_loss']:>15,.4f}")
+            print(f"  Total Return:       {others['total_return']:>15.4%}")
+            print(f"  Portfolio Weight:   {others['weight']:>15.4%}")
+
     def run_analysis(self):
         """Run complete portfolio analysis"""
-        self.fetch_all_data()
-        self.calculate_portfolio_value_history()
-        self.calculate_metrics()
+        with span('fetch'):
+            self.fetch_all_data()
+        with span('valuation'):
+            self.calculate_portfolio_value_history()
+        with span('metrics'):
+            self.calculate_metrics()
         self.print_performance_summary()
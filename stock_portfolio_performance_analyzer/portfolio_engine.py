@@ -0,0 +1,794 @@
+import pandas as pd
+import numpy as np
+from scipy import sparse
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+from data_fetcher import DataFetcher
+from metrics_calculator import TRADING_DAYS, MetricsCalculator, time_weighted_returns, xirr
+from shared_prices import SharedPriceMatrix
+from trading_calendar import TradingCalendar
+
+RETURN_MODES = ('price', 'total')
+DIVIDEND_MODES = ('reinvest', 'accrue')
+
+
+def build_price_matrix(histories, column = 'Close', calendar = None):
+    """
+    Align many price histories on one calendar
+
+    The calendar is the union of every history's dates. Each ticker's price on
+    a date is its last valid bar on or before it (see TradingCalendar); dates
+    before its first bar stay NaN.
+
+    Args:
+        histories (dict): Ticker -> historical data (pd.DataFrame with a Close column)
+        column (str): Price column to use
+        calendar (TradingCalendar): Calendar to align on (default: the union of the
+            histories' dates); its as-of positions are filled in per ticker
+
+    Returns:
+        pd.DataFrame: Prices, dates x tickers
+    """
+    if not any(df is not None and not df.empty for df in histories.values()):
+        return pd.DataFrame()
+    if calendar is None:
+        calendar = TradingCalendar.from_histories(histories)
+    return calendar.price_matrix(histories, column)
+
+
+def build_event_matrix(histories, column, prices):
+    """
+    Align a per-date event column (Dividends, Stock Splits) with a price matrix
+
+    Args:
+        histories (dict): Ticker -> historical data
+        column (str): Event column to use
+        prices (pd.DataFrame): Price matrix whose dates and tickers to match
+
+    Returns:
+        pd.DataFrame: Event amounts, dates x tickers (0 where there is none)
+    """
+    return TradingCalendar(prices.index).event_matrix(histories, column, prices.columns)
+
+
+def total_return_positions(prices, dividends, splits, positions, dividend_mode = 'reinvest'):
+    """
+    Turn a split-adjusted price matrix and a positions table into total-return terms
+
+    Shares and purchase prices are taken as of the purchase date, while the
+    prices are adjusted for every later split, so each position's shares are
+    scaled by the splits after its purchase. Dividends are then either
+        reinvest: bought back at the ex-date close, i.e. the price matrix is
+                  multiplied by each ticker's cumulative growth
+                  prod(1 + dividend / close), and a position holds
+                  shares / growth-at-purchase units of it;
+        accrue:   kept as cash, i.e. the price matrix gains each ticker's
+                  cumulative dividends per share, and a position's value is
+                  offset by the dividends paid before its purchase.
+    Both are element-wise over the aligned matrices; valuation stays a
+    sparse holdings matrix times one price matrix.
+
+    Args:
+        prices (pd.DataFrame): Closes adjusted for splits only, dates x tickers
+        dividends (pd.DataFrame): Dividends per (split-adjusted) share, same shape
+        splits (pd.DataFrame): Split ratios on their dates (0 elsewhere), same shape
+        positions (pd.DataFrame): Positions with ticker, shares and purchase_date columns
+        dividend_mode (str): 'reinvest' or 'accrue'
+
+    Returns:
+        tuple: (total-return price matrix, positions with 'units' (shares in that
+            matrix) and 'offset' (value to subtract from the purchase date on) columns)
+    """
+    if dividend_mode not in DIVIDEND_MODES:
+        raise ValueError(f"Unknown dividend mode {dividend_mode!r}; use one of {', '.join(DIVIDEND_MODES)}")
+
+    if prices.empty:
+        return prices, positions.assign(units = positions['shares'].astype(float), offset = 0.0)
+
+    close = prices.to_numpy(dtype = float)
+    n_dates = len(prices.index)
+    ticker_idx = prices.columns.get_indexer(positions['ticker'])
+    known = ticker_idx >= 0
+    start_pos = purchase_positions(prices.index, positions['purchase_date'])
+    row = np.minimum(start_pos, n_dates - 1)
+    col = np.where(known, ticker_idx, 0)
+
+    # Log split ratios strictly after each date, summed from the end
+    log_split = np.log(np.where(splits.to_numpy(dtype = float) > 0, splits.to_numpy(dtype = float), 1.0))
+    later_splits = np.vstack([np.cumsum(log_split[::-1], axis = 0)[::-1][1:], np.zeros((1, close.shape[1]))])
+    units = positions['shares'].to_numpy(dtype = float) * np.where(known, np.exp(later_splits[row, col]), 1.0)
+
+    paid = np.nan_to_num(dividends.to_numpy(dtype = float))
+    if dividend_mode == 'reinvest':
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            dividend_yield = np.nan_to_num(paid / close, nan = 0.0, posinf = 0.0)
+        growth = np.cumprod(1 + dividend_yield, axis = 0)
+        total = close * growth
+        units = units / np.where(known, growth[row, col], 1.0)
+        offset = np.zeros(len(units))
+    else:
+        paid = np.cumsum(paid, axis = 0)
+        total = close + paid
+        offset = np.where(known, units * paid[row, col], 0.0)
+
+    positions = positions.assign(units = units, offset = offset)
+    return pd.DataFrame(total, index = prices.index, columns = prices.columns), positions
+
+
+def position_offsets(n_dates, account_idx, start_pos, offset, n_accounts):
+    """
+    Per-account sums of constant position offsets, each counted from its start date on
+
+    Args:
+        n_dates (int): Calendar length
+        account_idx (np.ndarray): Account index of each position
+        start_pos (np.ndarray): First calendar position of each position
+        offset (np.ndarray): Offset of each position
+        n_accounts (int): Number of accounts
+
+    Returns:
+        np.ndarray: Offsets, dates x accounts
+    """
+    keep = np.asarray(start_pos) < n_dates
+    cells = np.asarray(start_pos)[keep] * n_accounts + np.asarray(account_idx)[keep]
+    offsets = np.bincount(cells, weights = np.asarray(offset, dtype = float)[keep], minlength = n_dates * n_accounts)
+    return np.cumsum(offsets.reshape(n_dates, n_accounts), axis = 0)
+
+
+def build_fx_matrix(fx_rates, currencies, prices):
+    """
+    Base-currency conversion factors aligned with a price matrix
+
+    Each currency's rates are taken as of every price date: the last rate on
+    or before that calendar day (the first rate for days before the series),
+    compared by date since exchanges and FX quotes use different time zones.
+    Converting is then one element-wise multiply, prices * factors.
+
+    Args:
+        fx_rates (dict): Currency -> base units per unit, a pd.Series over dates or
+            a constant (see DataFetcher.fetch_fx_rates)
+        currencies (dict): Ticker -> quote currency
+        prices (pd.DataFrame): Price matrix to match, dates x tickers
+
+    Returns:
+        np.ndarray: Factors, dates x tickers (1 where a currency has no rate)
+    """
+    calendar = TradingCalendar(prices.index)
+    codes, unique = pd.factorize(pd.Series(currencies, dtype = object).reindex(prices.columns))
+    # One column per currency plus a last column of ones, which code -1 (no currency) selects
+    table = np.ones((len(calendar), len(unique) + 1))
+    for j, currency in enumerate(unique):
+        rate = fx_rates.get(currency)
+        if isinstance(rate, pd.Series):
+            rate = rate.dropna().sort_index()
+            if rate.empty:
+                continue
+            pos = calendar.asof_positions(rate.index, by_day = True)
+            table[:, j] = rate.to_numpy()[np.clip(pos, 0, len(rate) - 1)]
+        elif rate is not None:
+            table[:, j] = rate
+    return table[:, codes]
+
+
+def factors_at(factors, calendar, columns, tickers, dates):
+    """
+    Look up per-ticker factors (e.g. from build_fx_matrix) on given dates
+
+    Args:
+        factors (np.ndarray): Factors, dates x tickers
+        calendar (pd.DatetimeIndex): Dates of the factor rows
+        columns (pd.Index): Tickers of the factor columns
+        tickers (array-like): Ticker of each lookup
+        dates (array-like): Date of each lookup; the first calendar date on or
+            after it is used (the last one for dates past the calendar)
+
+    Returns:
+        np.ndarray: One factor per lookup (1 for tickers not in columns)
+    """
+    col = columns.get_indexer(pd.Index(tickers))
+    row = np.clip(purchase_positions(calendar, dates), 0, len(calendar) - 1)
+    return np.where(col >= 0, factors[row, np.maximum(col, 0)], 1.0)
+
+
+def parse_purchase_dates(positions):
+    """
+    Parse a positions table's purchase dates once
+
+    Every valuation step maps purchase dates to calendar positions; with a
+    datetime64 column that is a plain searchsorted, with strings each step
+    would parse every date again.
+
+    Args:
+        positions (pd.DataFrame): Positions with a purchase_date column
+
+    Returns:
+        pd.DataFrame: The positions with a datetime64 purchase_date column
+    """
+    if pd.api.types.is_datetime64_any_dtype(positions['purchase_date']):
+        return positions
+    return positions.assign(purchase_date = pd.to_datetime(positions['purchase_date']))
+
+
+def purchase_positions(calendar, purchase_dates):
+    """
+    Map purchase dates to the first calendar position on or after each of them
+
+    Args:
+        calendar (pd.DatetimeIndex): Valuation dates
+        purchase_dates (array-like): Purchase dates (a datetime64 column, see
+            parse_purchase_dates, or strings and timestamps)
+
+    Returns:
+        np.ndarray: Calendar positions (len(calendar) if after the last date)
+    """
+    return TradingCalendar(calendar).positions(purchase_dates)
+
+
+def value_positions(prices, account_idx, ticker_idx, shares, start_pos, n_accounts):
+    """
+    Value every account as a sparse holdings matrix times the price matrix
+
+    Positions that start on the same calendar date form one sparse
+    accounts x tickers matrix. Walking the start dates in order, the active
+    holdings matrix grows by each group, and the calendar segment up to the
+    next start date is valued with one sparse-dense product.
+
+    Args:
+        prices (pd.DataFrame or np.ndarray): Aligned prices, dates x tickers
+            (a read-only view is fine, it is never copied as a whole)
+        account_idx (np.ndarray): Account index of each position
+        ticker_idx (np.ndarray): Column in prices of each position
+        shares (np.ndarray): Shares of each position
+        start_pos (np.ndarray): First calendar position each position counts from
+        n_accounts (int): Number of accounts
+
+    Returns:
+        np.ndarray: Account values, dates x accounts
+    """
+    price_values = np.asarray(prices, dtype = float)
+    n_dates, n_tickers = price_values.shape
+    has_nan = np.isnan(price_values).any()
+    values = np.zeros((n_dates, n_accounts))
+
+    order = np.argsort(start_pos, kind = 'stable')
+    account_idx = np.asarray(account_idx)[order]
+    ticker_idx = np.asarray(ticker_idx)[order]
+    shares = np.asarray(shares, dtype = float)[order]
+    start_pos = np.asarray(start_pos)[order]
+
+    starts, group_begin = np.unique(start_pos, return_index = True)
+    group_end = np.append(group_begin[1:], len(start_pos))
+    active = sparse.csr_matrix((n_accounts, n_tickers))
+
+    for i, start in enumerate(starts):
+        if start >= n_dates:
+            break
+        group = slice(group_begin[i], group_end[i])
+        active = active + sparse.csr_matrix(
+            (shares[group], (account_idx[group], ticker_idx[group])),
+            shape = (n_accounts, n_tickers))
+
+        stop = starts[i + 1] if i + 1 < len(starts) else n_dates
+        stop = min(stop, n_dates)
+        segment = price_values[start:stop]
+        if has_nan:
+            # No price yet means the holding adds nothing, as in the per-date loop
+            segment = np.nan_to_num(segment, nan = 0.0)
+        values[start:stop] = (active @ segment.T).T
+
+    return values
+
+
+def value_accounts(prices, calendar, tickers, positions, account_ids):
+    """
+    Value a set of accounts from a positions table
+
+    Args:
+        prices (np.ndarray): Aligned prices, dates x tickers (may be a read-only view)
+        calendar (pd.DatetimeIndex): Dates of the price rows
+        tickers (pd.Index): Tickers of the price columns
+        positions (pd.DataFrame): Positions with account, ticker, shares and purchase_date columns
+            (plus units and offset columns for total-return prices, see total_return_positions)
+        account_ids (list): Accounts to value, in output column order
+
+    Returns:
+        pd.DataFrame: Account values, dates x accounts (NaN before an account's first purchase)
+    """
+    positions = positions[positions['ticker'].isin(tickers)]
+    account_idx = pd.Index(account_ids).get_indexer(positions['account'])
+    ticker_idx = tickers.get_indexer(positions['ticker'])
+    start_pos = purchase_positions(calendar, positions['purchase_date'])
+
+    units = positions['units'] if 'units' in positions else positions['shares']
+    values = value_positions(prices, account_idx, ticker_idx, units.values, start_pos, len(account_ids))
+    if 'offset' in positions:
+        values -= position_offsets(len(calendar), account_idx, start_pos, positions['offset'].values,
+                                   len(account_ids))
+
+    # Before an account's first purchase it has no history, not a zero value
+    first_pos = np.full(len(account_ids), len(calendar))
+    np.minimum.at(first_pos, account_idx, start_pos)
+    before_first = np.arange(len(calendar))[:, None] < first_pos[None, :]
+    values[before_first] = np.nan
+
+    return pd.DataFrame(values, index = calendar, columns = account_ids)
+
+
+def first_priced_positions(prices, ticker_idx, start_pos):
+    """
+    First calendar position, on or after each start, where the position's ticker has a price
+
+    value_positions counts a holding as worth nothing until its ticker's first
+    price, so that is also when the money paid for it shows up in the value.
+
+    Args:
+        prices (pd.DataFrame or np.ndarray): Aligned prices, dates x tickers
+        ticker_idx (np.ndarray): Column in prices of each position
+        start_pos (np.ndarray): First calendar position of each position
+
+    Returns:
+        np.ndarray: Calendar positions (len(prices) if the ticker is never priced from there on)
+    """
+    priced = ~np.isnan(np.asarray(prices, dtype = float))
+    n_dates = priced.shape[0]
+    # Priced cells keyed ticker-major, so one searchsorted finds every position's next priced date
+    keys = np.flatnonzero(priced.T)
+    ticker_idx = np.asarray(ticker_idx)
+    found = np.searchsorted(keys, ticker_idx * n_dates + np.asarray(start_pos))
+    cell = keys[np.minimum(found, len(keys) - 1)] if len(keys) else np.full(len(found), -1)
+    same_ticker = (found < len(keys)) & (cell // max(n_dates, 1) == ticker_idx)
+    return np.where(same_ticker, cell - ticker_idx * n_dates, n_dates)
+
+
+def account_cash_flows(calendar, positions, account_ids, prices = None, tickers = None):
+    """
+    Money put into each account on every calendar date
+
+    Each position is paid for (shares x purchase price) on the calendar date
+    it starts counting from; a sell (negative shares) takes money out. Given
+    the price matrix, a flow waits for the ticker's first price on or after
+    that date, the day the position first adds to the account's value, so a
+    holding bought before its ticker trades (a late listing, a halt) is not
+    booked as a total loss.
+
+    Args:
+        calendar (pd.DatetimeIndex): Valuation dates
+        positions (pd.DataFrame): Positions with account, shares, purchase_price and purchase_date columns
+            (and ticker, when prices are given)
+        account_ids (list): Accounts, in output column order
+        prices (pd.DataFrame or np.ndarray): Aligned prices, dates x tickers (optional)
+        tickers (pd.Index): Tickers of the price columns (default: prices.columns)
+
+    Returns:
+        pd.DataFrame: External flows, dates x accounts
+    """
+    n_accounts = len(account_ids)
+    account_idx = pd.Index(account_ids).get_indexer(positions['account'])
+    start_pos = purchase_positions(calendar, positions['purchase_date'])
+    if prices is not None:
+        tickers = prices.columns if tickers is None else tickers
+        start_pos = first_priced_positions(prices, tickers.get_indexer(positions['ticker']), start_pos)
+    amount = positions['shares'].to_numpy(dtype = float) * positions['purchase_price'].to_numpy(dtype = float)
+    keep = (start_pos < len(calendar)) & (account_idx >= 0)
+    flows = np.bincount(start_pos[keep] * n_accounts + account_idx[keep], weights = amount[keep],
+                        minlength = len(calendar) * n_accounts)
+    return pd.DataFrame(flows.reshape(len(calendar), n_accounts), index = calendar, columns = account_ids)
+
+
+def calculate_account_metrics(values, benchmark_close = None, risk_free_rate = 0.03, trading_days = TRADING_DAYS,
+                              cash_flows = None):
+    """
+    Calculate the PortfolioAnalyzer metrics for many accounts at once
+
+    Every metric is computed column-wise over the value matrix, NaN-aware, so
+    accounts with different start dates are measured over their own history.
+
+    Args:
+        values (pd.DataFrame): Account values, dates x accounts (NaN before an account starts)
+        benchmark_close (pd.Series): Benchmark close prices (optional)
+        risk_free_rate (float): Annualized risk-free rate
+        trading_days (int): Trading days per year, for annualization
+        cash_flows (pd.DataFrame): External flows, dates x accounts (optional, see
+            account_cash_flows); adds the time- and money-weighted returns
+
+    Returns:
+        pd.DataFrame: Metrics, accounts x metric names
+    """
+    V = values.to_numpy()
+    dates = values.index
+    n_dates, n_accounts = V.shape
+    rf = risk_free_rate
+
+    valid = ~np.isnan(V)
+    has_history = valid.any(axis = 0)
+    first = np.where(has_history, valid.argmax(axis = 0), 0)
+    cols = np.arange(n_accounts)
+
+    initial_value = np.where(has_history, V[first, cols], np.nan)
+    final_value = V[-1]
+    days = np.asarray((dates[-1] - dates[first]).days, dtype = float)
+    years = days / 365.25
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        total_return = final_value / initial_value - 1
+        annualized_return = (1 + total_return) ** (1 / years) - 1
+
+        # Daily returns, NaN until the second day of each account's history
+        R = V[1:] / V[:-1] - 1
+        volatility = np.nanstd(R, axis = 0, ddof = 1) * np.sqrt(trading_days)
+
+        excess = R - rf / trading_days
+        excess_std = np.nanstd(excess, axis = 0, ddof = 1)
+        sharpe_ratio = np.where(excess_std == 0, 0.0,
+                                np.nanmean(excess, axis = 0) / excess_std * np.sqrt(trading_days))
+
+        downside_std = np.nanstd(np.where(R < 0, R, np.nan), axis = 0, ddof = 1)
+        sortino_ratio = np.where(downside_std == 0, 0.0,
+                                 np.nanmean(excess, axis = 0) / downside_std * np.sqrt(trading_days))
+
+        n_returns = (~np.isnan(R)).sum(axis = 0)
+        win_rate = np.where(n_returns == 0, 0.0, (R > 0).sum(axis = 0) / n_returns)
+
+        # Drawdown against the running peak (fmax skips the leading NaNs)
+        running_max = np.fmax.accumulate(V, axis = 0)
+        drawdown = V / running_max - 1
+        filled = np.where(np.isnan(drawdown), np.inf, drawdown)
+        trough = filled.argmin(axis = 0)
+        max_drawdown = filled[trough, cols]
+        before_trough = np.arange(n_dates)[:, None] <= trough[None, :]
+        peak = np.where(before_trough & valid, V, -np.inf).argmax(axis = 0)
+
+    metrics = pd.DataFrame({
+        'initial_value': initial_value,
+        'final_value': final_value,
+        'total_return': total_return,
+        'annualized_return': annualized_return,
+        'volatility': volatility,
+        'sharpe_ratio': sharpe_ratio,
+        'sortino_ratio': sortino_ratio,
+        'max_drawdown': np.where(has_history, max_drawdown, np.nan),
+        'max_dd_peak_date': dates[peak],
+        'max_dd_trough_date': dates[trough],
+        'win_rate': win_rate,
+        'beta': np.nan,
+        'alpha': np.nan,
+        'benchmark_return': np.nan,
+        'days': days,
+        'years': years
+    }, index = values.columns)
+
+    if benchmark_close is not None and not benchmark_close.empty:
+        _add_benchmark_metrics(metrics, dates, R, first, benchmark_close, rf)
+
+    if cash_flows is not None:
+        F = cash_flows.reindex(index = dates, columns = values.columns, fill_value = 0.0).to_numpy()
+        twr = time_weighted_returns(V, F)
+        # Money-weighted: the investor pays the flows and receives the final value
+        investor = -F
+        investor[-1] += np.nan_to_num(final_value)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            metrics['time_weighted_return'] = twr
+            metrics['annualized_twr'] = (1 + twr) ** (1 / years) - 1
+        metrics['money_weighted_return'] = xirr(investor, dates)
+
+    return metrics
+
+
+def _add_benchmark_metrics(metrics, dates, R, first, close, rf):
+    """
+    Add beta, alpha and the benchmark's annualized return for every account
+
+    Args:
+        metrics (pd.DataFrame): Metrics table to fill in
+        dates (pd.DatetimeIndex): Valuation calendar
+        R (np.ndarray): Account daily returns, (dates - 1) x accounts
+        first (np.ndarray): Calendar position of each account's first value
+        close (pd.Series): Benchmark close prices
+        rf (float): Annualized risk-free rate
+    """
+    # Benchmark returns on its own bars, matched to the calendar by exact date
+    market = close.pct_change().dropna().reindex(dates[1:]).to_numpy()
+
+    paired = ~np.isnan(R) & ~np.isnan(market)[:, None]
+    n = paired.sum(axis = 0)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        R0 = np.where(paired, R, 0.0)
+        M0 = np.where(paired, market[:, None], 0.0)
+        mean_p = R0.sum(axis = 0) / n
+        mean_m = M0.sum(axis = 0) / n
+        dp = np.where(paired, R0 - mean_p, 0.0)
+        dm = np.where(paired, M0 - mean_m, 0.0)
+        covariance = (dp * dm).sum(axis = 0) / (n - 1)
+        market_variance = (dm * dm).sum(axis = 0) / (n - 1)
+        beta = np.where(market_variance == 0, 0.0, covariance / market_variance)
+
+        # Benchmark return from each account's first date to the end
+        start = close.index.searchsorted(dates[first], side = 'left')
+        start = np.minimum(start, len(close) - 1)
+        benchmark_total = close.iloc[-1] / close.to_numpy()[start] - 1
+        benchmark_return = (1 + benchmark_total) ** (1 / metrics['years'].to_numpy()) - 1
+
+    metrics['beta'] = beta
+    metrics['benchmark_return'] = benchmark_return
+    metrics['alpha'] = metrics['annualized_return'] - (rf + beta * (benchmark_return - rf))
+
+
+def _measure_account_chunk(handle, positions, account_ids, benchmark_close, risk_free_rate, trading_days):
+    """
+    Process pool task: value and measure one chunk of accounts
+
+    The price matrix is read through a read-only view of the shared memory the
+    parent published, so no prices are pickled or copied per task.
+
+    Args:
+        handle (dict): SharedPriceMatrix.handle
+        positions (pd.DataFrame): Positions of the accounts in this chunk
+        account_ids (list): Accounts in this chunk
+        benchmark_close (pd.Series): Benchmark close prices (optional)
+        risk_free_rate (float): Annualized risk-free rate
+        trading_days (int): Trading days per year
+
+    Returns:
+        pd.DataFrame: Metrics for the chunk, accounts x metric names
+    """
+    shared = SharedPriceMatrix.attach(handle)
+    try:
+        values = value_accounts(shared.prices, shared.calendar, shared.tickers, positions, account_ids)
+        cash_flows = account_cash_flows(shared.calendar, positions[positions['ticker'].isin(shared.tickers)],
+                                        account_ids, shared.prices, shared.tickers)
+    finally:
+        shared.close()
+    return calculate_account_metrics(values, benchmark_close, risk_free_rate, trading_days, cash_flows)
+
+
+class MultiPortfolioEngine:
+    """
+    Value and measure many accounts against one shared price matrix
+
+    The ticker universe is the union of every account's holdings. Each ticker is
+    fetched once, from the earliest date any account needs, and all accounts are
+    valued together with sparse matrix products. Metrics are then computed for
+    every account at once, column-wise over the value matrix.
+
+    Accounts format:
+    {
+        'ACCOUNT-1': {'VOO': {'shares': 10, 'purchase_price': 150.0, 'purchase_date': '2023-01-01'}},
+        'ACCOUNT-2': {...}
+    }
+    """
+
+    def __init__(self, accounts, benchmark = "^GSPC", fetcher = None, max_workers = 8,
+                 return_mode = 'price', dividend_mode = 'reinvest', base_currency = None):
+        """
+        Args:
+            accounts (dict): Account id -> portfolio dictionary
+            benchmark (str): Benchmark ticker symbol (default: S&P 500)
+            fetcher (DataFetcher): Data fetcher to use (default: a new one)
+            max_workers (int): Threads used to fetch the ticker universe
+            return_mode (str): 'price' (adjusted closes) or 'total' (split-adjusted
+                closes plus dividends, see total_return_positions)
+            dividend_mode (str): 'reinvest' or 'accrue' dividends in total-return mode
+            base_currency (str): Currency to value every account in, e.g. 'USD'
+                (default: add up prices in their own quote currencies)
+        """
+        if return_mode not in RETURN_MODES:
+            raise ValueError(f"Unknown return mode {return_mode!r}; use one of {', '.join(RETURN_MODES)}")
+        if dividend_mode not in DIVIDEND_MODES:
+            raise ValueError(f"Unknown dividend mode {dividend_mode!r}; use one of {', '.join(DIVIDEND_MODES)}")
+        self.accounts = accounts
+        self.return_mode = return_mode
+        self.dividend_mode = dividend_mode
+        self.base_currency = base_currency
+        self.benchmark = benchmark
+        self.fetcher = fetcher if fetcher is not None else DataFetcher()
+        self.calculator = MetricsCalculator()
+        self.max_workers = max_workers
+
+        self.account_ids = list(accounts)
+        self.positions = None # One row per (account, ticker) position
+        self.calendar = None # TradingCalendar of the price matrix, with per-ticker as-of positions
+        self.prices = None # Aligned prices, dates x tickers
+        self.benchmark_data = None # Benchmark historical data
+
+        self.values = None # Account values, dates x accounts
+        self.metrics = None # Metrics, accounts x metric names
+
+    @classmethod
+    def from_positions(cls, positions, benchmark = "^GSPC", fetcher = None, max_workers = 8,
+                       return_mode = 'price', dividend_mode = 'reinvest', base_currency = None):
+        """
+        Create an engine from a positions table, e.g. from portfolio_loader.load_positions
+
+        Args:
+            positions (pd.DataFrame): account, ticker, shares, purchase_price and
+                purchase_date ('YYYY-MM-DD') columns; several lots per ticker are allowed
+            benchmark (str): Benchmark ticker symbol (default: S&P 500)
+            fetcher (DataFetcher): Data fetcher to use (default: a new one)
+            max_workers (int): Threads used to fetch the ticker universe
+            return_mode (str): 'price' or 'total'
+            dividend_mode (str): 'reinvest' or 'accrue' dividends in total-return mode
+            base_currency (str): Currency to value every account in (optional)
+
+        Returns:
+            MultiPortfolioEngine: Engine with its positions already built
+        """
+        engine = cls({}, benchmark = benchmark, fetcher = fetcher, max_workers = max_workers,
+                     return_mode = return_mode, dividend_mode = dividend_mode, base_currency = base_currency)
+        engine.positions = parse_purchase_dates(positions.reset_index(drop = True))
+        engine.account_ids = list(pd.unique(positions['account']))
+        print(f"{len(engine.positions):,} positions in {len(engine.account_ids):,} accounts, "
+              f"{engine.positions['ticker'].nunique():,} distinct tickers")
+        return engine
+
+    @classmethod
+    def from_ledger(cls, ledger, benchmark = "^GSPC", fetcher = None, max_workers = 8,
+                    return_mode = 'price', dividend_mode = 'reinvest', base_currency = None):
+        """
+        Create an engine from a ledger.TransactionLedger
+
+        Every trade becomes one position row (sells with negative shares), so
+        accounts are valued on the shares actually held on each date. Cash-only
+        rows are not valued; a warning lists them (see
+        TransactionLedger.warn_cash_actions).
+
+        Args:
+            ledger (TransactionLedger): Transactions to value
+            benchmark (str): Benchmark ticker symbol (default: S&P 500)
+            fetcher (DataFetcher): Data fetcher to use (default: a new one)
+            max_workers (int): Threads used to fetch the ticker universe
+            return_mode (str): 'price' or 'total'
+            dividend_mode (str): 'reinvest' or 'accrue' dividends in total-return mode
+            base_currency (str): Currency to value every account in (optional)
+
+        Returns:
+            MultiPortfolioEngine: Engine with its positions already built
+        """
+        ledger.warn_cash_actions()
+        return cls.from_positions(ledger.position_changes(), benchmark = benchmark, fetcher = fetcher,
+                                  max_workers = max_workers, return_mode = return_mode,
+                                  dividend_mode = dividend_mode, base_currency = base_currency)
+
+    def build_positions(self):
+        """Flatten all accounts into one positions table"""
+        rows = []
+        for account, portfolio in self.accounts.items():
+            for ticker, holding in portfolio.items():
+                rows.append((account, ticker, float(holding['shares']),
+                             float(holding['purchase_price']), str(holding['purchase_date'])))
+
+        self.positions = parse_purchase_dates(pd.DataFrame(rows, columns = ['account', 'ticker', 'shares',
+                                                                            'purchase_price', 'purchase_date']))
+        print(f"{len(self.positions):,} positions in {len(self.account_ids):,} accounts, "
+              f"{self.positions['ticker'].nunique():,} distinct tickers")
+
+    def fetch_all_data(self):
+        """Fetch each ticker of the union universe once, plus the benchmark"""
+        if self.positions is None:
+            self.build_positions()
+
+        earliest = self.positions.groupby('ticker')['purchase_date'].min().dt.strftime('%Y-%m-%d')
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        # Total return needs closes without the dividend back-adjustment
+        auto_adjust = self.return_mode == 'price'
+
+        def fetch(ticker):
+            return ticker, self.fetcher.fetch_stock_data(ticker, start_date = earliest[ticker],
+                                                         end_date = current_date, auto_adjust = auto_adjust)
+
+        with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+            histories = dict(executor.map(fetch, earliest.index))
+
+        self.calendar = TradingCalendar.from_histories(histories)
+        self.prices = build_price_matrix(histories, calendar = self.calendar)
+        missing = len(earliest) - self.prices.shape[1]
+        print(f"Price matrix: {self.prices.shape[0]:,} dates x {self.prices.shape[1]:,} tickers"
+              + (f" ({missing} tickers without data)" if missing else ""))
+
+        # Quote currencies to the base currency: prices (and dividends) by one element-wise
+        # multiply, purchase prices at their purchase date's rate
+        fx = 1.0
+        if self.base_currency is not None and not self.prices.empty:
+            def currency(ticker):
+                return ticker, self.fetcher.get_stock_info(ticker)['currency']
+
+            with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+                currencies = dict(executor.map(currency, self.prices.columns))
+            fx_rates = self.fetcher.fetch_fx_rates(set(currencies.values()), self.base_currency,
+                                                   earliest.min(), current_date)
+            fx = build_fx_matrix(fx_rates, currencies, self.prices)
+            self.prices = self.prices * fx
+            self.positions = self.positions.assign(purchase_price = self.positions['purchase_price'] * factors_at(
+                fx, self.prices.index, self.prices.columns, self.positions['ticker'], self.positions['purchase_date']))
+            print(f"Converted {len(set(currencies.values()))} quote currencies to {self.base_currency}")
+
+        if self.return_mode == 'total':
+            self.prices, self.positions = total_return_positions(
+                self.prices, build_event_matrix(histories, 'Dividends', self.prices) * fx,
+                build_event_matrix(histories, 'Stock Splits', self.prices), self.positions, self.dividend_mode)
+
+        self.benchmark_data = self.fetcher.fetch_stock_data(self.benchmark, start_date = earliest.min(),
+                                                            end_date = current_date)
+
+    def value_accounts(self):
+        """Value every account on every date of the shared calendar"""
+        if self.prices is None:
+            self.fetch_all_data()
+
+        self.values = value_accounts(self.prices.to_numpy(), self.prices.index, self.prices.columns,
+                                     self.positions, self.account_ids)
+        print(f"Valued {len(self.account_ids):,} accounts over {len(self.prices.index):,} dates")
+
+    def calculate_metrics(self, trading_days = TRADING_DAYS):
+        """
+        Calculate the PortfolioAnalyzer metrics for every account at once
+
+        Args:
+            trading_days (int): Trading days per year, for annualization
+
+        Returns:
+            pd.DataFrame: Metrics, accounts x metric names
+        """
+        if self.values is None:
+            self.value_accounts()
+
+        benchmark_close = None
+        if self.benchmark_data is not None and not self.benchmark_data.empty:
+            benchmark_close = self.benchmark_data['Close']
+
+        positions = self.positions[self.positions['ticker'].isin(self.prices.columns)]
+        cash_flows = account_cash_flows(self.prices.index, positions, self.account_ids, self.prices)
+        self.metrics = calculate_account_metrics(self.values, benchmark_close,
+                                                 self.calculator.risk_free_rate, trading_days, cash_flows)
+        print(f"Metrics calculated for {len(self.account_ids):,} accounts")
+        return self.metrics
+
+    def calculate_metrics_parallel(self, max_workers = None, chunk_size = 500, backend = 'shm',
+                                   trading_days = TRADING_DAYS):
+        """
+        Value and measure the accounts in a process pool over a shared price matrix
+
+        The price matrix is published once through shared memory (or a
+        memory-mapped file) and every worker attaches to it read-only; only
+        the positions of each chunk of accounts are sent to the workers. The
+        per-account value matrix is not kept, only the metrics.
+
+        Args:
+            max_workers (int): Worker processes (default: CPU count)
+            chunk_size (int): Accounts per task
+            backend (str): 'shm' or 'memmap', see SharedPriceMatrix
+            trading_days (int): Trading days per year, for annualization
+
+        Returns:
+            pd.DataFrame: Metrics, accounts x metric names
+        """
+        if self.prices is None:
+            self.fetch_all_data()
+
+        benchmark_close = None
+        if self.benchmark_data is not None and not self.benchmark_data.empty:
+            benchmark_close = self.benchmark_data['Close']
+
+        chunk_of = pd.Index(self.account_ids).get_indexer(self.positions['account']) // chunk_size
+        chunks = [self.account_ids[i:i + chunk_size] for i in range(0, len(self.account_ids), chunk_size)]
+        positions_by_chunk = dict(list(self.positions.groupby(chunk_of)))
+        empty = self.positions.iloc[:0]
+
+        with SharedPriceMatrix(self.prices, backend = backend) as shared:
+            with ProcessPoolExecutor(max_workers = max_workers or os.cpu_count()) as executor:
+                futures = [executor.submit(_measure_account_chunk, shared.handle,
+                                           positions_by_chunk.get(i, empty), chunk, benchmark_close,
+                                           self.calculator.risk_free_rate, trading_days)
+                           for i, chunk in enumerate(chunks)]
+                results = [future.result() for future in futures]
+
+        self.metrics = pd.concat(results) if results else pd.DataFrame()
+        print(f"Metrics calculated for {len(self.account_ids):,} accounts in {len(chunks)} chunks")
+        return self.metrics
+
+    def run(self):
+        """Fetch, value and measure every account"""
+        self.build_positions()
+        self.fetch_all_data()
+        self.value_accounts()
+        return self.calculate_metrics()
@@ -0,0 +1,394 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+REQUIRED_COLUMNS = ['ticker', 'shares', 'purchase_price', 'purchase_date']
+POSITION_COLUMNS = ['account', 'ticker', 'shares', 'purchase_price', 'purchase_date']
+DUPLICATE_MODES = ('keep', 'merge', 'error')
+TRANSACTION_COLUMNS = ['account', 'date', 'ticker', 'action', 'shares', 'price', 'amount', 'fees', 'lot']
+TRADE_ACTIONS = ('BUY', 'SELL')
+CASH_ACTIONS = ('DIVIDEND', 'DEPOSIT', 'WITHDRAWAL', 'FEE')
+
+
+class PortfolioValidationError(ValueError):
+    """
+    Invalid portfolio input, with every problem found
+
+    Attributes:
+        errors (pd.DataFrame): One row per problem: row (line number in the
+            file, None for file-level problems), column, value, error
+    """
+
+    def __init__(self, errors, path = None, max_listed = 20):
+        self.errors = errors
+        self.path = path
+        lines = [f"{len(errors):,} problem(s) in {path or 'portfolio'}:"]
+        for error in errors.head(max_listed).itertuples(index = False):
+            where = f"line {error.row}" if pd.notna(error.row) else 'file'
+            value = '' if pd.isna(error.value) else f" ({error.value!r})"
+            lines.append(f"  {where}, {error.column}: {error.error}{value}")
+        if len(errors) > max_listed:
+            lines.append(f"  ... and {len(errors) - max_listed:,} more")
+        super().__init__('\n'.join(lines))
+
+
+def _error_frame(rows, column, values, message):
+    """Error rows for one failed check"""
+    return pd.DataFrame({'row': rows, 'column': column, 'value': values, 'error': message})
+
+
+def _read_chunks(path, columns, chunksize):
+    """
+    Yield the input in chunks with every column as text
+
+    CSV is read with an explicit string dtype so malformed numbers and dates
+    reach validation (and are reported per row) instead of failing the parse.
+
+    Args:
+        path (str): CSV (optionally compressed) or Parquet file
+        columns (dict): Normalized column name -> column name in the file
+        chunksize (int): Rows per chunk
+
+    Returns:
+        generator: DataFrames with normalized column names and a file line number index
+    """
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet needs pyarrow (pip install pyarrow)")
+        offset = 0
+        for batch in pq.ParquetFile(path).iter_batches(batch_size = chunksize, columns = list(columns.values())):
+            chunk = batch.to_pandas().rename(columns = {v: k for k, v in columns.items()})
+            chunk.index = np.arange(offset, offset + len(chunk)) + 1 # Parquet has no header line
+            offset += len(chunk)
+            yield chunk
+        return
+
+    reader = pd.read_csv(path, usecols = list(columns.values()), dtype = str, skipinitialspace = True,
+                         keep_default_na = False, chunksize = chunksize)
+    for chunk in reader:
+        chunk = chunk.rename(columns = {v: k for k, v in columns.items()})
+        chunk.index = chunk.index + 2 # Line numbers: the header is line 1
+        yield chunk
+
+
+def _file_columns(path):
+    """Map normalized (stripped, lower-case) column names to the file's column names"""
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet needs pyarrow (pip install pyarrow)")
+        names = pq.ParquetFile(path).schema_arrow.names
+    else:
+        names = pd.read_csv(path, nrows = 0, skipinitialspace = True).columns
+    return {str(name).strip().lower(): name for name in names}
+
+
+def _parse_dates(values):
+    """Parse ISO dates vectorized, falling back to flexible parsing for the rest"""
+    dates = pd.to_datetime(values, errors = 'coerce', format = 'ISO8601')
+    retry = dates.isna() & values.notna() & (values.astype(str).str.strip() != '')
+    if retry.any():
+        dates[retry] = pd.to_datetime(values[retry], errors = 'coerce', format = 'mixed')
+    if getattr(dates.dt, 'tz', None) is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates
+
+
+def validate_chunk(chunk, default_account, today):
+    """
+    Validate and convert one chunk, vectorized
+
+    Args:
+        chunk (pd.DataFrame): Raw chunk from _read_chunks
+        default_account (str): Account for rows without an account column
+        today (pd.Timestamp): Latest allowed purchase date
+
+    Returns:
+        tuple: (positions DataFrame of the good rows, errors DataFrame)
+    """
+    ticker = chunk['ticker'].astype('string').str.strip().str.upper()
+    shares = pd.to_numeric(chunk['shares'], errors = 'coerce')
+    price = pd.to_numeric(chunk['purchase_price'], errors = 'coerce')
+    dates = _parse_dates(chunk['purchase_date'])
+    if 'account' in chunk:
+        account = chunk['account'].astype('string').str.strip()
+        account = account.mask(account.isna() | (account == ''), default_account)
+    else:
+        account = pd.Series(default_account, index = chunk.index, dtype = 'string')
+
+    checks = [
+        (ticker.isna() | (ticker == ''), 'ticker', 'missing ticker'),
+        (shares.isna() | ~np.isfinite(shares), 'shares', 'not a number'),
+        (shares <= 0, 'shares', 'must be positive'),
+        (price.isna() | ~np.isfinite(price), 'purchase_price', 'not a number'),
+        (price <= 0, 'purchase_price', 'must be positive'),
+        (dates.isna(), 'purchase_date', 'not a valid date'),
+        (dates > today, 'purchase_date', 'in the future'),
+    ]
+
+    bad = pd.Series(False, index = chunk.index)
+    errors = []
+    for mask, column, message in checks:
+        mask = mask.fillna(False).to_numpy(dtype = bool)
+        if mask.any():
+            errors.append(_error_frame(chunk.index[mask], column, chunk[column][mask].to_numpy(), message))
+            bad |= mask
+
+    good = ~bad.to_numpy()
+    positions = pd.DataFrame({
+        'account': account[good].astype(object),
+        'ticker': ticker[good].astype(object),
+        'shares': shares[good].astype(np.float64),
+        'purchase_price': price[good].astype(np.float64),
+        'purchase_date': dates[good].dt.strftime('%Y-%m-%d')
+    })
+    errors = pd.concat(errors) if errors else _error_frame([], None, [], None)
+    return positions, errors
+
+
+def merge_duplicate_lots(positions):
+    """
+    Combine lots of the same ticker in the same account into one position
+
+    Shares are summed, the purchase price is the cost-weighted average and the
+    purchase date is the earliest lot's.
+
+    Args:
+        positions (pd.DataFrame): Positions table
+
+    Returns:
+        pd.DataFrame: Positions table with one row per (account, ticker)
+    """
+    cost = positions['shares'] * positions['purchase_price']
+    grouped = positions.assign(cost = cost).groupby(['account', 'ticker'], sort = False)
+    merged = grouped.agg(shares = ('shares', 'sum'), cost = ('cost', 'sum'),
+                         purchase_date = ('purchase_date', 'min')).reset_index()
+    merged['purchase_price'] = merged['cost'] / merged['shares']
+    return merged[POSITION_COLUMNS]
+
+
+def load_positions(path, chunksize = 100_000, duplicates = 'keep', default_account = None):
+    """
+    Load a portfolio file into a columnar positions table
+
+    Reads CSV (with explicit string dtypes, optionally compressed) or Parquet
+    in chunks, validates every chunk with vectorized checks, and raises one
+    PortfolioValidationError listing every bad row once the whole file has
+    been read. The result has the positions layout MultiPortfolioEngine uses.
+
+    Columns: ticker, shares, purchase_price, purchase_date and optionally
+    account (names are matched case-insensitively; other columns are ignored).
+
+    Args:
+        path (str): .csv, .csv.gz, ... or .parquet file
+        chunksize (int): Rows per chunk
+        duplicates (str): Several lots of one ticker in one account:
+            'keep' every lot as its own row, 'merge' them (see merge_duplicate_lots),
+            or report them as errors with 'error'
+        default_account (str): Account for rows without one (default: the file name)
+
+    Returns:
+        pd.DataFrame: account, ticker, shares, purchase_price, purchase_date ('YYYY-MM-DD')
+    """
+    if duplicates not in DUPLICATE_MODES:
+        raise ValueError(f"duplicates must be one of {DUPLICATE_MODES}")
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+
+    if default_account is None:
+        default_account = os.path.basename(path).split('.')[0]
+
+    file_columns = _file_columns(path)
+    missing = [column for column in REQUIRED_COLUMNS if column not in file_columns]
+    if missing:
+        raise PortfolioValidationError(
+            _error_frame([None] * len(missing), missing, [None] * len(missing), 'missing column'), path)
+    wanted = REQUIRED_COLUMNS + (['account'] if 'account' in file_columns else [])
+    columns = {name: file_columns[name] for name in wanted}
+
+    today = pd.Timestamp(datetime.now().date())
+    chunks = []
+    errors = []
+    for chunk in _read_chunks(path, columns, chunksize):
+        positions, chunk_errors = validate_chunk(chunk, default_account, today)
+        chunks.append(positions)
+        if len(chunk_errors):
+            errors.append(chunk_errors)
+
+    positions = pd.concat(chunks) if chunks else pd.DataFrame(columns = POSITION_COLUMNS)
+
+    if duplicates == 'error':
+        repeated = positions.duplicated(['account', 'ticker'], keep = False)
+        if repeated.any():
+            errors.append(_error_frame(positions.index[repeated], 'ticker',
+                                       positions.loc[repeated, 'ticker'].to_numpy(), 'duplicate ticker'))
+
+    if errors:
+        errors = pd.concat(errors).sort_values('row', kind = 'stable').reset_index(drop = True)
+        raise PortfolioValidationError(errors, path)
+    if positions.empty:
+        raise PortfolioValidationError(_error_frame([None], 'ticker', [None], 'no holdings'), path)
+
+    if duplicates == 'merge':
+        positions = merge_duplicate_lots(positions)
+    return positions.reset_index(drop = True)[POSITION_COLUMNS]
+
+
+def validate_transactions_chunk(chunk, default_account, today):
+    """
+    Validate and convert one chunk of transactions, vectorized
+
+    BUY and SELL rows need a ticker, positive shares and a positive price;
+    DIVIDEND, DEPOSIT, WITHDRAWAL and FEE rows need a positive amount
+    (DIVIDEND also a ticker). Fees are optional and must not be negative.
+
+    Args:
+        chunk (pd.DataFrame): Raw chunk from _read_chunks
+        default_account (str): Account for rows without an account column
+        today (pd.Timestamp): Latest allowed transaction date
+
+    Returns:
+        tuple: (transactions DataFrame of the good rows, errors DataFrame)
+    """
+    def column(name):
+        if name in chunk:
+            return chunk[name]
+        return pd.Series('', index = chunk.index, dtype = object)
+
+    def number(name):
+        values = column(name)
+        blank = values.isna() | (values.astype(str).str.strip() == '')
+        return pd.to_numeric(values.mask(blank), errors = 'coerce'), blank
+
+    action = column('action').astype('string').str.strip().str.upper()
+    ticker = column('ticker').astype('string').str.strip().str.upper()
+    dates = _parse_dates(column('date'))
+    shares, shares_blank = number('shares')
+    price, price_blank = number('price')
+    amount, amount_blank = number('amount')
+    fees, fees_blank = number('fees')
+    account = column('account').astype('string').str.strip()
+    account = account.mask(account.isna() | (account == ''), default_account)
+    lot = column('lot').astype('string').str.strip().fillna('')
+
+    trade = action.isin(TRADE_ACTIONS)
+    cash = action.isin(CASH_ACTIONS)
+    checks = [
+        (~(trade | cash), 'action', f"must be one of {', '.join(TRADE_ACTIONS + CASH_ACTIONS)}"),
+        (dates.isna(), 'date', 'not a valid date'),
+        (dates > today, 'date', 'in the future'),
+        ((trade | (action == 'DIVIDEND')) & (ticker.isna() | (ticker == '')), 'ticker', 'missing ticker'),
+        (trade & ~(shares > 0), 'shares', 'must be a positive number'),
+        (trade & ~(price > 0), 'price', 'must be a positive number'),
+        (cash & ~(amount > 0), 'amount', 'must be a positive number'),
+        (~fees_blank & ~(fees >= 0), 'fees', 'must be a number, zero or more'),
+    ]
+
+    bad = np.zeros(len(chunk), dtype = bool)
+    errors = []
+    for mask, name, message in checks:
+        mask = mask.fillna(False).to_numpy(dtype = bool)
+        if mask.any():
+            errors.append(_error_frame(chunk.index[mask], name, column(name)[mask].to_numpy(), message))
+            bad |= mask
+
+    good = ~bad
+    transactions = pd.DataFrame({
+        'account': account[good].astype(object),
+        'date': dates[good],
+        'ticker': ticker[good].fillna('').astype(object),
+        'action': action[good].astype(object),
+        'shares': shares[good].fillna(0.0).astype(np.float64),
+        'price': price[good].fillna(0.0).astype(np.float64),
+        'amount': amount[good].fillna(0.0).astype(np.float64),
+        'fees': fees[good].fillna(0.0).astype(np.float64),
+        'lot': lot[good].astype(object)
+    })
+    errors = pd.concat(errors) if errors else _error_frame([], None, [], None)
+    return transactions, errors
+
+
+def load_transactions(path, chunksize = 100_000, default_account = None):
+    """
+    Load a transaction ledger file, validated in chunks like load_positions
+
+    Columns: date, action (BUY, SELL, DIVIDEND, DEPOSIT, WITHDRAWAL, FEE) and,
+    as the action needs them, ticker, shares, price, amount, fees and account.
+    An optional lot column names buy lots, and a sell naming a lot sells from
+    it first under specific-lot matching (see tax_lots.TaxLots).
+
+    Args:
+        path (str): .csv, .csv.gz, ... or .parquet file
+        chunksize (int): Rows per chunk
+        default_account (str): Account for rows without one (default: the file name)
+
+    Returns:
+        pd.DataFrame: account, date, ticker, action, shares, price, amount, fees, lot,
+            in file order (the line number is kept as the index)
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    if default_account is None:
+        default_account = os.path.basename(path).split('.')[0]
+
+    file_columns = _file_columns(path)
+    missing = [column for column in ('date', 'action') if column not in file_columns]
+    if missing:
+        raise PortfolioValidationError(
+            _error_frame([None] * len(missing), missing, [None] * len(missing), 'missing column'), path)
+    columns = {name: file_columns[name] for name in TRANSACTION_COLUMNS if name in file_columns}
+
+    today = pd.Timestamp(datetime.now().date())
+    chunks = []
+    errors = []
+    for chunk in _read_chunks(path, columns, chunksize):
+        transactions, chunk_errors = validate_transactions_chunk(chunk, default_account, today)
+        chunks.append(transactions)
+        if len(chunk_errors):
+            errors.append(chunk_errors)
+
+    if errors:
+        errors = pd.concat(errors).sort_values('row', kind = 'stable').reset_index(drop = True)
+        raise PortfolioValidationError(errors, path)
+    if not chunks or sum(len(c) for c in chunks) == 0:
+        raise PortfolioValidationError(_error_frame([None], 'date', [None], 'no transactions'), path)
+    return pd.concat(chunks)[TRANSACTION_COLUMNS]
+
+
+def repeated_tickers(positions):
+    """
+    Tickers with more than one lot, which positions_to_portfolio merges
+
+    Args:
+        positions (pd.DataFrame): Positions table
+
+    Returns:
+        pd.Series: Number of lots per repeated ticker
+    """
+    counts = positions['ticker'].value_counts(sort = False)
+    return counts[counts > 1]
+
+
+def positions_to_portfolio(positions):
+    """
+    Convert a positions table to the portfolio dictionary PortfolioAnalyzer uses
+
+    The dictionary holds one lot per ticker, so several lots of a ticker are
+    merged (see merge_duplicate_lots) instead of being dropped;
+    repeated_tickers lists them for the caller to report.
+
+    Args:
+        positions (pd.DataFrame): Positions table (all rows are treated as one account)
+
+    Returns:
+        dict: Portfolio dictionary
+    """
+    merged = merge_duplicate_lots(positions.assign(account = ''))
+    return {row.ticker: {'shares': row.shares, 'purchase_price': row.purchase_price,
+                         'purchase_date': row.purchase_date}
+            for row in merged.itertuples(index = False)}
@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+# Profiler receiving spans from span(); None when profiling is off
+_active = None
+
+
+def span(name, **attrs):
+    """
+    Time a block as a nested span of the active profiler
+
+    Costs one global lookup when no profiler is running, so it can wrap
+    network calls and charts unconditionally.
+
+    Usage:
+        with span('fetch', ticker = 'AAPL'):
+            ...
+
+    Args:
+        name (str): Span name, e.g. 'fetch' or 'chart'
+        **attrs: Extra fields recorded with the span (ticker, chart, ...)
+    """
+    profiler = _active
+    if profiler is None:
+        return nullcontext()
+    return profiler.span(name, **attrs)
+
+
+def default_profile_path(prefix = 'profile'):
+    """Profile file path in output/profiles relative to this program"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return os.path.join(script_dir, 'output', 'profiles', f"{prefix}_{timestamp}.json")
+
+
+class Profiler:
+    """
+    Collect nested timing spans, with optional cProfile and tracemalloc capture
+
+    Spans nest per thread: a span opened inside another span on the same
+    thread becomes its child, and spans opened on worker threads become roots
+    tagged with the thread name. cProfile only sees the thread that started
+    the profiler; tracemalloc sees every thread.
+
+    Usage:
+        with Profiler(cprofile = True, memory = True) as profiler:
+            with span('analysis'):
+                ...
+        profiler.write_json(default_profile_path())
+    """
+
+    def __init__(self, cprofile = False, memory = False, top_n = 30):
+        """
+        Args:
+            cprofile (bool): Also run cProfile and record the top functions
+            memory (bool): Also run tracemalloc and record the peak and top allocation sites
+            top_n (int): Functions / allocation sites to keep
+        """
+        self.cprofile = cprofile
+        self.memory = memory
+        self.top_n = top_n
+
+        self.spans = [] # Root spans, in start order
+        self.seconds = None # Total profiled time
+        self._local = threading.local() # Per-thread stack of open spans
+        self._lock = threading.Lock()
+        self._start = None
+        self._profile = None
+        self._memory_stats = None
+
+    def start(self):
+        """Start collecting spans (and cProfile / tracemalloc samples)"""
+        global _active
+        self._start = time.perf_counter()
+        if self.memory:
+            import tracemalloc
+            tracemalloc.start()
+        if self.cprofile:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        _active = self
+        return self
+
+    def stop(self):
+        """Stop collecting; the results stay available for to_dict / write_json"""
+        global _active
+        if _active is self:
+            _active = None
+        if self._profile is not None:
+            self._profile.disable()
+        if self.memory:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self._memory_stats = {
+                    'current_bytes': current,
+                    'peak_bytes': peak,
+                    'top': [{'location': f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+                             'bytes': s.size, 'count': s.count}
+                            for s in snapshot.statistics('lineno')[:self.top_n]]
+                }
+        self.seconds = time.perf_counter() - self._start
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time a block as a child of the innermost open span on this thread"""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        node = {'name': name, 'start': time.perf_counter() - self._start, 'seconds': None}
+        node.update(attrs)
+        if stack:
+            stack[-1].setdefault('children', []).append(node)
+        else:
+            thread = threading.current_thread()
+            if thread is not threading.main_thread():
+                node['thread'] = thread.name
+            with self._lock:
+                self.spans.append(node)
+
+        if self.memory:
+            import tracemalloc
+            memory_start = tracemalloc.get_traced_memory()[0]
+
+        stack.append(node)
+        try:
+            yield node
+        except BaseException as e:
+            node['error'] = type(e).__name__
+            raise
+        finally:
+            stack.pop()
+            node['seconds'] = time.perf_counter() - self._start - node['start']
+            if self.memory:
+                node['memory_delta_bytes'] = tracemalloc.get_traced_memory()[0] - memory_start
+
+    def totals(self):
+        """
+        Total time and count per span name, over the whole span tree
+
+        Returns:
+            dict: {name: {'count': int, 'seconds': float}}, slowest first
+        """
+        totals = {}
+        pending = list(self.spans)
+        while pending:
+            node = pending.pop()
+            entry = totals.setdefault(node['name'], {'count': 0, 'seconds': 0.0})
+            entry['count'] += 1
+            entry['seconds'] += node['seconds'] or 0.0
+            pending.extend(node.get('children', []))
+        return dict(sorted(totals.items(), key = lambda item: -item[1]['seconds']))
+
+    def _cprofile_stats(self):
+        """Top functions by cumulative time from the cProfile capture"""
+        import pstats
+        stats = pstats.Stats(self._profile).sort_stats('cumulative')
+        functions = []
+        for func in stats.fcn_list[:self.top_n]:
+            calls, primitive, own, cumulative, _ = stats.stats[func]
+            filename, line, function = func
+            functions.append({'function': f"{filename}:{line}({function})", 'calls': calls,
+                              'tottime': own, 'cumtime': cumulative})
+        return functions
+
+    def to_dict(self):
+        """
+        Profile as a JSON-ready dictionary
+
+        Returns:
+            dict: Total seconds, per-name totals, the span tree and, when
+                captured, the cProfile top functions and tracemalloc statistics
+        """
+        return {
+            'created': datetime.now().isoformat(timespec = 'seconds'),
+            'seconds': self.seconds,
+            'totals': self.totals(),
+            'spans': self.spans,
+            'cprofile': self._cprofile_stats() if self._profile is not None else None,
+            'memory': self._memory_stats
+        }
+
+    def write_json(self, path):
+        """
+        Write the profile as JSON
+
+        Args:
+            path (str): Output file; its directory is created if needed
+
+        Returns:
+            str: The path written
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent = 2, default = str)
+        return path
+
+    def print_summary(self, limit = 10):
+        """Print the slowest span names"""
+        print(f"\n{'PROFILE':-^50}")
+        print(f"Total:                {self.seconds or 0.0:>10.3f} s")
+        for name, entry in list(self.totals().items())[:limit]:
+            print(f"{name:<22}{entry['seconds']:>10.3f} s  ({entry['count']}x)")
+        if self._memory_stats is not None:
+            print(f"Peak traced memory:   {self._memory_stats['peak_bytes'] / 1024**2:>10.1f} MB")
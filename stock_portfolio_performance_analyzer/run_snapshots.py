@@ -0,0 +1,497 @@
+import os
+import re
+import json
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from batch_analysis import _json_safe
+from portfolio_analyzer import PortfolioAnalyzer
+
+# Bumped whenever the snapshot layout changes; older snapshots are then ignored
+SNAPSHOT_VERSION = 1
+
+# History columns a snapshot keeps: the ones valuation and the charts read
+HISTORY_COLUMNS = ['Close', 'Dividends', 'Stock Splits']
+
+# Columns Yahoo back-adjusts over the whole history when a later dividend or split comes in
+ADJUSTED_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Dividends']
+
+# Changes in these per-holding figures are listed in the diff report
+HOLDING_FIELDS = ['current_value', 'gain_loss', 'total_return', 'weight']
+
+
+def default_snapshot_dir():
+    """Snapshot directory in output/snapshots relative to this program"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(script_dir, 'output', 'snapshots')
+
+
+def _digest(value):
+    """Short stable hash of a JSON-serializable value"""
+    text = json.dumps(value, sort_keys = True, default = str)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def analysis_settings(analyzer):
+    """
+    Settings that change every value of an analysis
+
+    Args:
+        analyzer (PortfolioAnalyzer): Portfolio analyzer object
+
+    Returns:
+        dict: Benchmark, return and dividend modes, base currency and snapshot version
+    """
+    return {'benchmark': analyzer.benchmark, 'return_mode': analyzer.return_mode,
+            'dividend_mode': analyzer.dividend_mode, 'base_currency': analyzer.base_currency,
+            'version': SNAPSHOT_VERSION}
+
+
+def holding_fingerprints(analyzer):
+    """
+    Fingerprint of each holding's inputs
+
+    A holding whose fingerprint is unchanged since the last run has the same
+    shares, purchase price and date (for a ledger: the same trades); the diff
+    report lists the others as changed.
+
+    Args:
+        analyzer (PortfolioAnalyzer): Portfolio analyzer object
+
+    Returns:
+        dict: Ticker -> fingerprint
+    """
+    if analyzer.ledger is not None:
+        trades = analyzer.ledger.position_changes()
+        trades = trades.assign(purchase_date = trades['purchase_date'].dt.strftime('%Y-%m-%d'))
+        columns = ['account', 'shares', 'purchase_price', 'purchase_date']
+        return {ticker: _digest(rows[columns].values.tolist())
+                for ticker, rows in trades.groupby('ticker', sort = False)}
+    return {ticker: _digest(holding) for ticker, holding in analyzer.portfolio.items()}
+
+
+def chart_hashes(charts):
+    """
+    Content hash of each rendered chart
+
+    Args:
+        charts (dict): Chart name -> io.BytesIO (see PortfolioVisualization.create_all_charts)
+
+    Returns:
+        dict: Chart name -> hash
+    """
+    return {name: hashlib.sha1(buffer.getvalue()).hexdigest()[:16] for name, buffer in (charts or {}).items()}
+
+
+def extend_history(stored, fresh):
+    """
+    Extend a stored history with the rows fetched since its last date
+
+    Yahoo adjusts past prices when a dividend or split comes in: every row
+    before it is scaled by the same factor. The fresh rows start on the
+    stored last date, so the ratio of the two closes there is that factor,
+    and scaling the stored rows by it gives what a full fetch would return.
+
+    Args:
+        stored (pd.DataFrame): History kept from the previous run
+        fresh (pd.DataFrame): History from the stored last date on
+
+    Returns:
+        pd.DataFrame: The stored rows (rescaled if needed) followed by the new ones
+    """
+    if fresh.empty:
+        return stored
+    if stored.empty:
+        return fresh
+    last = stored.index[-1]
+    fresh = fresh.reindex(columns = stored.columns)
+    if last in fresh.index:
+        ratio = fresh.at[last, 'Close'] / stored.at[last, 'Close']
+        if np.isfinite(ratio) and not np.isclose(ratio, 1.0, rtol = 1e-9, atol = 0.0):
+            columns = [column for column in ADJUSTED_COLUMNS if column in stored]
+            stored = stored.copy()
+            stored[columns] = stored[columns] * ratio
+    return pd.concat([stored, fresh[fresh.index > last]])
+
+
+class RunSnapshot:
+    """
+    Everything one analysis run produced, with what it was computed from
+
+    Kept: the run's settings and holding fingerprints, each holding's daily
+    history (only the columns valuation reads) with the date it was fetched
+    from, the benchmark, company info, the portfolio history and cash flows,
+    the report metrics, the per-holding performance and a hash of every chart.
+    """
+
+    def __init__(self, name, run, settings, holdings, portfolio, start_dates, histories, benchmark_data,
+                 stock_info, portfolio_history, cash_flows, metrics, holdings_performance, charts, created = None):
+        self.name = name
+        self.run = run
+        self.created = created if created is not None else datetime.now()
+        self.settings = settings
+        self.holdings = holdings # Ticker -> fingerprint (see holding_fingerprints)
+        self.portfolio = portfolio
+        self.start_dates = start_dates # Ticker -> first date its history was fetched from
+        self.histories = histories
+        self.benchmark_start = min(start_dates.values()) if start_dates else None
+        self.benchmark_data = benchmark_data
+        self.stock_info = stock_info
+        self.portfolio_history = portfolio_history
+        self.cash_flows = cash_flows
+        self.metrics = metrics
+        self.holdings_performance = holdings_performance
+        self.charts = charts # Chart name -> hash (see chart_hashes)
+
+    @classmethod
+    def from_analyzer(cls, analyzer, name, run, charts = None):
+        """
+        Snapshot an analyzer after its analysis
+
+        Args:
+            analyzer (PortfolioAnalyzer): Portfolio analyzer object (metrics calculated)
+            name (str): Portfolio name the snapshots are stored under
+            run (int): Run number
+            charts (dict): Rendered charts to hash (optional)
+
+        Returns:
+            RunSnapshot: The snapshot
+        """
+        histories = {ticker: df[[column for column in HISTORY_COLUMNS if column in df]]
+                     for ticker, df in analyzer.holdings_data.items()}
+        benchmark_data = analyzer.benchmark_data
+        if benchmark_data is not None and not benchmark_data.empty:
+            benchmark_data = benchmark_data[[column for column in HISTORY_COLUMNS if column in benchmark_data]]
+        return cls(name, run, analysis_settings(analyzer), holding_fingerprints(analyzer), analyzer.portfolio,
+                   analyzer.start_dates(), histories, benchmark_data, analyzer.stock_info,
+                   analyzer.portfolio_history, analyzer.cash_flows, analyzer.metrics, analyzer.calculate_each_holding_performance(),
+                   chart_hashes(charts))
+
+    @property
+    def last_date(self):
+        """Last date of the portfolio history (None if it is empty)"""
+        if self.portfolio_history is None or self.portfolio_history.empty:
+            return None
+        return self.portfolio_history.index[-1]
+
+
+class SnapshotStore:
+    """
+    Numbered run snapshots of one portfolio in a directory
+
+    Each run is pickled to <directory>/<name>/run-000001.pkl, run-000002.pkl,
+    ...; only the last `keep` runs are kept.
+    """
+
+    def __init__(self, name, directory = None, keep = 5):
+        """
+        Args:
+            name (str): Portfolio name (e.g. the portfolio file's name)
+            directory (str): Snapshot root directory (default: output/snapshots)
+            keep (int): Runs to keep (None: keep every run)
+        """
+        self.name = name
+        self.directory = os.path.join(directory if directory is not None else default_snapshot_dir(),
+                                      re.sub(r'[^\w.-]', '_', name))
+        self.keep = keep
+
+    def path(self, run, suffix = '.pkl'):
+        return os.path.join(self.directory, f"run-{run:06d}{suffix}")
+
+    def runs(self):
+        """
+        Numbers of the stored runs, oldest first
+
+        Returns:
+            list: Run numbers
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(match.group(1)) for match in
+                      (re.fullmatch(r'run-(\d+)\.pkl', file) for file in os.listdir(self.directory)) if match)
+
+    def load(self, run):
+        """
+        Load one run's snapshot
+
+        Args:
+            run (int): Run number
+
+        Returns:
+            RunSnapshot: The snapshot (None if it is from another snapshot version)
+        """
+        with open(self.path(run), 'rb') as f:
+            snapshot = pickle.load(f)
+        if snapshot.settings.get('version') != SNAPSHOT_VERSION:
+            print(f"Ignoring snapshot {self.path(run)} from another version")
+            return None
+        return snapshot
+
+    def latest(self):
+        """
+        Load the most recent run's snapshot
+
+        Returns:
+            RunSnapshot: The snapshot (None if there is none)
+        """
+        runs = self.runs()
+        return self.load(runs[-1]) if runs else None
+
+    def save(self, snapshot):
+        """
+        Store a snapshot under its run number, dropping runs past `keep`
+
+        Args:
+            snapshot (RunSnapshot): Snapshot to store
+
+        Returns:
+            str: Path of the snapshot file
+        """
+        os.makedirs(self.directory, exist_ok = True)
+        path = self.path(snapshot.run)
+        # Written under a temporary name first, so an interrupted save leaves the previous runs intact
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(snapshot, f, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+        if self.keep is not None:
+            for run in self.runs()[:-self.keep]:
+                os.remove(self.path(run))
+                if os.path.exists(self.path(run, '-diff.json')):
+                    os.remove(self.path(run, '-diff.json'))
+        return path
+
+
+def _change(old, new):
+    """{'old', 'new', 'change'} for two values, the change only for numbers"""
+    change = {'old': old, 'new': new}
+    numbers = (int, float, np.integer, np.floating)
+    if isinstance(old, numbers) and isinstance(new, numbers):
+        change['change'] = new - old
+    return change
+
+
+def _differs(old, new):
+    """Whether two metric values differ (NaN and None equal themselves)"""
+    if isinstance(old, (float, np.floating)) and isinstance(new, (float, np.floating)):
+        return not (old == new or (np.isnan(old) and np.isnan(new)))
+    return old != new
+
+
+def diff_snapshots(old, new):
+    """
+    What changed between two runs
+
+    Args:
+        old (RunSnapshot): Earlier run (None for a first run)
+        new (RunSnapshot): Later run
+
+    Returns:
+        dict: Runs and dates compared, new trading days, changed settings,
+            added/removed/changed holdings, changed metrics, changed holdings
+            performance and changed charts
+    """
+    if old is None:
+        return {'name': new.name, 'from_run': None, 'to_run': new.run, 'from_date': None,
+                'to_date': new.last_date, 'new_days': len(new.portfolio_history),
+                'settings_changed': [], 'added': sorted(new.holdings), 'removed': [], 'changed': [],
+                'metrics': {}, 'holdings': {}, 'charts_changed': sorted(new.charts)}
+
+    new_days = 0
+    if new.last_date is not None:
+        new_days = int((new.portfolio_history.index > old.last_date).sum()) if old.last_date is not None \
+            else len(new.portfolio_history)
+
+    common = [ticker for ticker in new.holdings if ticker in old.holdings]
+    metrics = {name: _change(old.metrics.get(name), value) for name, value in new.metrics.items()
+               if _differs(old.metrics.get(name), value)}
+
+    holdings = {}
+    for ticker in common:
+        before = old.holdings_performance.get(ticker)
+        after = new.holdings_performance.get(ticker)
+        if before is None or after is None:
+            continue
+        changes = {field: _change(before[field], after[field]) for field in HOLDING_FIELDS
+                   if _differs(before[field], after[field])}
+        if changes:
+            holdings[ticker] = changes
+
+    return {
+        'name': new.name,
+        'from_run': old.run,
+        'to_run': new.run,
+        'from_date': old.last_date,
+        'to_date': new.last_date,
+        'new_days': new_days,
+        'settings_changed': sorted(key for key in new.settings if old.settings.get(key) != new.settings[key]),
+        'added': sorted(ticker for ticker in new.holdings if ticker not in old.holdings),
+        'removed': sorted(ticker for ticker in old.holdings if ticker not in new.holdings),
+        'changed': sorted(ticker for ticker in common if old.holdings[ticker] != new.holdings[ticker]),
+        'metrics': metrics,
+        'holdings': holdings,
+        'charts_changed': sorted(name for name, digest in new.charts.items() if old.charts.get(name) != digest)
+    }
+
+
+def print_snapshot_diff(diff, top_n = 10):
+    """
+    Print a diff report (see diff_snapshots)
+
+    Args:
+        diff (dict): Output of diff_snapshots
+        top_n (int): Holdings to list, largest value change first
+    """
+    print(f"\n{'CHANGES SINCE LAST RUN':-^50}")
+    if diff['from_run'] is None:
+        print(f"First run of {diff['name']}: {len(diff['added'])} holdings, {diff['new_days']} days")
+        return
+
+    def day(date):
+        return date.strftime('%Y-%m-%d') if date is not None else '-'
+
+    print(f"Runs:                 {diff['from_run']} -> {diff['to_run']}")
+    print(f"History:              {day(diff['from_date'])} -> {day(diff['to_date'])} "
+          f"({diff['new_days']} new days)")
+    if diff['settings_changed']:
+        print(f"Settings changed:     {', '.join(diff['settings_changed'])}")
+    for label in ['added', 'removed', 'changed']:
+        if diff[label]:
+            print(f"Holdings {label + ':':<12} {', '.join(diff[label])}")
+
+    percentages = {'total_return', 'annualized_return', 'time_weighted_return', 'annualized_twr',
+                   'money_weighted_return', 'volatility', 'max_drawdown', 'win_rate', 'alpha', 'benchmark_return'}
+    for name, change in diff['metrics'].items():
+        if 'change' not in change:
+            print(f"  {name + ':':<24} {change['old']} -> {change['new']}")
+        elif name in percentages:
+            print(f"  {name + ':':<24} {change['old']:>12.4%} -> {change['new']:>12.4%} ({change['change']:+.4%})")
+        else:
+            print(f"  {name + ':':<24} {change['old']:>12,.4f} -> {change['new']:>12,.4f} ({change['change']:+,.4f})")
+
+    ranked = sorted(diff['holdings'].items(),
+                    key = lambda item: -abs(item[1].get('current_value', {}).get('change', 0.0)))
+    for ticker, changes in ranked[:top_n]:
+        field = 'current_value' if 'current_value' in changes else next(iter(changes))
+        change = changes[field]
+        if field == 'current_value':
+            print(f"  {ticker:<24} ${change['old']:>11,.4f} -> ${change['new']:>11,.4f} ({change['change']:+,.4f})")
+        else:
+            print(f"  {ticker + ' ' + field:<24} {change['old']:>12.4%} -> {change['new']:>12.4%} "
+                  f"({change['change']:+.4%})")
+    if len(ranked) > top_n:
+        print(f"  ... and {len(ranked) - top_n} more holdings changed")
+    if diff['charts_changed']:
+        print(f"Charts changed:       {', '.join(diff['charts_changed'])}")
+
+
+class IncrementalAnalyzer(PortfolioAnalyzer):
+    """
+    Portfolio analyzer that picks up from its last run's snapshot
+
+    The last snapshot of the same portfolio name is loaded when the analyzer
+    is created. If it was made with the same settings, every history needed
+    from the same start date as then (the benchmark's and those of holdings
+    bought on the same date) is extended with the trading days since; new
+    holdings, holdings with an earlier purchase date and, after a settings
+    change, every holding are fetched in full. Valuation and metrics then run as
+    usual on the complete histories, so the results match a run from
+    scratch. save_snapshot stores the run and reports what changed.
+
+    Usage:
+        analyzer = IncrementalAnalyzer(portfolio, name = 'my_portfolio')
+        analyzer.run_analysis()
+        analyzer.save_snapshot(charts)
+    """
+
+    def __init__(self, portfolio, name = 'portfolio', snapshot_dir = None, keep_runs = 5, **options):
+        """
+        Args:
+            portfolio (dict): Portfolio dictionary
+            name (str): Name the portfolio's snapshots are stored under
+            snapshot_dir (str): Snapshot root directory (default: output/snapshots)
+            keep_runs (int): Snapshots to keep (None: every run)
+            **options: PortfolioAnalyzer arguments (benchmark, fetcher, return_mode, ...)
+        """
+        super().__init__(portfolio, **options)
+        self.store = SnapshotStore(name, snapshot_dir, keep = keep_runs)
+        self.last_run = self.store.latest() # Compared against in the diff report
+        self.snapshot = None # This run's snapshot, once saved
+        self.reused = [] # Tickers extended from the last run's histories
+
+    @classmethod
+    def from_ledger(cls, ledger, name = 'portfolio', snapshot_dir = None, keep_runs = 5, **options):
+        """
+        Create an analyzer from a transaction ledger (see PortfolioAnalyzer.from_ledger)
+
+        Args:
+            ledger (TransactionLedger): Transactions
+            name (str): Name the portfolio's snapshots are stored under
+            snapshot_dir (str): Snapshot root directory (default: output/snapshots)
+            keep_runs (int): Snapshots to keep (None: every run)
+            **options: PortfolioAnalyzer.from_ledger arguments
+
+        Returns:
+            IncrementalAnalyzer: The analyzer
+        """
+        analyzer = super().from_ledger(ledger, **options)
+        analyzer.store = SnapshotStore(name, snapshot_dir, keep = keep_runs)
+        analyzer.last_run = analyzer.store.latest()
+        return analyzer
+
+    def _reusable(self):
+        """The last run's snapshot if its histories can be extended (same settings)"""
+        if self.last_run is None or self.last_run.settings != analysis_settings(self):
+            return None
+        return self.last_run
+
+    def fetch_all_data(self):
+        """Fetch all data, extending the last run's histories where they can be reused"""
+        self.reused = []
+        if self._reusable() is None and self.last_run is not None:
+            print(f"Settings changed since run {self.last_run.run} of {self.store.name}; fetching every history")
+        super().fetch_all_data()
+        if self._reusable() is not None:
+            print(f"Extended {len(self.reused)} histories from run {self.last_run.run} of {self.store.name}")
+
+    def _fetch_history(self, ticker, start_date, end_date, auto_adjust = True):
+        # A history fetched from the same date with the same settings only needs the days since
+        previous = self._reusable()
+        stored = None
+        if previous is not None:
+            if ticker == self.benchmark and start_date == previous.benchmark_start:
+                stored = previous.benchmark_data
+            elif previous.start_dates.get(ticker) == start_date:
+                stored = previous.histories.get(ticker)
+        if stored is None or stored.empty:
+            return super()._fetch_history(ticker, start_date, end_date, auto_adjust = auto_adjust)
+
+        fresh = super()._fetch_history(ticker, stored.index[-1].strftime('%Y-%m-%d'), end_date,
+                                       auto_adjust = auto_adjust)
+        self.reused.append(ticker)
+        return extend_history(stored, fresh)
+
+    def save_snapshot(self, charts = None, top_n = 10):
+        """
+        Store this run and print what changed since the last one
+
+        Args:
+            charts (dict): Rendered charts (chart name -> io.BytesIO) to hash (optional)
+            top_n (int): Holdings to list in the diff report
+
+        Returns:
+            dict: The diff report (see diff_snapshots), also written as JSON next to the snapshot
+        """
+        runs = self.store.runs()
+        self.snapshot = RunSnapshot.from_analyzer(self, self.store.name, runs[-1] + 1 if runs else 1, charts)
+        path = self.store.save(self.snapshot)
+        print(f"\nSnapshot saved to: {path}")
+
+        diff = diff_snapshots(self.last_run, self.snapshot)
+        with open(path[:-len('.pkl')] + '-diff.json', 'w') as f:
+            json.dump(_json_safe(diff), f, indent = 2)
+        print_snapshot_diff(diff, top_n = top_n)
+        return diff
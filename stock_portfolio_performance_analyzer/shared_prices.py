@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+
+class SharedPriceMatrix:
+    """
+    Publish aligned price (and returns) matrices for process-pool workers
+
+    The parent process copies each matrix once into a shared memory block or a
+    memory-mapped file and hands workers a small, picklable handle. Workers
+    attach to it with attach() and get read-only NumPy views of the same
+    memory, so adding workers adds neither copies nor serialization cost.
+
+    Usage:
+        with SharedPriceMatrix(prices) as shared:
+            executor.submit(work, shared.handle, ...)
+
+        def work(handle, ...):
+            view = SharedPriceMatrix.attach(handle)
+            view.prices  # read-only np.ndarray, dates x tickers
+    """
+
+    def __init__(self, prices, include_returns = False, backend = 'shm', directory = None):
+        """
+        Args:
+            prices (pd.DataFrame): Aligned prices, dates x tickers
+            include_returns (bool): Also publish the daily returns matrix
+            backend (str): 'shm' for multiprocessing.shared_memory, 'memmap' for a memory-mapped file
+            directory (str): Where to put memmap files (default: a new temporary directory)
+        """
+        if backend not in ('shm', 'memmap'):
+            raise ValueError(f"Unsupported backend: {backend}")
+
+        self.backend = backend
+        self._blocks = [] # SharedMemory blocks owned by this process
+        self._directory = None # Temporary memmap directory owned by this process
+
+        matrices = {'prices': prices.to_numpy(dtype = np.float64)}
+        if include_returns:
+            matrices['returns'] = prices.pct_change(fill_method = None).to_numpy(dtype = np.float64)
+
+        if backend == 'memmap' and directory is None:
+            directory = tempfile.mkdtemp(prefix = 'portfolio_prices_')
+            self._directory = directory
+
+        arrays = {}
+        for name, matrix in matrices.items():
+            if backend == 'shm':
+                block = shared_memory.SharedMemory(create = True, size = max(matrix.nbytes, 1))
+                self._blocks.append(block)
+                target = np.ndarray(matrix.shape, dtype = matrix.dtype, buffer = block.buf)
+                location = block.name
+            else:
+                location = os.path.join(directory, f'{name}.f8')
+                target = np.memmap(location, dtype = matrix.dtype, mode = 'w+', shape = matrix.shape)
+            target[:] = matrix
+            if backend == 'memmap':
+                target.flush()
+            arrays[name] = {'location': location, 'shape': matrix.shape, 'dtype': matrix.dtype.str}
+            del target
+
+        # Everything a worker needs to rebuild the views; small and picklable
+        self.handle = {
+            'backend': backend,
+            'arrays': arrays,
+            'dates': prices.index.asi8.copy(),
+            'tz': None if prices.index.tz is None else str(prices.index.tz),
+            'tickers': list(prices.columns)
+        }
+
+    @staticmethod
+    def attach(handle):
+        """
+        Attach to published matrices from any process
+
+        Args:
+            handle (dict): SharedPriceMatrix.handle from the publishing process
+
+        Returns:
+            AttachedPrices: Read-only views of the matrices plus their labels
+        """
+        return AttachedPrices(handle)
+
+    def close(self):
+        """Release and remove the published matrices (call from the publishing process)"""
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors = True)
+            self._directory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class AttachedPrices:
+    """Read-only views of matrices published by SharedPriceMatrix"""
+
+    def __init__(self, handle):
+        """
+        Args:
+            handle (dict): SharedPriceMatrix.handle
+        """
+        self._blocks = [] # Keep the blocks open for as long as the views are used
+        self.calendar = pd.DatetimeIndex(handle['dates'].view('datetime64[ns]'))
+        if handle['tz'] is not None:
+            self.calendar = self.calendar.tz_localize('UTC').tz_convert(handle['tz'])
+        self.tickers = pd.Index(handle['tickers'])
+
+        self.prices = None
+        self.returns = None
+        for name, spec in handle['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            if handle['backend'] == 'shm':
+                block = _attach_block(spec['location'])
+                self._blocks.append(block)
+                view = np.ndarray(spec['shape'], dtype = dtype, buffer = block.buf)
+            else:
+                view = np.memmap(spec['location'], dtype = dtype, mode = 'r', shape = tuple(spec['shape']))
+            view.flags.writeable = False
+            setattr(self, name, view)
+
+    def to_frame(self, name = 'prices'):
+        """Wrap a view in a DataFrame (dates x tickers) without copying it"""
+        return pd.DataFrame(getattr(self, name), index = self.calendar, columns = self.tickers, copy = False)
+
+    def close(self):
+        """Detach from the shared memory blocks"""
+        self.prices = None
+        self.returns = None
+        for block in self._blocks:
+            block.close()
+        self._blocks = []
+
+
+def _attach_block(name):
+    """
+    Open an existing shared memory block without taking ownership of it
+
+    Python 3.13+ can attach untracked. Older versions register the block with
+    the resource tracker again, which is harmless for pool workers: they share
+    the publisher's tracker, and only the publisher unlinks the block.
+    """
+    try:
+        return shared_memory.SharedMemory(name = name, track = False)
+    except TypeError:
+        return shared_memory.SharedMemory(name = name)
@@ -0,0 +1,129 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Heavy libraries and the modules that pull them in
+HEAVY_MODULES = ['pandas', 'matplotlib', 'seaborn', 'scipy', 'reportlab', 'yfinance',
+                 'portfolio_analyzer', 'visualize_', 'PDF_generate_']
+
+# Command line -> (modules it must not import, wall time budget in seconds on the
+# machine where REFERENCE_SECONDS was measured)
+STARTUP_BUDGETS = {
+    '--help': (HEAVY_MODULES, 0.5),
+    'batch --help': (HEAVY_MODULES, 0.5),
+    'serve --help': (['matplotlib', 'seaborn', 'scipy', 'reportlab', 'yfinance',
+                      'portfolio_analyzer', 'visualize_', 'PDF_generate_'], 1.0),
+}
+
+# A fresh interpreter importing numpy took this long where the budgets were set;
+# budgets are scaled by how much slower it is here, so a slow or busy CI machine
+# does not fail them. STARTUP_BUDGET_SCALE sets the scale instead.
+REFERENCE_CODE = 'import numpy'
+REFERENCE_SECONDS = 0.15
+
+# Runs main() in a fresh interpreter and reports which heavy modules it loaded
+_PROBE = """
+import contextlib, io, json, sys
+sys.argv = ['main.py'] + {args!r}
+import main
+with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+    try:
+        main.main()
+    except SystemExit:
+        pass
+print(json.dumps(sorted(m for m in {heavy!r} if m in sys.modules)))
+"""
+
+
+def measure_startup(command, repeat = 3):
+    """
+    Time a main.py command in fresh interpreters and list the heavy modules it imports
+
+    Args:
+        command (str): Arguments after main.py, e.g. 'batch --help'
+        repeat (int): Runs to take the best time from
+
+    Returns:
+        dict: command, best wall time in seconds and heavy modules imported
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = _PROBE.format(args = command.split(), heavy = HEAVY_MODULES)
+    best = None
+    imported = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', code], cwd = here,
+                                capture_output = True, text = True, check = True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        imported = json.loads(result.stdout.strip().splitlines()[-1])
+    return {'command': command, 'seconds': best, 'imported': imported}
+
+
+def budget_scale(repeat = 3):
+    """
+    Factor to scale the time budgets by on this machine
+
+    Returns:
+        float: STARTUP_BUDGET_SCALE if set, else this machine's time for
+            REFERENCE_CODE over REFERENCE_SECONDS (never below 1)
+    """
+    if os.environ.get('STARTUP_BUDGET_SCALE'):
+        return float(os.environ['STARTUP_BUDGET_SCALE'])
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', REFERENCE_CODE], capture_output = True, check = True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return max(1.0, best / REFERENCE_SECONDS)
+
+
+def check_startup(budgets = STARTUP_BUDGETS, scale = None, retries = 1):
+    """
+    Check that lightweight commands stay lightweight
+
+    Imports are checked exactly. Times are checked against the budgets
+    scaled to this machine (see budget_scale), and a command over its budget
+    is measured again up to `retries` times before it fails, so a moment of
+    load on a shared machine is not reported as a regression.
+
+    Args:
+        budgets (dict): {command: (forbidden modules, seconds)}
+        scale (float): Budget scale (default: budget_scale())
+        retries (int): Extra measurements of a command over its budget
+
+    Returns:
+        list: Failure messages (empty when every command is within budget)
+    """
+    scale = budget_scale() if scale is None else scale
+    print(f"Budget scale: {scale:.2f}")
+    failures = []
+    for command, (forbidden, budget) in budgets.items():
+        budget *= scale
+        result = measure_startup(command)
+        for _ in range(retries):
+            if result['seconds'] <= budget:
+                break
+            retry = measure_startup(command)
+            result = dict(retry, seconds = min(result['seconds'], retry['seconds']))
+        loaded = [m for m in result['imported'] if m in forbidden]
+        status = 'ok' if not loaded and result['seconds'] <= budget else 'FAIL'
+        print(f"{command:<16} {result['seconds']:>6.2f} s (budget {budget:.2f} s)  {status}"
+              + (f"  imports: {', '.join(loaded)}" if loaded else ''))
+        if loaded:
+            failures.append(f"'{command}' imports {', '.join(loaded)}")
+        if result['seconds'] > budget:
+            failures.append(f"'{command}' took {result['seconds']:.2f} s (budget {budget:.2f} s)")
+    return failures
+
+
+if __name__ == "__main__":
+    # Import-time regression check: python startup_check.py
+    # (STARTUP_BUDGET_SCALE=2 python startup_check.py doubles the time budgets)
+    failures = check_startup()
+    for failure in failures:
+        print(f"✗ {failure}")
+    sys.exit(1 if failures else 0)
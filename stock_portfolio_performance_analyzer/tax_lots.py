@@ -0,0 +1,350 @@
+import heapq
+
+import numpy as np
+import pandas as pd
+
+LOT_METHODS = ('FIFO', 'LIFO', 'HIFO', 'SPECIFIC')
+
+# Holding period after which a gain is long-term
+LONG_TERM_DAYS = 365
+
+# Shares below this are rounding noise
+SHARES_EPSILON = 1e-9
+
+
+def _match_fifo(codes, shares, is_buy):
+    """
+    FIFO matching without a loop, by intersecting share intervals
+
+    Under FIFO the n-th share sold from a holding is always its n-th share
+    bought. Numbering each holding's bought and sold shares with running
+    totals, buy k covers [bought before k, bought through k) and sell j
+    covers [sold before j, sold through j); a (buy, sell) match is the
+    overlap of the two intervals. Sorting every interval end of a holding
+    together gives the elementary segments, and each segment belongs to the
+    next buy end and the next sell end at or after it.
+
+    Args:
+        codes (np.ndarray): Holding code of each trade, in date order
+        shares (np.ndarray): Shares of each trade (positive for buys and sells)
+        is_buy (np.ndarray): Whether each trade is a buy
+
+    Returns:
+        tuple: Same as _match_sells
+    """
+    codes = np.asarray(codes)
+    position = np.arange(len(codes))
+    # Running shares bought and sold per holding (each counts only its own side)
+    running = pd.DataFrame({'bought': np.where(is_buy, shares, 0.0), 'sold': np.where(is_buy, 0.0, shares)})
+    running = running.groupby(codes).cumsum()
+    running = np.where(is_buy, running['bought'].to_numpy(), running['sold'].to_numpy())
+    buys, sells = position[is_buy], position[~is_buy]
+
+    # Interval ends, sorted by holding then end (buy ends first on ties)
+    point_code = np.concatenate([codes[buys], codes[sells]])
+    point_end = np.concatenate([running[buys], running[sells]])
+    point_kind = np.concatenate([np.zeros(len(buys), dtype = np.int8), np.ones(len(sells), dtype = np.int8)])
+    point_position = np.concatenate([buys, sells])
+    order = np.lexsort((point_kind, point_end, point_code))
+    point_code, point_end = point_code[order], point_end[order]
+    point_kind, point_position = point_kind[order], point_position[order]
+
+    # Owner of each segment: the next buy end / sell end at or after its end point,
+    # found as a reverse running minimum of the ends' ranks in sorted order
+    no_owner = np.iinfo(np.int64).max
+    is_buy_point = point_kind == 0
+    buy_ends, sell_ends = point_position[is_buy_point], point_position[~is_buy_point]
+    next_buy = np.where(is_buy_point, np.cumsum(is_buy_point) - 1, no_owner)[::-1]
+    next_buy = np.minimum.accumulate(next_buy)[::-1]
+    next_sell = np.where(~is_buy_point, np.cumsum(~is_buy_point) - 1, no_owner)[::-1]
+    next_sell = np.minimum.accumulate(next_sell)[::-1]
+
+    same_holding = np.r_[False, point_code[1:] == point_code[:-1]]
+    segment_start = np.where(same_holding, np.r_[0.0, point_end[:-1]], 0.0)
+    length = point_end - segment_start
+
+    valid = (length > SHARES_EPSILON) & (next_buy != no_owner) & (next_sell != no_owner)
+    buy = buy_ends[np.where(valid, next_buy, 0)]
+    sell = sell_ends[np.where(valid, next_sell, 0)] if len(sells) else position[:0]
+    if len(sells):
+        sell_start = running[sell] - shares[sell]
+        valid &= (codes[buy] == point_code) & (codes[sell] == point_code) & \
+                 (sell_start <= segment_start + SHARES_EPSILON)
+    else:
+        valid[:] = False
+    sell, buy, matched = sell[valid], buy[valid], length[valid]
+
+    if np.any(buy > sell):
+        raise ValueError("A sell exceeds the open lots of its holding; short sales have no tax lots")
+    sold = np.bincount(codes[sells], weights = shares[sells], minlength = codes.max() + 1 if len(codes) else 0)
+    if np.abs(np.bincount(codes[sell], weights = matched, minlength = len(sold)) - sold).max(initial = 0.0) > 1e-6:
+        raise ValueError("A sell exceeds the open lots of its holding; short sales have no tax lots")
+
+    by_sell = np.lexsort((buy, sell))
+    sell, buy, matched = sell[by_sell], buy[by_sell], matched[by_sell]
+    remaining = np.where(is_buy, shares, 0.0)
+    remaining -= np.bincount(buy, weights = matched, minlength = len(codes))
+    remaining[np.abs(remaining) <= SHARES_EPSILON] = 0.0
+    return sell, buy, matched, remaining
+
+
+def _match_sells(codes, shares, is_buy, unit_cost, labels, method):
+    """
+    Match every sell against the open buy lots of its holding
+
+    Lot state lives in flat lists indexed by trade position; each holding's
+    queue holds only integer positions (a FIFO list with a head pointer, a
+    LIFO stack or a HIFO heap keyed on cost), so a ledger with millions of
+    lots never creates a Python object per lot. A lot emptied through another
+    queue (specific-lot sells) is skipped lazily when it reaches the front.
+
+    Args:
+        codes (list): Holding code of each trade, in date order
+        shares (list): Shares of each trade (positive for buys and sells)
+        is_buy (list): Whether each trade is a buy
+        unit_cost (list): Cost per share of each buy, fees included
+        labels (list): Lot label of each trade ('' for none)
+        method (str): One of LOT_METHODS
+
+    Returns:
+        tuple: (sell positions, buy positions, shares) of every match, and the
+            shares left in every trade position (0 for sells)
+    """
+    remaining = [s if b else 0.0 for s, b in zip(shares, is_buy)]
+    match_sell, match_buy, match_shares = [], [], []
+    books = {} # Holding -> [positions, head] (FIFO, SPECIFIC), stack (LIFO) or heap (HIFO)
+    labelled = {} # (holding, label) -> [positions, head] (SPECIFIC)
+
+    def take_queue(i, queue, need):
+        positions, head = queue
+        while need > SHARES_EPSILON and head < len(positions):
+            j = positions[head]
+            lot = remaining[j]
+            if lot > SHARES_EPSILON:
+                used = lot if lot < need else need
+                match_sell.append(i)
+                match_buy.append(j)
+                match_shares.append(used)
+                remaining[j] = lot - used
+                need -= used
+                if remaining[j] > SHARES_EPSILON:
+                    break
+            head += 1
+        queue[1] = head
+        return need
+
+    for i in range(len(codes)):
+        h = codes[i]
+        if is_buy[i]:
+            if method == 'LIFO':
+                books.setdefault(h, []).append(i)
+            elif method == 'HIFO':
+                heapq.heappush(books.setdefault(h, []), (-unit_cost[i], i))
+            else:
+                books.setdefault(h, [[], 0])[0].append(i)
+                if method == 'SPECIFIC' and labels[i]:
+                    labelled.setdefault((h, labels[i]), [[], 0])[0].append(i)
+            continue
+
+        need = shares[i]
+        book = books.get(h)
+        if method == 'LIFO':
+            while need > SHARES_EPSILON and book:
+                j = book[-1]
+                used = min(remaining[j], need)
+                match_sell.append(i)
+                match_buy.append(j)
+                match_shares.append(used)
+                remaining[j] -= used
+                need -= used
+                if remaining[j] <= SHARES_EPSILON:
+                    book.pop()
+        elif method == 'HIFO':
+            while need > SHARES_EPSILON and book:
+                j = book[0][1]
+                used = min(remaining[j], need)
+                match_sell.append(i)
+                match_buy.append(j)
+                match_shares.append(used)
+                remaining[j] -= used
+                need -= used
+                if remaining[j] <= SHARES_EPSILON:
+                    heapq.heappop(book)
+        else:
+            if method == 'SPECIFIC' and labels[i] and (h, labels[i]) in labelled:
+                need = take_queue(i, labelled[(h, labels[i])], need)
+            if book is not None:
+                need = take_queue(i, book, need)
+
+        if need > SHARES_EPSILON:
+            raise ValueError(f"A sell exceeds the open lots of its holding by {need:g} shares; "
+                             "short sales have no tax lots")
+
+    return match_sell, match_buy, match_shares, remaining
+
+
+class TaxLots:
+    """
+    Tax lots of a transaction ledger, with realized and unrealized gains
+
+    Every buy opens a lot. Sells close lots under one of the matching rules:
+        FIFO      oldest lot first
+        LIFO      newest lot first
+        HIFO      highest cost per share first
+        SPECIFIC  the lot named in the sell's lot column, then FIFO
+    Buy fees are part of a lot's cost and sell fees reduce the proceeds.
+
+    Usage:
+        lots = TaxLots(ledger, method = 'HIFO')
+        lots.realized                        # one row per (sell, lot) match
+        lots.holdings({'AAPL': 190.0})       # per holding cost, realized and unrealized gains
+        lots.realized_by_period('Y')
+    """
+
+    def __init__(self, ledger, method = 'FIFO'):
+        """
+        Args:
+            ledger (TransactionLedger): Transactions to match
+            method (str): Lot matching rule, one of LOT_METHODS
+
+        Raises:
+            ValueError: For an unknown method, or a sell with no open lots to match
+        """
+        method = method.upper()
+        if method not in LOT_METHODS:
+            raise ValueError(f"Unknown lot method {method!r}; use one of {', '.join(LOT_METHODS)}")
+        self.method = method
+
+        trades = ledger.transactions[ledger.is_trade]
+        codes = ledger.holding_codes
+        is_buy = ledger.signed_shares[ledger.is_trade] > 0
+        shares = trades['shares'].to_numpy(dtype = float)
+        price = trades['price'].to_numpy(dtype = float)
+        fees = trades['fees'].to_numpy(dtype = float)
+        # Per share: cost of a bought share, proceeds of a sold one
+        unit = np.where(is_buy, price + fees / shares, price - fees / shares)
+
+        # Only holdings with at least one sell need matching; the rest stay whole
+        has_sell = np.zeros(len(ledger.holdings), dtype = bool)
+        has_sell[codes[~is_buy]] = True
+        subset = np.flatnonzero(has_sell[codes])
+        if method == 'FIFO':
+            sell, buy, matched, left = _match_fifo(codes[subset], shares[subset], is_buy[subset])
+        else:
+            sell, buy, matched, left = _match_sells(
+                codes[subset].tolist(), shares[subset].tolist(), is_buy[subset].tolist(),
+                unit[subset].tolist(), trades['lot'].to_numpy()[subset].tolist(), method)
+
+        remaining = np.where(is_buy, shares, 0.0)
+        remaining[subset] = left
+        sell = subset[np.asarray(sell, dtype = np.int64)]
+        buy = subset[np.asarray(buy, dtype = np.int64)]
+        matched = np.asarray(matched, dtype = float)
+
+        account = trades['account'].to_numpy()
+        ticker = trades['ticker'].to_numpy()
+        dates = trades['date'].to_numpy()
+        lot_ids = trades.index.to_numpy()
+        labels = trades['lot'].to_numpy()
+
+        days = (dates[sell] - dates[buy]).astype('timedelta64[D]').astype(np.int64)
+        cost = matched * unit[buy]
+        proceeds = matched * unit[sell]
+        self.realized = pd.DataFrame({
+            'account': account[sell],
+            'ticker': ticker[sell],
+            'lot': lot_ids[buy],
+            'label': labels[buy],
+            'buy_date': dates[buy],
+            'sell_date': dates[sell],
+            'shares': matched,
+            'cost': cost,
+            'proceeds': proceeds,
+            'gain': proceeds - cost,
+            'days_held': days,
+            'long_term': days > LONG_TERM_DAYS
+        })
+
+        open_lot = is_buy & (remaining > SHARES_EPSILON)
+        self.open_lots = pd.DataFrame({
+            'account': account[open_lot],
+            'ticker': ticker[open_lot],
+            'lot': lot_ids[open_lot],
+            'label': labels[open_lot],
+            'buy_date': dates[open_lot],
+            'shares': remaining[open_lot],
+            'unit_cost': unit[open_lot],
+            'cost': remaining[open_lot] * unit[open_lot]
+        })
+
+    def unrealized(self, current_prices):
+        """
+        Unrealized gain of every open lot
+
+        Args:
+            current_prices (dict or pd.Series): Ticker -> current price
+
+        Returns:
+            pd.DataFrame: open_lots with price, value and gain columns (NaN without a price)
+        """
+        lots = self.open_lots.copy()
+        lots['price'] = lots['ticker'].map(pd.Series(current_prices, dtype = float))
+        lots['value'] = lots['shares'] * lots['price']
+        lots['gain'] = lots['value'] - lots['cost']
+        return lots
+
+    def holdings(self, current_prices = None):
+        """
+        Cost basis, realized and unrealized gains per holding
+
+        Args:
+            current_prices (dict or pd.Series): Ticker -> current price (optional)
+
+        Returns:
+            pd.DataFrame: One row per (account, ticker), closed holdings included
+                (shares 0): shares, cost, avg_cost, first_buy_date, value,
+                unrealized_gain, realized_gain, realized_short_term, realized_long_term
+        """
+        lots = self.unrealized(current_prices if current_prices is not None else {})
+        open_part = lots.groupby(['account', 'ticker'], sort = False).agg(
+            shares = ('shares', 'sum'), cost = ('cost', 'sum'), first_buy_date = ('buy_date', 'min'),
+            value = ('value', 'sum'), unrealized_gain = ('gain', 'sum'))
+
+        realized = self.realized.assign(
+            short_term = self.realized['gain'].where(~self.realized['long_term'], 0.0),
+            long_term_gain = self.realized['gain'].where(self.realized['long_term'], 0.0))
+        closed_part = realized.groupby(['account', 'ticker'], sort = False).agg(
+            realized_gain = ('gain', 'sum'), realized_short_term = ('short_term', 'sum'),
+            realized_long_term = ('long_term_gain', 'sum'))
+
+        holdings = open_part.join(closed_part, how = 'outer')
+        fill = ['shares', 'cost', 'realized_gain', 'realized_short_term', 'realized_long_term']
+        holdings[fill] = holdings[fill].fillna(0.0)
+        if current_prices is None:
+            holdings[['value', 'unrealized_gain']] = np.nan
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            holdings['avg_cost'] = np.where(holdings['shares'] > 0, holdings['cost'] / holdings['shares'], np.nan)
+        return holdings.reset_index()[['account', 'ticker', 'shares', 'cost', 'avg_cost', 'first_buy_date',
+                                       'value', 'unrealized_gain', 'realized_gain',
+                                       'realized_short_term', 'realized_long_term']]
+
+    def realized_by_period(self, freq = 'Y'):
+        """
+        Realized gains per account and period
+
+        Args:
+            freq (str): Period of the sell dates, e.g. 'Y', 'Q' or 'M'
+
+        Returns:
+            pd.DataFrame: account, period, short_term, long_term, total
+        """
+        realized = self.realized
+        period = pd.DatetimeIndex(realized['sell_date']).to_period(freq)
+        table = pd.DataFrame({
+            'account': realized['account'].to_numpy(),
+            'period': period,
+            'short_term': np.where(realized['long_term'], 0.0, realized['gain']),
+            'long_term': np.where(realized['long_term'], realized['gain'], 0.0)
+        }).groupby(['account', 'period'], sort = True).sum()
+        table['total'] = table['short_term'] + table['long_term']
+        return table.reset_index()
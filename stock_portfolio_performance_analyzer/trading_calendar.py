@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+
+
+def _as_index(dates):
+    """DatetimeIndex in nanoseconds from an index, a Series or a list of dates"""
+    if not isinstance(dates, pd.DatetimeIndex):
+        # Already parsed (datetime64) columns convert without touching each value
+        dates = pd.DatetimeIndex(pd.to_datetime(dates if isinstance(dates, pd.Series) else list(dates)))
+    return dates if dates.unit == 'ns' else dates.as_unit('ns')
+
+
+def _days(dates):
+    """Local calendar days of a DatetimeIndex, as int64 nanoseconds"""
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    return dates.normalize().asi8
+
+
+class TradingCalendar:
+    """
+    One trading calendar for many price histories, with as-of positions
+
+    The calendar is the sorted union of every history's timestamps, built once
+    from their int64 values. Each ticker gets a position array from one
+    searchsorted: for every calendar date, the position of the ticker's last
+    valid observation on or before it (-1 before its first one). Aligning a
+    history, or reading its price on any calendar date, is then an integer
+    gather instead of a label lookup, a reindex or a forward fill.
+
+    Usage:
+        calendar = TradingCalendar.from_histories(histories)
+        prices = calendar.price_matrix(histories)   # dates x tickers, as-of aligned
+        start = calendar.positions(['2023-01-03'])  # first calendar row on or after
+        calendar.asof['VOO']                        # VOO's observation behind each row
+    """
+
+    def __init__(self, dates):
+        """
+        Args:
+            dates (pd.DatetimeIndex): Calendar dates (sorted and de-duplicated here)
+        """
+        dates = _as_index(dates)
+        if not (dates.is_monotonic_increasing and dates.is_unique):
+            dates = dates.unique().sort_values()
+        self.dates = dates
+        self.asof = {} # Ticker -> position of its last valid observation (among its non-missing values) at each date
+
+    @classmethod
+    def from_indexes(cls, indexes):
+        """
+        Build the union calendar of several date indexes
+
+        Indexes in one time zone keep it; a mix of time zones gives a UTC
+        calendar (naive indexes are then read as UTC).
+
+        Args:
+            indexes (iterable): pd.DatetimeIndex objects
+
+        Returns:
+            TradingCalendar: The calendar
+        """
+        indexes = [_as_index(index) for index in indexes]
+        if not indexes:
+            return cls(pd.DatetimeIndex([]))
+
+        zones = {str(index.tz) for index in indexes}
+        tz = indexes[0].tz if len(zones) == 1 else 'UTC'
+        if len(zones) > 1:
+            indexes = [index.tz_convert('UTC') if index.tz is not None else index.tz_localize('UTC')
+                       for index in indexes]
+
+        # Sorting int64 values once is far cheaper than repeated index unions
+        values = np.unique(np.concatenate([index.asi8 for index in indexes]))
+        dates = pd.DatetimeIndex(values.view('M8[ns]'), name = indexes[0].name)
+        if tz is not None:
+            dates = dates.tz_localize('UTC').tz_convert(tz)
+        return cls(dates)
+
+    @classmethod
+    def from_histories(cls, histories):
+        """
+        Build the union calendar of price histories
+
+        Args:
+            histories (dict): Ticker -> historical data (empty or None entries are skipped)
+
+        Returns:
+            TradingCalendar: The calendar
+        """
+        return cls.from_indexes(df.index for df in histories.values() if df is not None and not df.empty)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def _instants(self, dates):
+        """int64 values of dates, comparable with the calendar's"""
+        dates = _as_index(dates)
+        if self.dates.tz is not None and dates.tz is None:
+            dates = dates.tz_localize(self.dates.tz)
+        elif self.dates.tz is None and dates.tz is not None:
+            dates = dates.tz_localize(None)
+        return dates.asi8
+
+    def asof_positions(self, index, by_day = False):
+        """
+        Position in `index` of the last entry on or before each calendar date
+
+        Args:
+            index (pd.DatetimeIndex): Sorted dates of one series
+            by_day (bool): Compare local calendar days instead of instants, for
+                series stamped in another time zone (e.g. FX quotes)
+
+        Returns:
+            np.ndarray: One position per calendar date (-1 before the first entry)
+        """
+        index = _as_index(index)
+        if by_day:
+            return np.searchsorted(_days(index), _days(self.dates), side = 'right') - 1
+        return np.searchsorted(self._instants(index), self.dates.asi8, side = 'right') - 1
+
+    def positions(self, dates):
+        """
+        First calendar position on or after each date
+
+        Args:
+            dates (array-like): Dates (strings or timestamps)
+
+        Returns:
+            np.ndarray: Positions (len(self) for dates after the calendar)
+        """
+        return np.searchsorted(self.dates.asi8, self._instants(dates), side = 'left')
+
+    @staticmethod
+    def take(values, positions):
+        """
+        Gather values by as-of positions
+
+        Args:
+            values (np.ndarray): One series' values
+            positions (np.ndarray): Positions from asof_positions
+
+        Returns:
+            np.ndarray: values[positions] as floats, NaN where the position is -1
+        """
+        values = np.asarray(values, dtype = float)
+        if len(values) == 0:
+            return np.full(len(positions), np.nan)
+        aligned = values[np.maximum(positions, 0)]
+        aligned[positions < 0] = np.nan
+        return aligned
+
+    def align(self, series, key = None, by_day = False):
+        """
+        Align one series on the calendar as of each date, skipping missing values
+
+        Args:
+            series (pd.Series): Values on a DatetimeIndex
+            key (str): Remember the positions in self.asof under this key (optional)
+            by_day (bool): See asof_positions
+
+        Returns:
+            np.ndarray: Last valid value on or before each calendar date (NaN before the first)
+        """
+        values = series.to_numpy(dtype = float)
+        if by_day:
+            instants, calendar = _days(_as_index(series.index)), _days(self.dates)
+        else:
+            instants, calendar = self._instants(series.index), self.dates.asi8
+        valid = ~np.isnan(values)
+        if not valid.all():
+            values, instants = values[valid], instants[valid]
+        if len(instants) > 1 and (np.diff(instants) < 0).any():
+            order = np.argsort(instants, kind = 'stable')
+            values, instants = values[order], instants[order]
+
+        positions = np.searchsorted(instants, calendar, side = 'right') - 1
+        if key is not None:
+            self.asof[key] = positions
+        return self.take(values, positions)
+
+    def price_matrix(self, histories, column = 'Close'):
+        """
+        As-of aligned price matrix
+
+        Args:
+            histories (dict): Ticker -> historical data (pd.DataFrame with the column)
+            column (str): Price column to use
+
+        Returns:
+            pd.DataFrame: Prices, dates x tickers (NaN before a ticker's first price)
+        """
+        histories = {t: df[column] for t, df in histories.items() if df is not None and not df.empty}
+        prices = np.full((len(self.dates), len(histories)), np.nan)
+        for j, (ticker, series) in enumerate(histories.items()):
+            prices[:, j] = self.align(series, key = ticker)
+        return pd.DataFrame(prices, index = self.dates, columns = list(histories))
+
+    def event_matrix(self, histories, column, tickers):
+        """
+        Per-date events (Dividends, Stock Splits) on the calendar, without carrying them forward
+
+        Args:
+            histories (dict): Ticker -> historical data
+            column (str): Event column to use
+            tickers (list): Output columns, in order
+
+        Returns:
+            pd.DataFrame: Event amounts, dates x tickers (0 where there is none)
+        """
+        events = np.zeros((len(self.dates), len(tickers)))
+        calendar = self.dates.asi8
+        for j, ticker in enumerate(tickers):
+            df = histories.get(ticker)
+            if df is None or df.empty or column not in df:
+                continue
+            series = df[column]
+            series = series[series.fillna(0) != 0]
+            instants = self._instants(series.index)
+            rows = np.searchsorted(calendar, instants, side = 'left')
+            exact = rows < len(calendar)
+            exact[exact] = calendar[rows[exact]] == instants[exact]
+            # Same-date duplicates: the last one wins, as with keep = 'last'
+            events[rows[exact], j] = series.to_numpy(dtype = float)[exact]
+        return pd.DataFrame(events, index = self.dates, columns = list(tickers))
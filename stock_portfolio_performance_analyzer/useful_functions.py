@@ -1,9 +1,9 @@
-import pandas as pd
 import os
 from datetime import datetime
-from PDF_generate_ import ReportGenerator
-from portfolio_analyzer import PortfolioAnalyzer
-from visualize_ import PortfolioVisualization
+
+# pandas, the analyzer, the charts (matplotlib, seaborn) and the PDF builder
+# (reportlab) are imported by the functions that use them, so that help and
+# other lightweight commands start without loading them
 
 
 def load_portfolio_from_csv(filepath):
@@ -15,35 +15,40 @@ def load_portfolio_from_csv(filepath):
     AAPL, 10, 150.0, 2023-01-01
     GOOGL, 5, 100.0, 2023-01-01
     
+    Rows are validated together and every bad row is reported. Tickers are
+    stripped and uppercased, so 'aapl' and 'AAPL' are the same holding.
+    Several lots of one ticker are merged into one position: shares summed,
+    the cost-weighted average purchase price and the earliest purchase date
+    (see merge_duplicate_lots). The merged tickers are listed in a warning.
+    Parquet files are read the same way.
+    
     Args:
         filepath (str): Path to CSV file
         
     Returns:
         dict: Portfolio dictionary or None if error
     """
+    from portfolio_loader import load_positions, positions_to_portfolio, repeated_tickers, PortfolioValidationError
+    
     try:
-        df = pd.read_csv(filepath)
-        
-        # Validate columns
-        required_cols = ['ticker', 'shares', 'purchase_price', 'purchase_date']
-        if not all(col in df.columns for col in required_cols):
-            raise ValueError(f"CSV must contain columns: {required_cols}")
-        
-        # Convert to portfolio dictionary
-        portfolio = {}
-        for _, row in df.iterrows():
-            portfolio[row['ticker']] = {
-                'shares': float(row['shares']),
-                'purchase_price': float(row['purchase_price']),
-                'purchase_date': row['purchase_date']
-            }
+        positions = load_positions(filepath)
+        portfolio = positions_to_portfolio(positions)
         
         print(f"✓ Loaded {len(portfolio)} holdings from {filepath}")
+        repeated = repeated_tickers(positions)
+        if len(repeated):
+            print(f"⚠️  {filepath}: {len(repeated)} ticker(s) had several lots, each merged into one position "
+                  f"(shares summed, cost-weighted purchase price, earliest purchase date): "
+                  + ', '.join(f"{ticker} ({count} lots)" for ticker, count in repeated.items()))
         return portfolio
         
     except FileNotFoundError:
         print(f"Error: File not found: {filepath}")
         return None
+    except PortfolioValidationError as e:
+        # The message lists every bad row with its line number
+        print(f"Error: invalid portfolio rows, nothing was loaded.\n{str(e)}")
+        return None
     except Exception as e:
         print(f"Error loading portfolio from CSV: {str(e)}")
         return None
@@ -58,6 +63,8 @@ def create_demo_portfolio_csv(filepath = 'data/demo_portfolio.csv'):
     Returns:
         str: Path to created file
     """
+    import pandas as pd
+    
     # Create data directory if it doesn't exist
     os.makedirs('data', exist_ok = True)
 
@@ -98,7 +105,9 @@ def display_portfolio(portfolio):
     print(f"{'TOTAL INVESTED':>40} ${total_invested:>14,.2f}")
     print("="*70)
 
-def run_full_analysis(portfolio, benchmark='^GSPC', generate_pdf=True, show_charts=False):
+def run_full_analysis(portfolio, benchmark='^GSPC', generate_pdf=True, show_charts=False,
+                      batch_mode=False, save_charts=True, vector_charts=False, image_dpi=None,
+                      holdings_top_n=None, profile=None, snapshot=None):
     """
     Run complete portfolio analysis workflow
     
@@ -113,61 +122,108 @@ def run_full_analysis(portfolio, benchmark='^GSPC', generate_pdf=True, show_char
         benchmark (str): Benchmark ticker (default: S&P 500)
         generate_pdf (bool): Whether to generate PDF report
         show_charts (bool): Whether to display charts interactively
+        batch_mode (bool): Close each chart as soon as it is saved (for many runs in one process)
+        save_charts (bool): Whether to also write the chart files to output/charts
+        vector_charts (bool): Render charts as SVG and embed them in the PDF as vector graphics
+        image_dpi (int): Resample raster charts to this DPI at their printed size before embedding
+        holdings_top_n (int): List only the largest N holdings in the PDF, rolling up the rest
+        profile (str): None, 'spans' to time each stage, network call and chart, or 'full'
+            to also capture cProfile and tracemalloc; written as JSON to output/profiles
+        snapshot (str): Portfolio name to keep run snapshots under (output/snapshots); the
+            run then only fetches the days since the last one and reports what changed
         
     Returns:
         tuple: (analyzer, visualizer, report_path)
     """
-    print("\n" + "="*70)
-    print(" "*20 + "PORTFOLIO ANALYZER")
-    print("="*70)
+    from portfolio_analyzer import PortfolioAnalyzer
+    from visualize_ import PortfolioVisualization
+    from PDF_generate_ import ReportGenerator, svg2rlg
+    from profiling import Profiler, default_profile_path, span
     
-    # Display what we're analyzing
-    display_portfolio(portfolio)
+    if profile not in (None, 'spans', 'full'):
+        raise ValueError(f"Unsupported profile mode: {profile}")
     
-    # Step 1: Run portfolio analysis
-    print("\n" + "="*70)
-    print("[STEP 1/4] RUNNING PORTFOLIO ANALYSIS")
-    print("="*70)
-    analyzer = PortfolioAnalyzer(portfolio, benchmark=benchmark)
-    analyzer.run_analysis()
+    profiler = None
+    if profile:
+        profiler = Profiler(cprofile=profile == 'full', memory=profile == 'full').start()
     
-    # Step 2: Create visualizations
-    print("\n" + "="*70)
-    print("[STEP 2/4] CREATING VISUALIZATIONS")
-    print("="*70)
-    visualizer = PortfolioVisualization()
-    visualizer.create_all_charts(analyzer)
-    
-    # Step 3: Generate PDF report
-    report_path = None
-    if generate_pdf:
+    try:
         print("\n" + "="*70)
-        print("[STEP 3/4] GENERATING PDF REPORT")
+        print(" "*20 + "PORTFOLIO ANALYZER")
         print("="*70)
-        report_gen = ReportGenerator()
-        report_path = report_gen.generate_report(analyzer)
-    else:
+        
+        # Display what we're analyzing
+        display_portfolio(portfolio)
+        
+        # Step 1: Run portfolio analysis
         print("\n" + "="*70)
-        print("[STEP 3/4] SKIPPING PDF GENERATION")
+        print("[STEP 1/4] RUNNING PORTFOLIO ANALYSIS")
         print("="*70)
-    
-    # Step 4: Display summary
-    print("\n" + "="*70)
-    print("[STEP 4/4] ANALYSIS COMPLETE!")
-    print("="*70)
-    
-    print("\n" + "="*70)
-    print("OUTPUT FILES")
-    print("="*70)
-    print(f"📊 Charts saved to:   stock_portfolio_performance_analyzer/output/charts/")
-    if report_path:
-        print(f"📄 Report saved to:   {report_path}")
-    print("="*70)
-    
-    # Optionally show charts
-    if show_charts:
-        print("\nDisplaying charts... (close chart windows to continue)")
-        visualizer.show_all()
+        with span('analysis'):
+            if snapshot is not None:
+                from run_snapshots import IncrementalAnalyzer
+                analyzer = IncrementalAnalyzer(portfolio, name=snapshot, benchmark=benchmark)
+            else:
+                analyzer = PortfolioAnalyzer(portfolio, benchmark=benchmark)
+            analyzer.run_analysis()
+        
+        # Step 2: Create visualizations
+        print("\n" + "="*70)
+        print("[STEP 2/4] CREATING VISUALIZATIONS")
+        print("="*70)
+        if vector_charts and svg2rlg is None:
+            print("⚠️  svglib is not installed, falling back to raster charts")
+            vector_charts = False
+        visualizer = PortfolioVisualization(output_directory='output/charts' if save_charts else None,
+                                            batch_mode=batch_mode and not show_charts,
+                                            keep_in_memory=generate_pdf or snapshot is not None,
+                                            chart_format='svg' if vector_charts else 'png')
+        with span('charts'):
+            charts = visualizer.create_all_charts(analyzer)
+        
+        # Step 3: Generate PDF report
+        report_path = None
+        if generate_pdf:
+            print("\n" + "="*70)
+            print("[STEP 3/4] GENERATING PDF REPORT")
+            print("="*70)
+            report_gen = ReportGenerator(target_dpi=image_dpi, holdings_top_n=holdings_top_n)
+            with span('report'):
+                report_path = report_gen.generate_report(analyzer, charts=charts)
+        else:
+            print("\n" + "="*70)
+            print("[STEP 3/4] SKIPPING PDF GENERATION")
+            print("="*70)
+        
+        # Step 4: Display summary
+        print("\n" + "="*70)
+        print("[STEP 4/4] ANALYSIS COMPLETE!")
+        print("="*70)
+        if snapshot is not None:
+            analyzer.save_snapshot(charts)
+        
+        print("\n" + "="*70)
+        print("OUTPUT FILES")
+        print("="*70)
+        if save_charts:
+            print(f"📊 Charts saved to:   stock_portfolio_performance_analyzer/output/charts/")
+        if report_path:
+            print(f"📄 Report saved to:   {report_path}")
+        print("="*70)
+        
+        # Optionally show charts
+        if show_charts:
+            print("\nDisplaying charts... (close chart windows to continue)")
+            visualizer.show_all()
+        
+        # Charts are rendered by now, release the figures
+        visualizer.close_all()
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.print_summary()
+            profile_path = profiler.write_json(default_profile_path('run'))
+            print(f"⏱️  Profile saved to:  {profile_path}")
     
     return analyzer, visualizer, report_path
 
@@ -332,11 +388,23 @@ def print_help():
     
     print("\n2. With CSV file:")
     print("   python main.py data/my_portfolio.csv")
+    print("   python main.py data/my_portfolio.csv --profile        (stage timings as JSON)")
+    print("   python main.py data/my_portfolio.csv --profile=full   (plus cProfile and memory)")
+    print("   python main.py data/my_portfolio.csv --snapshot       (extend the last run, report changes)")
     
     print("\n3. Quick demo:")
     print("   python main.py --demo")
     
-    print("\n4. Show this help:")
+    print("\n4. Batch (non-interactive, JSON summary on stdout):")
+    print("   python main.py batch data/portfolios/ --pdf --chart-profile compact")
+    print("   python main.py batch --help")
+    
+    print("\n5. Local HTTP/JSON service (keeps prices and results warm):")
+    print("   python main.py serve --port 8765")
+    print("   curl -X POST localhost:8765/analyze -d '{\"portfolio\": {\"AAPL\": {...}}}'")
+    print("   python main.py serve --help")
+    
+    print("\n6. Show this help:")
     print("   python main.py --help")
     
     print("\n" + "="*70)
@@ -355,6 +423,7 @@ def print_help():
     print("  📊 7 charts in stock_portfolio_performance_analyzer/output/charts/")
     print("  📄 PDF report in stock_portfolio_performance_analyzer/output/reports/")
     print("  📋 Console summary")
+    print("  🗂️  Run snapshots in stock_portfolio_performance_analyzer/output/snapshots/ (with --snapshot)")
     
     print("\n" + "="*70)
     print("REQUIREMENTS")
@@ -5,26 +5,94 @@ from scipy import stats
 import pandas as pd
 import numpy as np
 from datetime import datetime
+import io
 import os
+from profiling import span
 
 class PortfolioVisualization: 
     """Create visualizations for protfolio performance"""
 
-    def __init__(self, output_directory = 'output/charts'):
+    def __init__(self, output_directory = 'output/charts', batch_mode = False, max_figures = None,
+                 keep_in_memory = False, chart_format = 'png'):
         """
         Args:
-            output_directory (str): Directory to save visualization charts
+            output_directory (str): Directory to save visualization charts (None: no disk output)
+            batch_mode (bool): Close and release each figure as soon as it is saved
+            max_figures (int): Upper bound on figures kept open in memory (default: unbounded)
+            keep_in_memory (bool): Keep each saved chart as an in-memory buffer in self.charts
+            chart_format (str): 'png' for raster charts, 'svg' for vector charts
         """
-        # Get the directory where this file is located
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        # Create output path relative to the script directory
-        self.output_directory = os.path.join(script_dir, output_directory)
-        os.makedirs(self.output_directory, exist_ok = True) 
+        if chart_format not in ('png', 'svg'):
+            raise ValueError(f"Unsupported chart format: {chart_format}")
+
+        if output_directory is not None:
+            # Get the directory where this file is located
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            # Create output path relative to the script directory
+            self.output_directory = os.path.join(script_dir, output_directory)
+            os.makedirs(self.output_directory, exist_ok = True) 
+        else:
+            self.output_directory = None
+
+        self.batch_mode = batch_mode
+        self.max_figures = max_figures
+        self.keep_in_memory = keep_in_memory
+        self.chart_format = chart_format
 
         self.figures = {}
+        self.charts = {} # Rendered charts (chart name -> io.BytesIO)
+
+    def _finish_figure(self, fig, name, save):
+        """
+        Save a finished figure and decide whether to keep it in memory
+
+        The figure is rendered once; the bytes go to self.charts and/or to
+        the output directory. In batch mode the figure is closed right after
+        saving, so pyplot drops its reference and the memory can be reclaimed.
+        Otherwise the figure is kept in self.figures, evicting (and closing)
+        the oldest ones once max_figures is exceeded.
+
+        Args:
+            fig (matplotlib.figure.Figure): The figure to finish
+            name (str): Chart name, also used as the file name
+            save (bool): Whether to save the figure
+
+        Returns:
+            matplotlib.figure.Figure: The figure object
+        """
+        if save and (self.keep_in_memory or self.output_directory is not None):
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format = self.chart_format, dpi = 800, bbox_inches = 'tight')
+            buffer.seek(0)
+
+            if self.keep_in_memory:
+                self.charts[name] = buffer
+
+            if self.output_directory is not None:
+                filepath = os.path.join(self.output_directory, f'{name}.{self.chart_format}')
+                with open(filepath, 'wb') as f:
+                    f.write(buffer.getbuffer())
+                print(f"Saved: {filepath}")
+
+        if self.batch_mode:
+            plt.close(fig)
+            return fig
+
+        # Re-inserting moves the chart to the newest position
+        old_fig = self.figures.pop(name, None)
+        if old_fig is not None and old_fig is not fig:
+            plt.close(old_fig)
+        self.figures[name] = fig
+
+        if self.max_figures is not None:
+            while len(self.figures) > self.max_figures:
+                oldest = next(iter(self.figures))
+                plt.close(self.figures.pop(oldest))
+
+        return fig
 
     def plot_portfolio_value(self, portfolio_history, benchmark_data = None, 
-                             benchmark_label = 'S&P 500', save = True):
+                             benchmark_label = 'S&P 500', save = True, title = 'Portfolio Value Over Time'):
         """
         Plot portfolio value over time
 
@@ -33,6 +101,7 @@ class PortfolioVisualization:
             benchmark_data (pd.DataFrame): Benchmark data (optional)
             benchmark_name (str): Name of benchmark
             save (bool): Whether to save the figure
+            title (str): Chart title, e.g. naming the valuation basis
 
         Returns:
             matplotlib.figure.Figure: The figure object
@@ -52,7 +121,7 @@ class PortfolioVisualization:
                    color = '#A23B72', alpha = 0.7, linestyle = '--')
         
         # Set titles and labels
-        ax.set_title('Portfolio Value Over Time', fontsize = 16, fontweight = 'bold', pad = 20)
+        ax.set_title(title, fontsize = 16, fontweight = 'bold', pad = 20)
         ax.set_xlabel('Date', fontsize = 12)
         ax.set_ylabel('Portfolio Value ($)', fontsize = 12)
         ax.legend(fontsize = 11, loc = 'upper left')
@@ -66,13 +135,7 @@ class PortfolioVisualization:
         
         plt.tight_layout()
         
-        if save:
-            filepath = os.path.join(self.output_directory, 'portfolio_value.png')
-            plt.savefig(filepath, dpi = 800, bbox_inches = 'tight')
-            print(f"Saved: {filepath}")
-        
-        self.figures['portfolio_value'] = fig
-        return fig
+        return self._finish_figure(fig, 'portfolio_value', save)
     
     def plot_returns_distribution(self, returns, save=True):
         """
@@ -109,13 +172,7 @@ class PortfolioVisualization:
         ax2.grid(True, alpha = 0.3)
         plt.tight_layout()
         
-        if save:
-            filepath = os.path.join(self.output_directory, 'returns_distribution.png')
-            plt.savefig(filepath, dpi = 800, bbox_inches = 'tight')
-            print(f"Saved: {filepath}")
-        
-        self.figures['returns_distribution'] = fig
-        return fig
+        return self._finish_figure(fig, 'returns_distribution', save)
 
     def plot_drawdown(self, portfolio_history, save = True):
         """
@@ -163,13 +220,7 @@ class PortfolioVisualization:
         plt.xticks(rotation = 45, ha = 'right')
         plt.tight_layout()
         
-        if save:
-            filepath = os.path.join(self.output_directory, 'drawdown.png')
-            plt.savefig(filepath, dpi = 800, bbox_inches = 'tight')
-            print(f"Saved: {filepath}")
-        
-        self.figures['drawdown'] = fig
-        return fig
+        return self._finish_figure(fig, 'drawdown', save)
     
     def plot_allocation(self, holdings_performance, save = True):
         """
@@ -206,13 +257,7 @@ class PortfolioVisualization:
         
         plt.tight_layout()
 
-        if save:
-            filepath = os.path.join(self.output_directory, 'allocation.png')
-            plt.savefig(filepath, dpi = 800, bbox_inches = 'tight')
-            print(f"Saved: {filepath}")
-        
-        self.figures['allocation'] = fig
-        return fig
+        return self._finish_figure(fig, 'allocation', save)
     
     def plot_individual_performance(self, holdings_performance, save = True):
         """
@@ -246,13 +291,7 @@ class PortfolioVisualization:
         
         plt.tight_layout()
 
-        if save:
-            filepath = os.path.join(self.output_directory, 'individual_performance.png')
-            plt.savefig(filepath, dpi = 800, bbox_inches = 'tight')
-            print(f"Saved: {filepath}")
-        
-        self.figures['individual_performance'] = fig
-        return fig
+        return self._finish_figure(fig, 'individual_performance', save)
     
     def plot_risk_return_scatter(self, holdings_data, holdings_performance, save = True):
         """
@@ -314,15 +353,9 @@ class PortfolioVisualization:
                   title = 'Portfolio Weight', title_fontsize = 11)
         plt.tight_layout()
 
-        if save:
-            filepath = os.path.join(self.output_directory, 'risk_return.png')
-            plt.savefig(filepath, dpi = 800, bbox_inches = 'tight')
-            print(f"Saved: {filepath}")
+        return self._finish_figure(fig, 'risk_return', save)
 
-        self.figures['risk_return'] = fig
-        return fig
-
-    def plot_rolling_returns(self, portfolio_history, window = 30, save = True):
+    def plot_rolling_returns(self, portfolio_history, window = 30, save = True, returns = None):
         """
         Plot rolling returns
         
@@ -330,13 +363,15 @@ class PortfolioVisualization:
             portfolio_history (pd.Series): Portfolio value over time
             window (int): Rolling window in days
             save (bool): Whether to save the figure
+            returns (pd.Series): Returns of portfolio_history, if already computed
             
         Returns:
             matplotlib.figure.Figure: The figure object
         """
         fig, ax = plt.subplots(figsize = (12, 6))
 
-        returns = portfolio_history.pct_change().dropna()
+        if returns is None:
+            returns = portfolio_history.pct_change().dropna()
         rolling_returns = returns.rolling(window = window).mean() * 100  # Convert to percentage
 
         # Plot rolling returns with positive and negative areas
@@ -358,13 +393,7 @@ class PortfolioVisualization:
         plt.xticks(rotation = 45, ha = 'right')
         plt.tight_layout()
 
-        if save:
-            filepath = os.path.join(self.output_directory, 'rolling_returns.png')
-            plt.savefig(filepath, dpi = 800, bbox_inches = 'tight')
-            print(f"Saved: {filepath}")
-        
-        self.figures['rolling_returns'] = fig
-        return fig
+        return self._finish_figure(fig, 'rolling_returns', save)
     
     def create_all_charts(self, analyzer):
         """
@@ -372,31 +401,120 @@ class PortfolioVisualization:
         
         Args:
             analyzer (PortfolioAnalyzer): Portfolio analyzer object
+
+        Returns:
+            dict: Rendered charts (chart name -> io.BytesIO), empty unless keep_in_memory
         """
         
         # Retrieve data from analyzer
         portfolio_history = analyzer.portfolio_history
         benchmark_data = analyzer.benchmark_data
+        # Both cached on the analyzer, shared with the summary and the PDF report
         holdings_performance = analyzer.calculate_each_holding_performance()
-        
-        # Calculate returns
-        returns = portfolio_history.pct_change().dropna()
+        returns = analyzer.metric('returns')
         
         # Create all charts
-        self.plot_portfolio_value(portfolio_history, benchmark_data)
-        self.plot_returns_distribution(returns)
-        self.plot_drawdown(portfolio_history)
-        self.plot_allocation(holdings_performance)
-        self.plot_individual_performance(holdings_performance)
-        self.plot_risk_return_scatter(analyzer.holdings_data, holdings_performance)
-        self.plot_rolling_returns(portfolio_history)
-        
-        print(f"\n All charts created and saved to: {self.output_directory}")
+        with span('chart', chart = 'portfolio_value'):
+            self.plot_portfolio_value(portfolio_history, benchmark_data,
+                                      title = f"Portfolio Value Over Time ({analyzer.return_basis()})")
+        with span('chart', chart = 'returns_distribution'):
+            self.plot_returns_distribution(returns)
+        with span('chart', chart = 'drawdown'):
+            self.plot_drawdown(portfolio_history)
+        with span('chart', chart = 'allocation'):
+            self.plot_allocation(holdings_performance)
+        with span('chart', chart = 'individual_performance'):
+            self.plot_individual_performance(holdings_performance)
+        with span('chart', chart = 'risk_return'):
+            self.plot_risk_return_scatter(analyzer.holdings_data, holdings_performance)
+        with span('chart', chart = 'rolling_returns'):
+            self.plot_rolling_returns(portfolio_history, returns = returns)
+        
+        if self.output_directory is not None:
+            print(f"\n All charts created and saved to: {self.output_directory}")
+        else:
+            print(f"\n All charts created in memory")
+        return self.charts
     
     def show_all(self):
         """Display all created figures"""
         plt.show()
     
     def close_all(self):
-        """Close all figure windows"""
-        plt.close('all')
+        """Close all figure windows and release the stored figures"""
+        for fig in self.figures.values():
+            plt.close(fig)
+        self.figures.clear()
+
+
+if __name__ == "__main__":
+    # Memory regression check: run the whole batch pipeline many times in one
+    # process (analysis, charts saved to disk and memory in batch mode, PDF
+    # report) and make sure no figures stay open and the resident memory is flat.
+    # Usage: python visualize_.py [reports (default 1000)] [png|svg (default svg,
+    # about 5 s a report; 800-dpi PNGs take ten times longer)]
+    import contextlib
+    import gc
+    import sys
+    import shutil
+    import tempfile
+    import resource
+    import matplotlib
+    matplotlib.use('Agg')
+    from market_data import SyntheticMarket, SyntheticDataFetcher
+    from portfolio_analyzer import PortfolioAnalyzer
+    from PDF_generate_ import ReportGenerator
+
+    n_reports = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    chart_format = sys.argv[2] if len(sys.argv) > 2 else 'svg'
+    warm_up = min(10, n_reports - 1)
+
+    market = SyntheticMarket(n_tickers = 8, years = 2, end = '2024-12-31', seed = 42)
+    fetcher = SyntheticDataFetcher(market)
+    portfolio = {ticker: {'shares': 10.0 * (i + 1), 'purchase_price': 50.0, 'purchase_date': '2023-03-01'}
+                 for i, ticker in enumerate(market.tickers)}
+    output_dir = tempfile.mkdtemp(prefix = 'visualize_check_')
+
+    def rss_mb():
+        # Current resident set size once garbage is collected; the peak (ru_maxrss,
+        # in kilobytes) where /proc is missing
+        gc.collect()
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024**2
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    samples = []
+    try:
+        for i in range(n_reports):
+            with contextlib.redirect_stdout(io.StringIO()):
+                analyzer = PortfolioAnalyzer(portfolio, fetcher = fetcher)
+                analyzer.run_analysis()
+                visualizer = PortfolioVisualization(output_directory = os.path.join(output_dir, 'charts'),
+                                                    batch_mode = True, keep_in_memory = True,
+                                                    chart_format = chart_format)
+                charts = visualizer.create_all_charts(analyzer)
+                ReportGenerator(output_dir = os.path.join(output_dir, 'reports')).generate_report(
+                    analyzer, charts = charts, filename = 'report.pdf')
+
+            if plt.get_fignums() or visualizer.figures:
+                print(f"FAILED: {len(plt.get_fignums())} figures left open after report {i + 1}")
+                sys.exit(1)
+            # Sample after a warm-up so caches (fonts, tickers) are filled
+            if i >= warm_up:
+                samples.append(rss_mb())
+    finally:
+        shutil.rmtree(output_dir, ignore_errors = True)
+
+    # Lowest memory over the first and last tenth of the run, so a transient peak does not count
+    window = max(1, len(samples) // 10)
+    growth = min(samples[-window:]) - min(samples[:window]) if samples else 0.0
+    print(f"Rendered {n_reports} reports ({n_reports * 7} {chart_format} charts saved, {n_reports} PDFs)")
+    print(f"Open figures: {len(plt.get_fignums())}, stored figures: {len(visualizer.figures)}")
+    print(f"Memory growth after warm-up: {growth:.2f} MB")
+
+    if growth > 10:
+        print("FAILED: memory grows from report to report")
+        sys.exit(1)
+    print("OK")